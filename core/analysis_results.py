@@ -0,0 +1,69 @@
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+@dataclass
+class GraphRelationship:
+    source: str
+    target: str
+    type: str = 'Risk'  # "Protective" | "Risk" | "Treats"
+    description: str = ''
+
+@dataclass
+class GraphData:
+    """
+    Knowledge Graph input (same shape as extract_extended_graph_data_gemini's JSON).
+    """
+    patient_name: str = 'Patient'
+    date: str = 'Unknown'
+    diagnosis: List[str] = field(default_factory=list)
+    drugs: List[str] = field(default_factory=list)
+    relationships: List[GraphRelationship] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data:
+            return None
+        if isinstance(data, cls):
+            return data
+        relationships = []
+        for r in data.get('relationships') or []:
+            if isinstance(r, dict) and r.get('source') and r.get('target'):
+                relationships.append(GraphRelationship(
+                    str(r['source']), str(r['target']), str(r.get('type', 'Risk')), str(r.get('description', ''))))
+        return cls(
+            patient_name=str(data.get('patient_name') or 'Patient'),
+            date=str(data.get('date') or 'Unknown'),
+            diagnosis=[str(d) for d in data.get('diagnosis') or []],
+            drugs=[str(d) for d in data.get('drugs') or []],
+            relationships=relationships
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+@dataclass
+class PrescriptionAnalysis:
+    """
+    Everything the LLM stages produce for one prescription: the readable analysis,
+    the generic names and the Knowledge Graph data.
+    """
+    analysis_text: str = ''
+    generics: List[str] = field(default_factory=list)
+    graph: Optional[GraphData] = None
+    model: Optional[str] = None
+
+    @classmethod
+    def from_dict(cls, data, model=None):
+        generics = []
+        for g in data.get('generics') or []:
+            g = str(g).strip()
+            if g and g not in generics: generics.append(g)
+        return cls(
+            analysis_text=str(data.get('analysis_text') or ''),
+            generics=generics,
+            graph=GraphData.from_dict(data.get('graph')),
+            model=model
+        )
+
+    def to_dict(self):
+        return asdict(self)
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from core import gemini_client
+from core import tracing
+from core.puter_client import PuterSession, OCR_MODEL
+from core.rate_limiter import limiter, INTERACTIVE, BATCH
+from core.image_preprocess import preprocessor
+from core.drug_client import check_interactions
+
+# Prescriptions analyzed at the same time by one session
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", "16"))
+# Threads for the blocking clients (Gemini SDK, RxNav over requests, local DB)
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "32"))
+# Batch analyses hold back while the rate limiter is this many seconds behind
+ASYNC_MAX_BACKLOG = float(os.getenv("ASYNC_MAX_BACKLOG", "30"))
+
+class AsyncAnalysisSession:
+    """
+    asyncio API for services and batch runners. One session shares one event loop,
+    one PuterSession (a single login and aiohttp session for every OCR upload, with
+    the same token refresh as the synchronous path) and one bounded thread pool for
+    the blocking clients, so dozens of prescriptions can be in flight from a single
+    process:
+
+        async with AsyncAnalysisSession() as session:
+            results = await session.analyze_many([("rx1.jpg", details1), "rx2.jpg"])
+    """
+    def __init__(self, max_in_flight=ASYNC_MAX_IN_FLIGHT, workers=ASYNC_WORKERS, username=None, password=None):
+        self.username = username or os.getenv("PUTER_USERNAME")
+        self.password = password or os.getenv("PUTER_PASSWORD")
+        self.max_in_flight = max_in_flight
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-analysis")
+        self._puter = PuterSession(self.username, self.password)
+        self._slots = None
+
+    async def __aenter__(self):
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await self.run_blocking(self._puter.close)
+        self._pool.shutdown(wait=False)
+
+    async def run_blocking(self, fn, *args, **kwargs):
+        """Awaits a blocking call on the session's thread pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    async def ocr(self, image_path, trace=None, priority=INTERACTIVE):
+        """Pre-processes and OCRs one image; returns the text or an "Error ..." string."""
+        if not self.username or not self.password:
+            return "Error: PUTER_USERNAME or PUTER_PASSWORD not found in environment variables."
+        if not os.path.exists(image_path):
+            return f"Error: Image file not found at {image_path}"
+
+        start = time.time()
+        processed = await self.run_blocking(preprocessor.process, image_path)
+        if trace: trace.record('preprocess', start, time.time())
+
+        start = time.time()
+        try:
+            await self.run_blocking(limiter.acquire, OCR_MODEL, priority=priority)
+            # Logs in once; an expired token is refreshed by the PuterSession
+            text = await self._puter.ocr_async(processed.path)
+        except Exception as e:
+            text = f"Error using AI OCR: {str(e)}"
+        preprocessor.record_ocr(time.time() - start, processed.path != processed.source_path)
+        if trace:
+            trace.record('ocr', start, time.time(), model=OCR_MODEL,
+                         prompt_chars=processed.processed_bytes, response_chars=len(text or ""))
+        return text
+
+    async def check_interactions(self, drug_names, deadline=None):
+        return await self.run_blocking(check_interactions, drug_names, deadline=deadline)
+
+    async def analyze(self, image_path, patient_details=None, priority=INTERACTIVE, **pipeline_kwargs):
+        """
+        Same result dict as run_analysis_pipeline. OCR runs natively on the event loop;
+        the gate, enhancement, LLM stages and lookups run on the session's thread pool.
+        Batch-priority analyses wait while the rate limiter queues are backed up.
+        """
+        async with self._slots:
+            while priority >= BATCH and limiter.backpressure() > ASYNC_MAX_BACKLOG:
+                await asyncio.sleep(1.0)
+            trace = tracing.Trace()
+            text = await self.ocr(image_path, trace, priority)
+            if not text or "Error" in text:
+                return {'text': f"OCR Failed: {text}", 'drugs': [], 'analysis': None, 'graph_data': None,
+                        'timings': {}, 'spans': trace.to_list()}
+            return await self.run_blocking(gemini_client.run_analysis_pipeline, image_path, patient_details,
+                                           ocr_text=text, trace=trace, priority=priority, **pipeline_kwargs)
+
+    async def analyze_many(self, items, priority=BATCH, **pipeline_kwargs):
+        """
+        Analyzes image paths or (image_path, patient_details) pairs concurrently
+        (at most max_in_flight at a time, batch priority by default); results are
+        returned in input order.
+        """
+        jobs = [(item, None) if isinstance(item, str) else tuple(item) for item in items]
+        return await asyncio.gather(*(self.analyze(path, details, priority, **pipeline_kwargs) for path, details in jobs))
+
+async def analyze_prescription_async(image_path, patient_details=None, session=None, **pipeline_kwargs):
+    """
+    Async counterpart of run_analysis_pipeline. Pass a long-lived AsyncAnalysisSession
+    to share its Puter session, HTTP session and thread pool between calls.
+    """
+    if session is not None:
+        return await session.analyze(image_path, patient_details, **pipeline_kwargs)
+    async with AsyncAnalysisSession() as own_session:
+        return await own_session.analyze(image_path, patient_details, **pipeline_kwargs)
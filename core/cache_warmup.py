@@ -0,0 +1,123 @@
+import re
+import time
+import logging
+import sqlite3
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from core.local_data import db
+from core.ddi_cache import ddi_cache
+from core import database
+from core import drug_client
+from core.rxnav_client import RxNavError, CircuitBreaker, client as rxnav
+
+logger = logging.getLogger(__name__)
+
+# Drug names as they appear in saved reports
+HISTORY_PATTERNS = [
+    re.compile(r"\[Generic: (.+?)\]"),
+    re.compile(r"Local Data for (.+?):"),
+    re.compile(r"mapped to '(.+?)'"),
+]
+
+def _history_counts():
+    counts = Counter()
+    try:
+        conn = database.get_db_connection()
+        rows = conn.execute("SELECT result_text FROM analyses").fetchall()
+        conn.close()
+    except sqlite3.Error:
+        return counts
+    for row in rows:
+        for pattern in HISTORY_PATTERNS:
+            for name in pattern.findall(row['result_text'] or ""):
+                for term in drug_client.split_ingredients(name):
+                    counts[term.strip().lower()] += 1
+    return counts
+
+def _dataset_counts():
+    # The number of brands sold for a generic is a good proxy for how common it is
+    db.load_data()
+    counts = Counter()
+    for entry in db.drug_map.values():
+        if entry.get('source') == 'DrugBank':
+            continue
+        for term in drug_client.split_ingredients(entry.get('generic_name', '')):
+            counts[term.lower()] += 1
+    return counts
+
+def top_generics(n=200):
+    """
+    The N most common generic ingredients: names from the local analysis history first,
+    topped up by brand frequency in the local datasets.
+    """
+    names = []
+    for counts in (_history_counts(), _dataset_counts()):
+        for name, _ in counts.most_common():
+            if len(name) >= 3 and name not in names:
+                names.append(name)
+            if len(names) >= n:
+                return names
+    return names
+
+def _rxnav_failing():
+    # Warm-up shares the breaker with user analyses: back off at the first failure
+    # instead of pushing it open
+    return rxnav.breaker.state != CircuitBreaker.CLOSED or rxnav.breaker.failures > 0
+
+def warm_up(n=200, max_workers=8, chunk_size=40, names=None):
+    """
+    Fills the persistent DDI cache (resolutions, RxCUIs and all pairwise interactions)
+    for the top-N generics. Safe to re-run; returns a stats dict. Does nothing while
+    the cache is disabled and stops as soon as RxNav calls start failing.
+    """
+    start = time.time()
+    stats = {'drugs': 0, 'rxcuis': 0, 'pairs': 0, 'errors': 0, 'stopped': False}
+    if not ddi_cache.enabled:
+        logger.info("DDI cache disabled, skipping warm-up")
+        return stats
+    names = names or top_generics(n)
+    stats['drugs'] = len(names)
+    if not names:
+        return stats
+
+    def _resolve(name):
+        if stats['stopped'] or _rxnav_failing():
+            stats['stopped'] = True
+            return None
+        try:
+            mapping = drug_client.resolve_drug(name)
+        except Exception as e:
+            logger.warning(f"Warm-up could not resolve {name}: {e}")
+            return None
+        if mapping.lookup_error:
+            stats['stopped'] = True
+        return mapping
+
+    # The first name doubles as a probe, so an offline start costs one failed lookup
+    mappings = [m for m in [_resolve(names[0])] if m]
+    if not stats['stopped']:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            mappings += [m for m in pool.map(_resolve, names[1:]) if m]
+
+    cuis = []
+    for m in mappings:
+        if m.lookup_error:
+            stats['errors'] += 1
+        cuis.extend(m.rxcuis)
+    cuis = list(dict.fromkeys(cuis))
+    stats['rxcuis'] = len(cuis)
+
+    if stats['stopped']:
+        logger.warning("Warm-up stopped: RxNav lookups are failing")
+    else:
+        try:
+            stats['pairs'] = drug_client.warm_pairs(cuis, chunk_size=chunk_size)
+        except RxNavError as e:
+            logger.warning(f"Warm-up stopped while fetching interactions: {e}")
+            stats['errors'] += 1
+            stats['stopped'] = True
+
+    stats['seconds'] = round(time.time() - start, 2)
+    logger.info(f"DDI cache warm-up: {stats}")
+    return stats
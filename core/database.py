@@ -1,5 +1,6 @@
 import sqlite3
 import os
+import json
 import datetime
 
 DB_NAME = "rx_shield.db"
@@ -47,6 +48,45 @@ def init_db():
         # Columns already exist
         pass
     
+    # Per-stage spans of each analysis (time, model, sizes, tokens, cache hits)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analysis_spans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER,
+            stage TEXT NOT NULL,
+            start_offset REAL,
+            duration REAL,
+            model TEXT,
+            prompt_chars INTEGER DEFAULT 0,
+            response_chars INTEGER DEFAULT 0,
+            prompt_tokens INTEGER DEFAULT 0,
+            output_tokens INTEGER DEFAULT 0,
+            llm_calls INTEGER DEFAULT 0,
+            cache_hits INTEGER DEFAULT 0,
+            error TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (analysis_id) REFERENCES analyses(id)
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_spans_analysis ON analysis_spans(analysis_id)")
+    
+    # Perceptual hashes of analyzed images (near-duplicate re-uploads reuse the analysis).
+    # The 64-bit hash is also split into four indexed 16-bit bands for the Hamming lookup.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_hashes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            analysis_id INTEGER,
+            image_hash TEXT NOT NULL,
+            band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+            patient_key TEXT NOT NULL,
+            result_json TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (analysis_id) REFERENCES analyses(id)
+        )
+    ''')
+    for i in range(4):
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_image_hashes_band{i} ON image_hashes(band{i})")
+    
     # Login logs table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS login_logs (
@@ -156,6 +196,143 @@ def save_analysis(username, image_path, result_text):
     finally:
         conn.close()
 
+def save_analysis_spans(analysis_id, spans):
+    """Stores the stage spans (core.tracing.Trace.to_list()) of one analysis."""
+    if not spans:
+        return
+    conn = get_db_connection()
+    try:
+        conn.executemany('''
+            INSERT INTO analysis_spans (analysis_id, stage, start_offset, duration, model, prompt_chars,
+                response_chars, prompt_tokens, output_tokens, llm_calls, cache_hits, error)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(analysis_id, s['name'], s.get('offset'), s.get('duration'), s.get('model'), s.get('prompt_chars', 0),
+               s.get('response_chars', 0), s.get('prompt_tokens', 0), s.get('output_tokens', 0),
+               s.get('llm_calls', 0), s.get('cache_hits', 0), s.get('error')) for s in spans])
+        conn.commit()
+    except Exception as e:
+        print(f"Error saving analysis spans: {e}")
+    finally:
+        conn.close()
+
+def get_analysis_spans(analysis_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT * FROM analysis_spans WHERE analysis_id = ? ORDER BY start_offset', (analysis_id,))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+def save_image_hash(analysis_id, image_hash, patient_details, result=None):
+    """
+    Indexes the perceptual hash (core.image_hash.dhash) of an analyzed image.
+    result: JSON-serializable extras to restore on reuse (drugs, structured analysis,
+    and the raw OCR text used to confirm a match).
+    """
+    from core.image_hash import bands, patient_key
+    conn = get_db_connection()
+    try:
+        conn.execute('''
+            INSERT INTO image_hashes (analysis_id, image_hash, band0, band1, band2, band3, patient_key, result_json)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (analysis_id, f"{image_hash:016x}", *bands(image_hash), patient_key(patient_details),
+              json.dumps(result) if result is not None else None))
+        conn.commit()
+    except Exception as e:
+        print(f"Error saving image hash: {e}")
+    finally:
+        conn.close()
+
+def find_similar_analysis(image_hash, patient_details, max_distance=None):
+    """
+    The most recent stored analysis of a near-duplicate image (Hamming distance
+    <= max_distance, at most HASH_BANDS - 1) for the same patient details, or None.
+    Returns a dict with analysis_id, image_path, result_text, result (decoded
+    result_json), timestamp and distance. A match only means a similar page layout;
+    confirm it with core.image_hash.same_content before reusing it.
+    """
+    from core.image_hash import bands, hamming, patient_key, IMAGE_DEDUPE_MAX_DISTANCE, HASH_BANDS
+    if max_distance is None:
+        max_distance = IMAGE_DEDUPE_MAX_DISTANCE
+    # The band lookup is only exhaustive below HASH_BANDS differing bits
+    max_distance = min(max_distance, HASH_BANDS - 1)
+    conn = get_db_connection()
+    try:
+        # Candidates share at least one exact band (pigeonhole for distances up to 3)
+        rows = conn.execute('''
+            SELECT h.analysis_id, h.image_hash, h.result_json, h.timestamp, a.image_path, a.result_text
+            FROM image_hashes h JOIN analyses a ON a.id = h.analysis_id
+            WHERE h.patient_key = ? AND (h.band0 = ? OR h.band1 = ? OR h.band2 = ? OR h.band3 = ?)
+            ORDER BY h.id DESC
+        ''', (patient_key(patient_details), *bands(image_hash))).fetchall()
+    except Exception as e:
+        print(f"Error looking up image hash: {e}")
+        return None
+    finally:
+        conn.close()
+
+    for row in rows:
+        distance = hamming(int(row['image_hash'], 16), image_hash)
+        if distance <= max_distance:
+            return {
+                'analysis_id': row['analysis_id'],
+                'image_path': row['image_path'],
+                'result_text': row['result_text'],
+                'result': json.loads(row['result_json']) if row['result_json'] else {},
+                'timestamp': row['timestamp'],
+                'distance': distance,
+            }
+    return None
+
+def get_stage_summary(last_analyses=50):
+    """
+    Per stage over the most recent analyses: count, average and p95 duration, total
+    tokens and LLM cache hit rate. Returns a list of dicts ordered by average duration.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            SELECT stage, duration, prompt_tokens, output_tokens, llm_calls, cache_hits, error FROM analysis_spans
+            WHERE analysis_id IN (SELECT DISTINCT analysis_id FROM analysis_spans ORDER BY analysis_id DESC LIMIT ?)
+        ''', (last_analyses,))
+        rows = cursor.fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+
+    by_stage = {}
+    for r in rows:
+        by_stage.setdefault(r['stage'], []).append(r)
+    summary = []
+    for stage, items in by_stage.items():
+        durations = sorted(r['duration'] or 0 for r in items)
+        llm_calls = sum(r['llm_calls'] for r in items)
+        summary.append({
+            'stage': stage,
+            'count': len(items),
+            'avg': sum(durations) / len(durations),
+            'p95': durations[min(len(durations) - 1, int(0.95 * len(durations)))],
+            'prompt_tokens': sum(r['prompt_tokens'] for r in items),
+            'output_tokens': sum(r['output_tokens'] for r in items),
+            'cache_hit_rate': sum(r['cache_hits'] for r in items) / llm_calls if llm_calls else None,
+            'errors': sum(1 for r in items if r['error']),
+        })
+    summary.sort(key=lambda s: -s['avg'])
+    return summary
+
+def format_stage_summary(last_analyses=50):
+    summary = get_stage_summary(last_analyses)
+    if not summary:
+        return "No instrumented analyses yet."
+    lines = [f"{'Stage':<14}{'Runs':>6}{'Avg':>9}{'p95':>9}{'Tokens in/out':>18}{'Cache':>8}"]
+    for s in summary:
+        cache = f"{s['cache_hit_rate'] * 100:.0f}%" if s['cache_hit_rate'] is not None else "-"
+        tokens = f"{s['prompt_tokens']}/{s['output_tokens']}"
+        lines.append(f"{s['stage']:<14}{s['count']:>6}{s['avg']:>8.2f}s{s['p95']:>8.2f}s{tokens:>18}{cache:>8}")
+    return "\n".join(lines)
+
 def approve_analysis(analysis_id, doctor_name):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -0,0 +1,166 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from dataclasses import asdict
+
+from core.ddi_results import InteractionPair
+
+logger = logging.getLogger(__name__)
+
+DDI_CACHE_DB = os.getenv("DDI_CACHE_DB", "ddi_cache.db")
+# Entries older than this are refetched so interaction data does not go stale
+DDI_CACHE_TTL = float(os.getenv("DDI_CACHE_TTL_DAYS", "30")) * 86400
+# "RxNav knows no such name" may come from a typo or a bad moment; retry it much sooner
+DDI_CACHE_NEGATIVE_TTL = float(os.getenv("DDI_CACHE_NEGATIVE_TTL_HOURS", "6")) * 3600
+
+class DDICache:
+    """
+    Persistent (SQLite) cache for the DDI path: local name resolutions, name -> RxCUI
+    and RxCUI pair -> interactions. Survives restarts and can be pre-warmed
+    (tools/warm_cache.py) so a fresh install does not start cold. Entries expire after
+    `ttl` seconds; unknown-name (negative) RxCUI entries after `negative_ttl`.
+    """
+    def __init__(self, path=DDI_CACHE_DB, enabled=None, ttl=DDI_CACHE_TTL, negative_ttl=DDI_CACHE_NEGATIVE_TTL):
+        self.path = path
+        self.enabled = enabled if enabled is not None else os.getenv("DDI_CACHE", "1") != "0"
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    self._init_schema(conn)
+                    self._initialized = True
+        return conn
+
+    def _init_schema(self, conn):
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS resolution_cache (
+                query TEXT PRIMARY KEY,
+                resolved_name TEXT NOT NULL,
+                confidence INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rxcui_cache (
+                name TEXT PRIMARY KEY,
+                rxcui TEXT,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS pair_cache (
+                cui_a TEXT NOT NULL,
+                cui_b TEXT NOT NULL,
+                interactions TEXT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (cui_a, cui_b)
+            )
+        ''')
+        conn.commit()
+
+    def _safe(self, fn, default=None):
+        # The cache must never break an analysis
+        if not self.enabled:
+            return default
+        try:
+            return fn(self._conn())
+        except sqlite3.Error as e:
+            logger.warning(f"DDI cache error: {e}")
+            return default
+
+    @staticmethod
+    def _since(ttl):
+        # SQLite datetime() modifier for "ttl seconds ago" (updated_at is UTC)
+        return f"-{int(ttl)} seconds"
+
+    # --- Local name resolution ---
+    def get_resolution(self, query):
+        """Returns (resolved_name, confidence) or None."""
+        row = self._safe(lambda c: c.execute(
+            "SELECT resolved_name, confidence FROM resolution_cache "
+            "WHERE query = ? AND updated_at >= datetime('now', ?)", (query.lower(), self._since(self.ttl))).fetchone())
+        return (row[0], row[1]) if row else None
+
+    def set_resolution(self, query, resolved_name, confidence):
+        def _set(c):
+            c.execute("INSERT OR REPLACE INTO resolution_cache (query, resolved_name, confidence) VALUES (?, ?, ?)",
+                      (query.lower(), resolved_name, int(confidence)))
+            c.commit()
+        self._safe(_set)
+
+    # --- Name -> RxCUI ---
+    def get_rxcui(self, name):
+        """Returns (hit, rxcui). A hit with rxcui None means RxNav knows no such name."""
+        row = self._safe(lambda c: c.execute(
+            "SELECT rxcui, updated_at >= datetime('now', ?), updated_at >= datetime('now', ?) "
+            "FROM rxcui_cache WHERE name = ?",
+            (self._since(self.ttl), self._since(self.negative_ttl), name)).fetchone())
+        if not row:
+            return False, None
+        rxcui, fresh, fresh_negative = row
+        if not (fresh if rxcui else fresh_negative):
+            return False, None
+        return True, rxcui or None
+
+    def set_rxcui(self, name, rxcui):
+        def _set(c):
+            c.execute("INSERT OR REPLACE INTO rxcui_cache (name, rxcui) VALUES (?, ?)", (name, rxcui or ''))
+            c.commit()
+        self._safe(_set)
+
+    # --- RxCUI pair -> interactions ---
+    def get_pair(self, cui_a, cui_b):
+        """Returns a list of InteractionPair, or None if the pair was never checked."""
+        a, b = sorted((cui_a, cui_b))
+        row = self._safe(lambda c: c.execute(
+            "SELECT interactions FROM pair_cache WHERE cui_a = ? AND cui_b = ? AND updated_at >= datetime('now', ?)",
+            (a, b, self._since(self.ttl))).fetchone())
+        if not row:
+            return None
+        return [InteractionPair(**item) for item in json.loads(row[0])]
+
+    def set_pairs(self, items):
+        """Stores many {(cui_a, cui_b): [InteractionPair, ...]} entries in one transaction."""
+        rows = []
+        for (cui_a, cui_b), pairs in items.items():
+            a, b = sorted((cui_a, cui_b))
+            rows.append((a, b, json.dumps([asdict(p) for p in pairs])))
+        def _set(c):
+            c.executemany("INSERT OR REPLACE INTO pair_cache (cui_a, cui_b, interactions) VALUES (?, ?, ?)", rows)
+            c.commit()
+        self._safe(_set)
+
+    def set_pair(self, cui_a, cui_b, pairs):
+        self.set_pairs({(cui_a, cui_b): pairs})
+
+    def stats(self):
+        def _stats(c):
+            return {t: c.execute(f"SELECT count(*) FROM {t}").fetchone()[0]
+                    for t in ('resolution_cache', 'rxcui_cache', 'pair_cache')}
+        return self._safe(_stats, default={})
+
+    def is_empty(self):
+        """True for an enabled cache with nothing stored yet (a disabled cache has nothing to fill)."""
+        return self.enabled and not any(self.stats().values())
+
+    def clear(self):
+        def _clear(c):
+            for t in ('resolution_cache', 'rxcui_cache', 'pair_cache'):
+                c.execute(f"DELETE FROM {t}")
+            c.commit()
+        self._safe(_clear)
+
+# Global instance
+ddi_cache = DDICache()
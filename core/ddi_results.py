@@ -0,0 +1,184 @@
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+@dataclass
+class DrugMapping:
+    """
+    One input drug name and what it resolved to (local DB + RxNav).
+    """
+    name: str
+    display_name: str
+    resolved_name: str
+    confidence: int = 0
+    rxcuis: List[str] = field(default_factory=list)
+    mapping: Optional[str] = None  # "• Correction: ..." line, if the name was corrected
+    lookup_error: Optional[str] = None  # Set when RxNav was unavailable for this drug
+
+    @property
+    def found(self):
+        return bool(self.rxcuis)
+
+    @property
+    def label(self):
+        """Short name for graphs/tables: the resolved generic without dosage info."""
+        name = self.resolved_name or self.name
+        return name.split('(')[0].strip() or self.name
+
+# Severity vocabulary of the RxNav sources: ONCHigh rates pairs "high", DrugBank
+# leaves every pair unrated ("N/A")
+MAJOR_SEVERITIES = {'high', 'major', 'severe', 'serious', 'contraindicated'}
+UNCLASSIFIED_SEVERITIES = {'', 'n/a', 'na', 'unknown', 'none'}
+
+@dataclass
+class InteractionPair:
+    drug1: str
+    drug2: str
+    severity: str = 'N/A'
+    description: str = 'No description available.'
+    source: str = 'NLM RxNav'
+    rxcui1: Optional[str] = None
+    rxcui2: Optional[str] = None
+
+    @property
+    def is_major(self):
+        return str(self.severity or '').strip().lower() in MAJOR_SEVERITIES
+
+    @property
+    def is_unclassified(self):
+        """The source lists the pair but does not rate it, so it may well be major."""
+        return str(self.severity or '').strip().lower() in UNCLASSIFIED_SEVERITIES
+
+@dataclass
+class DDIResult:
+    """
+    Structured output of the DDI engine. Text is only rendered on demand via to_text().
+    """
+    drugs: List[DrugMapping] = field(default_factory=list)
+    interactions: List[InteractionPair] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def found_drugs(self):
+        return [d for d in self.drugs if d.found]
+
+    @property
+    def mappings(self):
+        return [d.mapping for d in self.drugs if d.mapping]
+
+    @property
+    def rxcuis(self):
+        cuis = []
+        for d in self.found_drugs:
+            for cui in d.rxcuis:
+                if cui not in cuis: cuis.append(cui)
+        return cuis
+
+    @property
+    def checked(self):
+        """True if there were enough drugs to query interactions."""
+        return len(self.rxcuis) >= 2
+
+    def to_text(self):
+        """
+        Renders the human-readable report (same format as the original string report).
+        """
+        found_drugs = [d.display_name for d in self.found_drugs]
+        mappings = self.mappings
+
+        if not self.checked:
+            msg = f"Found {len(found_drugs)} identifiable drugs ({', '.join(found_drugs)}). Need at least two to check for interactions."
+            if mappings:
+                msg += "\n\n" + "\n".join(mappings)
+            errors = [d for d in self.drugs if d.lookup_error]
+            if errors:
+                msg += f"\n\n(RxNav unavailable for: {', '.join(d.name for d in errors)} - {errors[0].lookup_error})"
+            return msg
+
+        report = []
+        report.append("--- Identified Drugs (Official) ---")
+        report.append(", ".join(found_drugs))
+
+        if mappings:
+            report.append("\n--- Auto-Corrections & Mappings ---")
+            report.extend(mappings)
+
+        report.append("\n--- Interaction Report (NLM RxNav) ---")
+
+        if self.error:
+            report.append(f"Error checking interactions: {self.error}")
+        elif self.interactions:
+            for pair in self.interactions:
+                report.append(f"• [SEVERITY: {pair.severity}] {pair.drug1} + {pair.drug2}")
+                report.append(f"  Warning: {pair.description}\n")
+        else:
+            report.append("No official interactions found between these drugs.")
+
+        return "\n".join(report)
+
+    def __str__(self):
+        return self.to_text()
+
+    def to_dict(self):
+        return asdict(self)
+
+    def to_graph_data(self, patient_name='Patient'):
+        """
+        Returns graph data in the same shape as extract_extended_graph_data_gemini,
+        so the Knowledge Graph can be built without another LLM call.
+        """
+        by_cui = {}
+        for d in self.found_drugs:
+            for cui in d.rxcuis:
+                by_cui.setdefault(cui, d.label)
+
+        drugs = []
+        for d in self.found_drugs:
+            if d.label not in drugs: drugs.append(d.label)
+
+        relationships = []
+        for pair in self.interactions:
+            relationships.append({
+                'source': by_cui.get(pair.rxcui1, pair.drug1),
+                'target': by_cui.get(pair.rxcui2, pair.drug2),
+                'type': 'Risk',
+                'description': f"{pair.severity} interaction" if pair.severity != 'N/A' else "Interaction"
+            })
+
+        return {
+            'patient_name': patient_name,
+            'date': 'Unknown',
+            'diagnosis': [],
+            'drugs': drugs,
+            'relationships': relationships
+        }
+
+    def merge_graph_data(self, data, patient_name='Patient'):
+        """
+        Adds the interactions as Risk edges to graph data from another source (the
+        Gemini graph with the diagnosis and Treats/Protective edges), keeping its
+        patient, diagnosis and edges. Without data, returns to_graph_data(patient_name).
+        """
+        own = self.to_graph_data(patient_name)
+        if not data:
+            return own
+
+        drugs = list(data.get('drugs', []))
+        names = {d.lower(): d for d in drugs}
+        for d in own['drugs']:
+            if d.lower() not in names:
+                drugs.append(d)
+                names[d.lower()] = d
+
+        relationships = list(data.get('relationships', []))
+        risks = {frozenset((str(r.get('source')).lower(), str(r.get('target')).lower()))
+                 for r in relationships if r.get('type') == 'Risk'}
+        for rel in own['relationships']:
+            source = names.get(rel['source'].lower(), rel['source'])
+            target = names.get(rel['target'].lower(), rel['target'])
+            key = frozenset((source.lower(), target.lower()))
+            if key in risks:
+                continue
+            risks.add(key)
+            relationships.append(dict(rel, source=source, target=target))
+
+        return dict(data, drugs=drugs, relationships=relationships)
@@ -0,0 +1,174 @@
+import time
+import threading
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
+
+from core import drug_client
+from core.ddi_results import DDIResult
+from core.rxnav_client import deadline as rxnav_deadline, remaining_time, RxNavError
+
+class DDISession:
+    """
+    Incremental interaction matrix for one prescription that is being edited.
+    Keeps resolved drugs and checked RxCUI pairs, so adding/removing/renaming a drug
+    only resolves that drug and checks its new pairs on the next result().
+    """
+    def __init__(self, drug_names=None, max_workers=4):
+        self._drugs = {}    # key (lower name) -> DrugMapping, insertion ordered
+        self._pairs = {}    # (cui_a, cui_b) sorted -> list of InteractionPair
+        self._errors = {}   # pair -> error message from the last failed check
+        self._lock = threading.RLock()
+        self.max_workers = max_workers
+        self.resolutions = 0
+        self.pair_checks = 0
+        if drug_names:
+            self.set_drugs(drug_names)
+
+    @staticmethod
+    def _key(name):
+        return name.strip().lower()
+
+    @property
+    def drug_names(self):
+        with self._lock:
+            return [d.name for d in self._drugs.values()]
+
+    @property
+    def mappings(self):
+        with self._lock:
+            return list(self._drugs.values())
+
+    def add(self, name, deadline=None):
+        """
+        Adds a drug (resolved once); returns its DrugMapping, or None if the name is too short.
+        RxNav calls share one time budget (`deadline` seconds, default ANALYSIS_DEADLINE).
+        """
+        key = self._key(name)
+        if len(key) < 3:
+            return None
+        with self._lock:
+            # Re-resolve drugs whose lookup failed because RxNav was unavailable
+            if key not in self._drugs or self._drugs[key].lookup_error:
+                with rxnav_deadline(deadline if deadline is not None else drug_client.ANALYSIS_DEADLINE):
+                    self._drugs[key] = drug_client.resolve_drug(name)
+                self.resolutions += 1
+            return self._drugs[key]
+
+    def seed(self, result):
+        """Takes over the drugs and checked pairs of a finished DDIResult (e.g. from check_interactions)."""
+        with self._lock:
+            for d in result.drugs:
+                self._drugs.setdefault(self._key(d.name), d)
+            if not result.checked or result.error:
+                return
+            by_pair = {tuple(sorted(p)): [] for p in combinations(dict.fromkeys(result.rxcuis), 2)}
+            for pair in result.interactions:
+                key = tuple(sorted((pair.rxcui1, pair.rxcui2)))
+                if key in by_pair:
+                    by_pair[key].append(pair)
+            self._pairs.update(by_pair)
+
+    def remove(self, name):
+        with self._lock:
+            self._drugs.pop(self._key(name), None)
+
+    def rename(self, old_name, new_name):
+        """Replaces one drug, keeping its position in the list."""
+        with self._lock:
+            names = self.drug_names
+            old_key = self._key(old_name)
+            names = [new_name if self._key(n) == old_key else n for n in names]
+            self.set_drugs(names)
+
+    def set_drugs(self, drug_names, deadline=None):
+        """
+        Makes the session match a full (edited) list: only names that were not there
+        before are resolved, and dropped names are removed. All resolutions share one
+        RxNav time budget (`deadline` seconds, default ANALYSIS_DEADLINE).
+        """
+        with self._lock:
+            wanted = [n for n in drug_names if len(self._key(n)) >= 3]
+            keys = [self._key(n) for n in wanted]
+            for key in list(self._drugs):
+                if key not in keys:
+                    del self._drugs[key]
+            with rxnav_deadline(deadline if deadline is not None else drug_client.ANALYSIS_DEADLINE):
+                for name in wanted:
+                    self.add(name)
+            # Keep the order of the latest list
+            self._drugs = {k: self._drugs[k] for k in dict.fromkeys(keys)}
+
+    def check_pair(self, cui_a, cui_b):
+        """Checks one RxCUI pair now (unless already known) and returns its interactions."""
+        pair = tuple(sorted((cui_a, cui_b)))
+        with self._lock:
+            if pair in self._pairs:
+                return self._pairs[pair]
+        try:
+            found = drug_client.get_pair_interactions(*pair)
+        except RxNavError as e:
+            with self._lock:
+                self._errors[pair] = str(e)
+            raise
+        with self._lock:
+            self.pair_checks += 1
+            self._pairs[pair] = found
+            self._errors.pop(pair, None)
+        return found
+
+    def _check_missing_pairs(self, cuis):
+        missing = [p for p in (tuple(sorted(c)) for c in combinations(cuis, 2)) if p not in self._pairs]
+        if not missing:
+            return
+
+        # Deadlines are per thread; carry the caller's remaining budget into the workers
+        left = remaining_time()
+        end = time.monotonic() + left if left is not None else None
+
+        def _check(pair):
+            try:
+                with rxnav_deadline(max(end - time.monotonic(), 0) if end is not None else None):
+                    return pair, drug_client.get_pair_interactions(*pair), None
+            except RxNavError as e:
+                return pair, None, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for pair, found, err in pool.map(_check, missing):
+                self.pair_checks += 1
+                if err:
+                    # Not stored: it is retried on the next result()
+                    self._errors[pair] = err
+                else:
+                    self._pairs[pair] = found
+                    self._errors.pop(pair, None)
+
+    def result(self, deadline=None):
+        """
+        Returns a DDIResult for the current list, checking only pairs not seen before.
+        """
+        with self._lock:
+            result = DDIResult(drugs=list(self._drugs.values()))
+            if not result.checked:
+                return result
+
+            cuis = result.rxcuis
+            with rxnav_deadline(deadline if deadline is not None else drug_client.ANALYSIS_DEADLINE):
+                self._check_missing_pairs(cuis)
+
+            errors = []
+            for pair in (tuple(sorted(c)) for c in combinations(cuis, 2)):
+                result.interactions.extend(self._pairs.get(pair, []))
+                if pair in self._errors and self._errors[pair] not in errors:
+                    errors.append(self._errors[pair])
+            if errors:
+                result.error = "; ".join(errors)
+            return result
+
+    def stats(self):
+        with self._lock:
+            return {
+                'drugs': len(self._drugs),
+                'resolutions': self.resolutions,
+                'pair_checks': self.pair_checks,
+                'pairs_known': len(self._pairs)
+            }
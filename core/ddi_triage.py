@@ -0,0 +1,154 @@
+import time
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import List, Optional
+
+from core import drug_client
+from core.ddi_cache import ddi_cache
+from core.ddi_session import DDISession
+from core.ddi_results import InteractionPair
+from core.rxnav_client import deadline as rxnav_deadline, RxNavError
+
+# Drug classes behind most major interactions (matched as substrings of the resolved generic)
+DRUG_CLASSES = {
+    'anticoagulant': ['warfarin', 'acenocoumarol', 'heparin', 'enoxaparin', 'apixaban', 'rivaroxaban', 'dabigatran'],
+    'antiplatelet': ['aspirin', 'clopidogrel', 'ticagrelor', 'prasugrel'],
+    'nsaid': ['ibuprofen', 'diclofenac', 'naproxen', 'aceclofenac', 'ketorolac', 'piroxicam', 'etoricoxib', 'mefenamic'],
+    'statin': ['simvastatin', 'atorvastatin', 'lovastatin', 'rosuvastatin'],
+    'cyp3a4_inhibitor': ['clarithromycin', 'erythromycin', 'ketoconazole', 'itraconazole', 'fluconazole', 'ritonavir', 'diltiazem', 'verapamil'],
+    'qt_prolonging': ['amiodarone', 'azithromycin', 'levofloxacin', 'ciprofloxacin', 'moxifloxacin', 'ondansetron', 'haloperidol', 'domperidone'],
+    'serotonergic': ['fluoxetine', 'sertraline', 'paroxetine', 'escitalopram', 'citalopram', 'tramadol', 'linezolid', 'venlafaxine'],
+    'maoi': ['selegiline', 'phenelzine', 'tranylcypromine', 'rasagiline'],
+    'potassium_raising': ['spironolactone', 'potassium', 'enalapril', 'ramipril', 'lisinopril', 'telmisartan', 'losartan'],
+    'nitrate': ['nitroglycerin', 'isosorbide'],
+    'pde5_inhibitor': ['sildenafil', 'tadalafil'],
+    'narrow_index': ['digoxin', 'lithium', 'phenytoin', 'carbamazepine', 'theophylline', 'methotrexate'],
+}
+
+# Prior risk (0-100) for a pair of classes; unlisted combinations score 0
+CLASS_PAIR_PRIORS = {
+    ('anticoagulant', 'antiplatelet'): 95,
+    ('anticoagulant', 'nsaid'): 90,
+    ('anticoagulant', 'cyp3a4_inhibitor'): 80,
+    ('maoi', 'serotonergic'): 95,
+    ('nitrate', 'pde5_inhibitor'): 95,
+    ('cyp3a4_inhibitor', 'statin'): 85,
+    ('qt_prolonging', 'qt_prolonging'): 75,
+    ('cyp3a4_inhibitor', 'qt_prolonging'): 70,
+    ('serotonergic', 'serotonergic'): 70,
+    ('potassium_raising', 'potassium_raising'): 65,
+    ('antiplatelet', 'nsaid'): 60,
+    ('cyp3a4_inhibitor', 'narrow_index'): 60,
+    ('narrow_index', 'nsaid'): 50,
+    ('narrow_index', 'qt_prolonging'): 50,
+}
+
+def drug_classes(name):
+    n = (name or "").lower()
+    return {cls for cls, members in DRUG_CLASSES.items() if any(m in n for m in members)}
+
+def pair_prior(classes_a, classes_b):
+    best = 0
+    for ca in classes_a:
+        for cb in classes_b:
+            best = max(best, CLASS_PAIR_PRIORS.get(tuple(sorted((ca, cb))), 0))
+    return best
+
+@dataclass
+class TriageResult:
+    """
+    Outcome of a triage check. `major` is the first interaction its source rates
+    major/contraindicated (or None). `unclassified` lists the interactions seen on the
+    way that carry no severity rating; they are reported but never stop the check.
+    report() checks any remaining pairs and returns the full DDIResult on demand.
+    """
+    session: DDISession
+    major: Optional[InteractionPair] = None
+    unclassified: List[InteractionPair] = field(default_factory=list)
+    pairs_checked: int = 0
+    pairs_total: int = 0
+    complete: bool = False
+    error: Optional[str] = None
+    seconds: float = 0.0
+    order: List[tuple] = field(default_factory=list)
+
+    @property
+    def has_major(self):
+        return self.major is not None
+
+    def summary(self):
+        if self.major:
+            text = (f"MAJOR INTERACTION: {self.major.drug1} + {self.major.drug2} "
+                    f"[{self.major.severity}] - {self.major.description}")
+        elif self.error:
+            text = f"Triage incomplete ({self.pairs_checked}/{self.pairs_total} pairs checked): {self.error}"
+        else:
+            text = f"No major interactions found ({self.pairs_checked} pairs checked)."
+        if self.unclassified:
+            names = ", ".join(f"{p.drug1} + {p.drug2}" for p in self.unclassified)
+            text += f"\nUnrated interactions (no severity from the source, review manually): {names}"
+        return text
+
+    def report(self, deadline=None):
+        return self.session.result(deadline=deadline)
+
+def _ordered_pairs(mappings):
+    """All RxCUI pairs, highest prior risk first (cached severities beat class priors)."""
+    by_cui = {}
+    for d in mappings:
+        for cui in d.rxcuis:
+            by_cui.setdefault(cui, drug_classes(d.resolved_name) | drug_classes(d.name))
+
+    scored = []
+    for a, b in (tuple(sorted(p)) for p in combinations(by_cui, 2)):
+        cached = ddi_cache.get_pair(a, b)
+        if cached is not None:
+            # Known outcome: majors first, known-clean pairs last
+            if any(p.is_major for p in cached):
+                score = 200
+            else:
+                score = 100 if cached else -1
+        else:
+            score = pair_prior(by_cui[a], by_cui[b])
+        scored.append((score, (a, b)))
+    scored.sort(key=lambda s: -s[0])
+    return [p for _, p in scored]
+
+def triage(drug_names, deadline=None, session=None):
+    """
+    Quick counter check: evaluates pairs in order of prior risk and stops at the first
+    interaction rated major/contraindicated. Interactions without a severity rating
+    (most RxNav records) are collected in `unclassified` instead of ending the check.
+    The session keeps everything already checked,
+    so the full report afterwards only fetches the remaining pairs.
+    The deadline covers drug resolution as well as the pair checks.
+    Returns a TriageResult.
+    """
+    start = time.time()
+    session = session or DDISession()
+    result = TriageResult(session=session)
+
+    with rxnav_deadline(deadline if deadline is not None else drug_client.ANALYSIS_DEADLINE):
+        session.set_drugs(drug_names)
+        order = _ordered_pairs(session.mappings)
+        result.order = order
+        result.pairs_total = len(order)
+
+        for pair in order:
+            try:
+                found = session.check_pair(*pair)
+            except RxNavError as e:
+                # Keep going: a later pair may still confirm a major interaction
+                result.error = str(e)
+                continue
+            result.pairs_checked += 1
+            result.unclassified.extend(p for p in found if p.is_unclassified)
+            major = next((p for p in found if p.is_major), None)
+            if major:
+                result.major = major
+                break
+        else:
+            result.complete = result.error is None
+
+    result.seconds = time.time() - start
+    return result
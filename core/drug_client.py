@@ -1,40 +1,286 @@
-import requests
+import os
 import json
 import urllib.parse
 import re
+import logging
 from functools import lru_cache
+from itertools import combinations
+from concurrent.futures import ThreadPoolExecutor
 from core.local_data import db
+from core.ddi_results import DrugMapping, InteractionPair, DDIResult
+from core.rxnav_client import client as rxnav, deadline as rxnav_deadline, remaining_time, RxNavError, DeadlineExceeded
+from core.rxnorm_index import rxnorm
+from core.singleflight import SingleFlight
+from core.ddi_cache import ddi_cache
+
+logger = logging.getLogger(__name__)
+
+# Total time budget for RxNav calls in one check_interactions() run (seconds, 0 = no limit)
+ANALYSIS_DEADLINE = float(os.getenv("RXNAV_ANALYSIS_DEADLINE", "20")) or None
+
+# Concurrent analyses (one thread each) share in-flight lookups instead of repeating them;
+# a waiting analysis still gives up at its own RxNav deadline
+flight = SingleFlight(wait_timeout=remaining_time,
+                      timeout_error=lambda: DeadlineExceeded("RxNav analysis deadline exceeded"))
 
 @lru_cache(maxsize=1000)
 def get_rxcui(drug_name):
     """
-    Searches NLM RxNav for a drug name and returns its RxCUI (ID).
+    Looks up a drug name's RxCUI (ID): first in the offline RxNorm index
+    (tools/import_rxnorm.py), then via NLM RxNav for names not present locally.
     Returns None if not found.
+    Raises RxNavError if RxNav is unavailable, so outages are not cached as "not found".
+    """
+    # lru_cache does not stop concurrent misses; coalesce them into one lookup
+    return flight.do(('rxcui', drug_name), _lookup_rxcui, drug_name)
+
+def _lookup_rxcui(drug_name):
+    cui = rxnorm.lookup(drug_name)
+    if cui:
+        return cui
+
+    # Persistent cache (pre-warmed by tools/warm_cache.py)
+    hit, cui = ddi_cache.get_rxcui(drug_name)
+    if hit:
+        return cui
+
+    # strict matching is safer to avoid garbage OCR results being matched
+    # Try exact search first, then fallback to approximate search
+    cui = None
+    for params in ({'name': drug_name}, {'name': drug_name, 'search': 1}):
+        data = rxnav.get_json("rxcui.json", params)
+        if 'idGroup' in data and 'rxnormId' in data['idGroup']:
+            # Return the first match
+            cui = data['idGroup']['rxnormId'][0]
+            break
+    ddi_cache.set_rxcui(drug_name, cui)
+    return cui
+
+def split_ingredients(name):
+    """
+    "Amoxycillin (500mg) + Clavulanic Acid (125mg)" -> ["Amoxycillin", "Clavulanic Acid"]
+    """
+    terms = []
+    for p in name.split('+'):
+        # Remove content in parenthesis e.g. (500mg)
+        p_clean = re.sub(r'\(.*?\)', '', p)
+        # Remove Numbers
+        p_clean = re.sub(r'\d+mg', '', p_clean, flags=re.IGNORECASE)
+        p_clean = re.sub(r'\d+\s?mg', '', p_clean, flags=re.IGNORECASE)
+        p_clean = p_clean.strip()
+        if p_clean: terms.append(p_clean)
+    return terms
+
+def _search_terms_for(resolved_name, clean_name):
+    """
+    Splits a resolved (local DB) name into RxNav-friendly search terms.
+    """
+    search_terms = []
+    if resolved_name and resolved_name.lower() != clean_name.lower():
+        # Heuristic: If resolved name has '+', it's likely ingredients.
+        # RxNav might not like "Amoxycillin (500mg) + Clavulanic Acid".
+        # Strategy: Split by '+', remove (...) dosage info, and lookup ingredients separately.
+        if '+' in resolved_name:
+            search_terms.extend(split_ingredients(resolved_name))
+        else:
+            # Single generic
+            s = re.sub(r'\(.*?\)', '', resolved_name)
+            s = s.strip()
+            search_terms.append(s)
+    else:
+        search_terms.append(clean_name)
+    return search_terms
+
+def resolve_local(name):
+    """
+    Local DB resolution (db.resolve_drug_name) backed by the persistent cache,
+    so cached names do not need the CSV datasets loaded at all.
+    Returns (generic_name, confidence).
+    """
+    cached = ddi_cache.get_resolution(name)
+    if cached:
+        return cached
+    resolved_name, confidence = db.resolve_drug_name(name)
+    if confidence > 0:
+        ddi_cache.set_resolution(name, resolved_name, confidence)
+    return resolved_name, confidence
+
+def resolve_drug(name):
+    """
+    Resolves a single drug name using local DB + RxNav.
+    Returns a DrugMapping.
+    """
+    clean_name = name.strip()
+
+    # Resolve against local DB (Indian Datasets + DrugBank)
+    resolved_name, confidence = resolve_local(clean_name)
+
+    display_name = clean_name
+    mapping = None
+    if resolved_name and resolved_name.lower() != clean_name.lower():
+        display_name = f"{resolved_name} (from '{clean_name}')"
+        mapping = f"• Correction: '{clean_name}' mapped to '{resolved_name}'"
+
+    lookup_error = None
+    def _lookup(term):
+        nonlocal lookup_error
+        try:
+            return get_rxcui(term)
+        except RxNavError as e:
+            logger.warning("RxCUI lookup failed for '%s': %s", term, e)
+            lookup_error = str(e)
+            return None
+
+    # Get CUI for each search term
+    cuis = []
+    for term in _search_terms_for(resolved_name, clean_name):
+        cui = _lookup(term)
+        if cui:
+            cuis.append(cui)
+
+    if not cuis and resolved_name != clean_name:
+        # Fallback: Try original name if fancy resolution failed lookup
+        cui = _lookup(clean_name)
+        if cui:
+            cuis.append(cui)
+            display_name = clean_name + " (fallback)"
+
+    return DrugMapping(
+        name=clean_name,
+        display_name=display_name,
+        resolved_name=resolved_name,
+        confidence=confidence,
+        rxcuis=cuis,
+        mapping=mapping,
+        lookup_error=lookup_error if not cuis else None
+    )
+
+def _parse_interaction_pairs(data):
+    """
+    Flattens an RxNav interaction/list.json response into a list of InteractionPair.
+    """
+    pairs = []
+    for group in data.get('fullInteractionTypeGroup', []):
+        source = group.get('sourceName', 'NLM RxNav')
+        for interaction_type in group.get('fullInteractionType', []):
+            for interaction in interaction_type.get('interactionPair', []):
+                concepts = interaction.get('interactionConcept', [])
+                c1 = concepts[0].get('minConceptItem', {}) if len(concepts) > 0 else {}
+                c2 = concepts[1].get('minConceptItem', {}) if len(concepts) > 1 else {}
+                pairs.append(InteractionPair(
+                    drug1=c1.get('name', 'Drug 1'),
+                    drug2=c2.get('name', 'Drug 2'),
+                    severity=interaction.get('severity', 'N/A'),
+                    description=interaction.get('description', 'No description available.'),
+                    source=source,
+                    rxcui1=c1.get('rxcui'),
+                    rxcui2=c2.get('rxcui')
+                ))
+    return pairs
+
+def fetch_interactions(cuis):
+    """
+    Queries RxNav for all interactions between the given RxCUIs.
+    Returns a list of InteractionPair. Raises RxNavError if RxNav is unavailable.
+    """
+    # https://rxnav.nlm.nih.gov/REST/interaction/list.json?rxcuis=207106+152923+656659
+    data = rxnav.get_json("interaction/list.json", {'rxcuis': " ".join(cuis)})
+    return _parse_interaction_pairs(data)
+
+@lru_cache(maxsize=5000)
+def _get_pair_interactions(cui_a, cui_b):
+    return flight.do(('pair', cui_a, cui_b), _lookup_pair, cui_a, cui_b)
+
+def _lookup_pair(cui_a, cui_b):
+    cached = ddi_cache.get_pair(cui_a, cui_b)
+    if cached is not None:
+        return tuple(cached)
+    found = fetch_interactions([cui_a, cui_b])
+    ddi_cache.set_pair(cui_a, cui_b, found)
+    return tuple(found)
+
+def get_pair_interactions(cui1, cui2):
+    """
+    Returns the interactions between two RxCUIs. Cached per unordered pair,
+    so (A, B) and (B, A) share one request; concurrent identical calls are coalesced.
+    """
+    a, b = sorted((cui1, cui2))
+    return list(_get_pair_interactions(a, b))
+
+def clear_caches():
+    """Drops in-memory RxCUI and interaction lookups (e.g. after switching RxNav endpoints)."""
+    get_rxcui.cache_clear()
+    _get_pair_interactions.cache_clear()
+
+def warm_pairs(cuis, chunk_size=40):
+    """
+    Checks every pair among `cuis` with as few RxNav calls as possible and stores the
+    results in the persistent pair cache. Groups of chunk_size/2 RxCUIs are queried two
+    groups at a time, so N drugs cost about (2N/chunk_size)^2 / 2 calls instead of N^2/2.
+    Returns the number of pairs stored.
     """
-    try:
-        # strict matching is safer to avoid garbage OCR results being matched
-        base_url = "https://rxnav.nlm.nih.gov/REST/rxcui.json"
+    cuis = list(dict.fromkeys(cuis))
+    half = max(chunk_size // 2, 1)
+    groups = [cuis[i:i + half] for i in range(0, len(cuis), half)]
+    stored = set()
+    for i in range(len(groups)):
+        for j in range(i, len(groups)):
+            batch = groups[i] if i == j else groups[i] + groups[j]
+            if len(batch) < 2:
+                continue
+            stored.update(_store_interactions(batch, fetch_interactions(batch)))
+    return len(stored)
+
+def _cached_interactions(cuis):
+    """All interactions among cuis from the persistent cache, or None if any pair is missing."""
+    found = []
+    for a, b in combinations(dict.fromkeys(cuis), 2):
+        pairs = ddi_cache.get_pair(a, b)
+        if pairs is None:
+            return None
+        found.extend(pairs)
+    return found
+
+def _store_interactions(cuis, found):
+    by_pair = {tuple(sorted(p)): [] for p in combinations(dict.fromkeys(cuis), 2)}
+    for pair in found:
+        key = tuple(sorted((pair.rxcui1, pair.rxcui2)))
+        if key in by_pair:
+            by_pair[key].append(pair)
+    ddi_cache.set_pairs(by_pair)
+    return by_pair
+
+def check_interactions(drug_names, deadline=None):
+    """
+    Takes a list of drug names strings.
+    Resolves them to RxCUIs using local DB + RxNav.
+    Checks for interactions between them.
+    All RxNav calls share one time budget (`deadline` seconds, default ANALYSIS_DEADLINE).
+    Returns a DDIResult (call .to_text() for the formatted report).
+    """
+    # Local data is loaded lazily on the first resolution cache miss
+    with rxnav_deadline(deadline if deadline is not None else ANALYSIS_DEADLINE):
+        # 1. Resolve Names to IDs
+        result = DDIResult()
+        for name in drug_names:
+            if len(name.strip()) < 3: continue 
+            result.drugs.append(resolve_drug(name))
         
-        # Try exact search first
-        params = {'name': drug_name}
-        response = requests.get(base_url, params=params, timeout=3)
-        if response.status_code == 200:
-            data = response.json()
-            if 'idGroup' in data and 'rxnormId' in data['idGroup']:
-                return data['idGroup']['rxnormId'][0]
-                
-        # Fallback to approximate search
-        params = {'name': drug_name, 'search': 1} 
-        response = requests.get(base_url, params=params, timeout=3)
+        if not result.checked:
+            return result
+
+        # 2. Check Interactions (persistent cache first, one RxNav call otherwise)
+        cached = _cached_interactions(result.rxcuis)
+        if cached is not None:
+            result.interactions = cached
+        else:
+            try:
+                result.interactions = fetch_interactions(result.rxcuis)
+                _store_interactions(result.rxcuis, result.interactions)
+            except RxNavError as e:
+                result.error = str(e)
         
-        if response.status_code == 200:
-            data = response.json()
-            if 'idGroup' in data and 'rxnormId' in data['idGroup']:
-                # Return the first match
-                return data['idGroup']['rxnormId'][0]
-    except Exception:
-        pass
-    return None
+    return result
 
 def check_interactions_for_list(drug_names):
     """
@@ -43,118 +289,60 @@ def check_interactions_for_list(drug_names):
     Checks for interactions between them.
     Returns a formatted string report.
     """
-    # Load local data if needed
-    db.load_data()
-    
-    cuis = []
-    found_drugs = []
-    mappings = []
-    
-    # 1. Resolve Names to IDs
-    for name in drug_names:
-        clean_name = name.strip()
-        if len(clean_name) < 3: continue 
-        
-        # Resolve against local DB (Indian Datasets + DrugBank)
-        resolved_name, confidence = db.resolve_drug_name(clean_name)
-        
-        display_name = clean_name
-        search_terms = []
-        
-        if resolved_name and resolved_name.lower() != clean_name.lower():
-            display_name = f"{resolved_name} (from '{clean_name}')"
-            mappings.append(f"• Correction: '{clean_name}' mapped to '{resolved_name}'")
-            
-            # Heuristic: If resolved name has '+', it's likely ingredients.
-            # RxNav might not like "Amoxycillin (500mg) + Clavulanic Acid".
-            # Strategy: Split by '+', remove (...) dosage info, and lookup ingredients separately.
-            if '+' in resolved_name:
-                parts = resolved_name.split('+')
-                for p in parts:
-                    # Remove content in parenthesis e.g. (500mg)
-                    p_clean = re.sub(r'\(.*?\)', '', p)
-                    # Remove Numbers
-                    p_clean = re.sub(r'\d+mg', '', p_clean, flags=re.IGNORECASE)
-                    p_clean = re.sub(r'\d+\s?mg', '', p_clean, flags=re.IGNORECASE)
-                    p_clean = p_clean.strip()
-                    if p_clean: search_terms.append(p_clean)
-            else:
-                # Single generic
-                s = re.sub(r'\(.*?\)', '', resolved_name)
-                s = s.strip()
-                search_terms.append(s)
-        else:
-            search_terms.append(clean_name)
-            
-        # Get CUI for each search term
-        found_cui = False
-        for term in search_terms:
-            cui = get_rxcui(term)
-            if cui:
-                cuis.append(cui)
-                found_cui = True
-                
-        if found_cui:
-            found_drugs.append(display_name)
-        else:
-            # Fallback: Try original name if fancy resolution failed lookup
-            if resolved_name != clean_name:
-                cui = get_rxcui(clean_name)
-                if cui:
-                    cuis.append(cui)
-                    found_drugs.append(clean_name + " (fallback)")
-    
-    if len(cuis) < 2:
-        msg = f"Found {len(found_drugs)} identifiable drugs ({', '.join(found_drugs)}). Need at least two to check for interactions."
-        if mappings:
-            msg += "\n\n" + "\n".join(mappings)
-        return msg
+    return check_interactions(drug_names).to_text()
 
-    # 2. Check Interactions
-    # https://rxnav.nlm.nih.gov/REST/interaction/list.json?rxcuis=207106+152923+656659
-    try:
-        rx_params = "+".join(cuis)
-        url = f"https://rxnav.nlm.nih.gov/REST/interaction/list.json?rxcuis={rx_params}"
-        response = requests.get(url)
-        
-        report = []
-        report.append("--- Identified Drugs (Official) ---")
-        report.append(", ".join(found_drugs))
-        
-        if mappings:
-            report.append("\n--- Auto-Corrections & Mappings ---")
-            report.extend(mappings)
-            
-        report.append("\n--- Interaction Report (NLM RxNav) ---")
-        
-        if response.status_code == 200:
-            data = response.json()
-            
-            if 'fullInteractionTypeGroup' in data:
-                # Interactions found
-                found_interaction = False
-                for group in data['fullInteractionTypeGroup']:
-                     for interaction_type in group.get('fullInteractionType', []):
-                         for interaction in interaction_type.get('interactionPair', []):
-                             found_interaction = True
-                             drug1 = interaction.get('interactionConcept', [])[0].get('minConceptItem', {}).get('name', 'Drug 1')
-                             drug2 = interaction.get('interactionConcept', [])[1].get('minConceptItem', {}).get('name', 'Drug 2')
-                             severity = interaction.get('severity', 'N/A')
-                             description = interaction.get('description', 'No description available.')
-                             
-                             report.append(f"• [SEVERITY: {severity}] {drug1} + {drug2}")
-                             report.append(f"  Warning: {description}\n")
-                if not found_interaction:
-                     report.append("No official interactions found between these drugs.")
-            else:
-                report.append("No official interactions found between these drugs.")
-        else:
-            report.append(f"Error checking interactions: API Status {response.status_code}")
-            
-        return "\n".join(report)
+def check_interactions_for_many(prescriptions, max_workers=8):
+    """
+    Batch version of check_interactions for auditing many prescriptions.
+    Takes a list of prescriptions (each a list of drug name strings).
+    Each unique drug name is resolved once and each unique RxCUI pair is fetched
+    once across the whole batch, so cost scales with unique drugs, not prescriptions.
+    Returns a list of DDIResult, in the same order as the input.
+    """
+    # Local data is loaded lazily on the first resolution cache miss
+    # 1. Dedupe drug names across all prescriptions
+    unique_names = {}
+    for drug_names in prescriptions:
+        for name in drug_names:
+            clean_name = name.strip()
+            if len(clean_name) < 3: continue
+            unique_names.setdefault(clean_name.lower(), clean_name)
 
-    except Exception as e:
-        return f"Error connecting to RxNav: {str(e)}"
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        resolved = dict(zip(unique_names.keys(), pool.map(resolve_drug, unique_names.values())))
+
+        # 2. Collect unique RxCUI pairs
+        results = []
+        unique_pairs = set()
+        for drug_names in prescriptions:
+            result = DDIResult()
+            for name in drug_names:
+                entry = resolved.get(name.strip().lower())
+                if entry and entry not in result.drugs:
+                    result.drugs.append(entry)
+            unique_pairs.update(tuple(sorted(p)) for p in combinations(result.rxcuis, 2))
+            results.append(result)
+
+        # 3. Fetch each unique pair once
+        def _fetch(pair):
+            try:
+                return pair, get_pair_interactions(*pair), None
+            except RxNavError as e:
+                logger.warning(f"Interaction lookup failed for RxCUI pair {pair}: {e}")
+                return pair, [], str(e)
+
+        pair_results = {pair: (found, err) for pair, found, err in pool.map(_fetch, unique_pairs)}
+
+    # 4. Assemble per-prescription results
+    for result in results:
+        errors = []
+        for pair in combinations(result.rxcuis, 2):
+            found, err = pair_results[tuple(sorted(pair))]
+            result.interactions.extend(found)
+            if err and err not in errors: errors.append(err)
+        if errors:
+            result.error = "; ".join(errors)
+    return results
 
 def extract_potential_drugs(ocr_text):
     """
@@ -178,6 +366,9 @@ def extract_potential_drugs(ocr_text):
         if not line or len(line) < 3:
             continue
 
+        # Numbered lists ("1. Tab Glycomet 500mg", "2) ...") - drop the item number
+        line = re.sub(r'^\d{1,2}[.)]\s+', '', line)
+
         # Regex to remove dosage like '500mg', '5 mg', '1-0-0' at the END of string
         # We start taking words from the left until we hit a number or symbol
         
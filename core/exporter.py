@@ -2,10 +2,33 @@ from reportlab.lib.pagesizes import letter
 from docx import Document
 from docx.shared import Inches
 import os
+from xml.sax.saxutils import escape
 
-def create_markdown(text, image_path, output_path, graph_path=None):
+def _interaction_rows(ddi_result):
+    """
+    Table rows (Drug 1, Drug 2, Severity, Description) from a structured DDIResult.
+    """
+    return [[p.drug1, p.drug2, str(p.severity), p.description] for p in ddi_result.interactions]
+
+def _relationship_rows(analysis):
+    """
+    Table rows (Source, Target, Type, Description) from a PrescriptionAnalysis' graph data.
+    """
+    if analysis is None or analysis.graph is None:
+        return []
+    return [[r.source, r.target, r.type, r.description] for r in analysis.graph.relationships]
+
+def _diagnosis_line(analysis):
+    if analysis is None or analysis.graph is None or not analysis.graph.diagnosis:
+        return ""
+    return ", ".join(analysis.graph.diagnosis)
+
+def create_markdown(text, image_path, output_path, graph_path=None, ddi_result=None, analysis=None):
     """
     Creates a Markdown file with the analysis results.
+    If a structured ddi_result (DDIResult) is given, its interactions are added as a table.
+    If a structured analysis (PrescriptionAnalysis) is given, its diagnosis and
+    drug relationships are added as well.
     """
     try:
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -16,6 +39,24 @@ def create_markdown(text, image_path, output_path, graph_path=None):
                  f.write(f"## Knowledge Graph\n\n")
                  f.write(f"![Knowledge Graph]({graph_path})\n\n")
             
+            if ddi_result is not None and ddi_result.interactions:
+                f.write(f"## Drug Interactions\n\n")
+                f.write("| Drug 1 | Drug 2 | Severity | Description |\n")
+                f.write("|---|---|---|---|\n")
+                for row in _interaction_rows(ddi_result):
+                    f.write("| " + " | ".join(c.replace('|', '/') for c in row) + " |\n")
+                f.write("\n")
+            
+            if _diagnosis_line(analysis):
+                f.write(f"**Diagnosis:** {_diagnosis_line(analysis)}\n\n")
+            if _relationship_rows(analysis):
+                f.write(f"## Clinical Relationships\n\n")
+                f.write("| Source | Target | Type | Description |\n")
+                f.write("|---|---|---|---|\n")
+                for row in _relationship_rows(analysis):
+                    f.write("| " + " | ".join(c.replace('|', '/') for c in row) + " |\n")
+                f.write("\n")
+            
             f.write(f"## Analysis Results\n\n")
             f.write(text)
         return True
@@ -23,9 +64,12 @@ def create_markdown(text, image_path, output_path, graph_path=None):
         print(f"Error creating Markdown: {e}")
         return False
 
-def create_word(text, image_path, output_path, graph_path=None):
+def create_word(text, image_path, output_path, graph_path=None, ddi_result=None, analysis=None):
     """
     Creates a Word document with the analysis results.
+    If a structured ddi_result (DDIResult) is given, its interactions are added as a table.
+    If a structured analysis (PrescriptionAnalysis) is given, its diagnosis and
+    drug relationships are added as well.
     """
     try:
         doc = Document()
@@ -44,6 +88,28 @@ def create_word(text, image_path, output_path, graph_path=None):
             except Exception as e:
                 doc.add_paragraph(f"[Error adding graph: {e}]")
 
+        if ddi_result is not None and ddi_result.interactions:
+            doc.add_heading('Drug Interactions', level=2)
+            table = doc.add_table(rows=1, cols=4)
+            table.style = 'Table Grid'
+            for cell, title in zip(table.rows[0].cells, ["Drug 1", "Drug 2", "Severity", "Description"]):
+                cell.text = title
+            for row in _interaction_rows(ddi_result):
+                for cell, value in zip(table.add_row().cells, row):
+                    cell.text = value
+
+        if _diagnosis_line(analysis):
+            doc.add_paragraph(f"Diagnosis: {_diagnosis_line(analysis)}")
+        if _relationship_rows(analysis):
+            doc.add_heading('Clinical Relationships', level=2)
+            table = doc.add_table(rows=1, cols=4)
+            table.style = 'Table Grid'
+            for cell, title in zip(table.rows[0].cells, ["Source", "Target", "Type", "Description"]):
+                cell.text = title
+            for row in _relationship_rows(analysis):
+                for cell, value in zip(table.add_row().cells, row):
+                    cell.text = value
+
         doc.add_heading('Analysis Results', level=1)
         doc.add_paragraph(text)
 
@@ -53,10 +119,13 @@ def create_word(text, image_path, output_path, graph_path=None):
         print(f"Error creating Word doc: {e}")
         return False, f"Failed to save Word doc: {e}"
 
-def create_pdf(text, image_path, output_path, graph_path=None):
+def create_pdf(text, image_path, output_path, graph_path=None, ddi_result=None, analysis=None):
     """
     Creates a professionally formatted PDF report using ReportLab.
     Parses the text to identify headers, lists, and bold content.
+    If a structured ddi_result (DDIResult) is given, its interactions are added as a table.
+    If a structured analysis (PrescriptionAnalysis) is given, its diagnosis and
+    drug relationships are added as well.
     """
     try:
         from reportlab.lib import colors
@@ -185,7 +254,45 @@ def create_pdf(text, image_path, output_path, graph_path=None):
             except: pass
             story.append(PageBreak())
 
-        # 4. Text Analysis Content
+        # 4. Structured Interaction Table
+        if ddi_result is not None and ddi_result.interactions:
+            story.append(Paragraph("Drug Interactions", section_header))
+            cell_style = ParagraphStyle('Cell', parent=body_style, fontSize=9, leading=11, spaceAfter=0)
+            rows = [["Drug 1", "Drug 2", "Severity", "Description"]]
+            # Paragraph parses markup: RxNav text with '&' or '<' must be escaped
+            rows += [[Paragraph(escape(str(c)), cell_style) for c in row] for row in _interaction_rows(ddi_result)]
+            table = Table(rows, colWidths=[1.2*inch, 1.2*inch, 0.9*inch, 3.7*inch], repeatRows=1)
+            table.setStyle(TableStyle([
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ]))
+            story.append(table)
+            story.append(Spacer(1, 15))
+
+        # 4b. Structured Diagnosis & Relationships
+        if _diagnosis_line(analysis) or _relationship_rows(analysis):
+            story.append(Paragraph("Clinical Relationships", section_header))
+            if _diagnosis_line(analysis):
+                story.append(Paragraph(f"<b>Diagnosis:</b> {escape(_diagnosis_line(analysis))}", body_style))
+            if _relationship_rows(analysis):
+                cell_style = ParagraphStyle('RelCell', parent=body_style, fontSize=9, leading=11, spaceAfter=0)
+                rows = [["Source", "Target", "Type", "Description"]]
+                rows += [[Paragraph(escape(str(c)), cell_style) for c in row] for row in _relationship_rows(analysis)]
+                table = Table(rows, colWidths=[1.5*inch, 1.5*inch, 1.0*inch, 3.0*inch], repeatRows=1)
+                table.setStyle(TableStyle([
+                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#2c3e50')),
+                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ]))
+                story.append(table)
+            story.append(Spacer(1, 15))
+
+        # 5. Text Analysis Content
         import re
         
         # Pre-process text to remove "Structure" noise if any
@@ -229,7 +336,7 @@ def create_pdf(text, image_path, output_path, graph_path=None):
                      
                 story.append(Paragraph(content, body_style))
 
-        # 5. Footer / Disclaimer
+        # 6. Footer / Disclaimer
         story.append(Spacer(1, 30))
         story.append(Paragraph("DISCLAIMER: This analysis is generated by AI (RxShield). It is intended for assistance only and should NOT replace professional medical advice. Always verify with a certified pharmacist or doctor.", disclaimer_style))
         
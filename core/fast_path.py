@@ -0,0 +1,129 @@
+import os
+from dataclasses import dataclass, field
+from typing import List
+
+from core import drug_client
+from core.analysis_results import PrescriptionAnalysis, GraphData
+
+# "llm" (default): always run the Gemini analysis; "auto": local fast path when local
+# resolution is confident (opt-in, skips the patient-specific LLM review); "local": always
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "llm")
+# Share of extracted drug candidates that must resolve (near-)exactly in LocalDrugDB
+FAST_PATH_MIN_RATIO = float(os.getenv("FAST_PATH_MIN_RATIO", "0.8"))
+FAST_PATH_MIN_CONFIDENCE = int(os.getenv("FAST_PATH_MIN_CONFIDENCE", "90"))
+# DDI comes from the persistent/offline caches first; RxNav only gets this long
+FAST_PATH_DDI_DEADLINE = float(os.getenv("FAST_PATH_DDI_DEADLINE", "1.5"))
+
+@dataclass
+class LocalAssessment:
+    """How well the drug candidates of a text resolve against LocalDrugDB."""
+    candidates: List[str] = field(default_factory=list)
+    resolved: List[tuple] = field(default_factory=list)   # (candidate, generic, confidence)
+    unresolved: List[str] = field(default_factory=list)
+
+    @property
+    def ratio(self):
+        return len(self.resolved) / len(self.candidates) if self.candidates else 0.0
+
+    @property
+    def confident(self):
+        return bool(self.resolved) and self.ratio >= FAST_PATH_MIN_RATIO
+
+    @property
+    def generics(self):
+        names = []
+        for _, generic, _ in self.resolved:
+            if generic not in names: names.append(generic)
+        return names
+
+def assess(text):
+    """Extracts drug candidates locally and resolves them (no network, no LLM)."""
+    result = LocalAssessment(candidates=drug_client.extract_potential_drugs(text or ""))
+    for candidate in result.candidates:
+        generic, confidence = drug_client.resolve_local(candidate)
+        if confidence >= FAST_PATH_MIN_CONFIDENCE:
+            result.resolved.append((candidate, generic, confidence))
+        else:
+            result.unresolved.append(candidate)
+    return result
+
+def use_fast_path(assessment, mode=None):
+    mode = (mode or ANALYSIS_MODE).lower()
+    if mode == 'local':
+        return True
+    if mode == 'llm':
+        return False
+    return assessment.confident
+
+NO_LLM_NOTICE = ("NOTE: No LLM review ran for this prescription. This report comes from offline drug data only; "
+                 "patient-specific warnings (age, conditions, allergies) were not checked.")
+
+def build_analysis_text(assessment, ddi_result, patient_details=None):
+    """Templated report with the same sections the LLM analysis uses."""
+    lines = [NO_LLM_NOTICE, ""]
+    if patient_details:
+        lines.append("Patient Details")
+        lines.append(f"- {patient_details.get('name', 'N/A')}, Age {patient_details.get('age', 'N/A')}, "
+                     f"{patient_details.get('gender', 'N/A')}, Weight {patient_details.get('weight', 'N/A')}")
+        lines.append("")
+
+    lines.append("Identified Medications")
+    for candidate, generic, confidence in assessment.resolved:
+        match = "exact match" if confidence >= 100 else f"match {confidence}%"
+        label = generic if candidate.lower() == generic.lower() else f"{candidate} -> {generic}"
+        lines.append(f"- {label} ({match})")
+    for candidate in assessment.unresolved:
+        lines.append(f"- {candidate} (not found in the local database - verify manually)")
+    lines.append("")
+
+    lines.append("Analysis & Warnings")
+    majors = []
+    if ddi_result is None or not ddi_result.checked:
+        lines.append("- Fewer than two identifiable drugs; no interaction check was possible.")
+    elif ddi_result.error:
+        lines.append(f"- Interaction data unavailable offline for some pairs ({ddi_result.error}).")
+    elif ddi_result.interactions:
+        for pair in ddi_result.interactions:
+            lines.append(f"- [{pair.severity}] {pair.drug1} + {pair.drug2}: {pair.description}")
+            if pair.is_major: majors.append(f"{pair.drug1} + {pair.drug2}")
+    else:
+        lines.append("- No known interactions between the identified drugs.")
+    lines.append("")
+
+    lines.append("Recommendations")
+    if majors:
+        lines.append(f"- Consult the prescriber before dispensing: major interaction(s) {', '.join(majors)}.")
+    if assessment.unresolved:
+        lines.append("- Some items could not be identified locally; run the full AI analysis if in doubt.")
+    lines.append("- Confirm doses and duration with the prescription.")
+    lines.append("")
+    lines.append("Disclaimer: Generated locally from offline drug data without AI; requires professional verification.")
+    return "\n".join(lines)
+
+def analyze_locally(text, patient_details=None, assessment=None):
+    """
+    Fast path: local extraction + resolution, cached/offline DDI data and a templated
+    report. Returns a dict shaped like run_analysis_pipeline's result (plus ddi_result).
+    """
+    from core.gemini_client import local_lookup, format_analysis_output, BLACKLIST
+
+    assessment = assessment or assess(text)
+    generics = assessment.generics
+    ddi_result = drug_client.check_interactions(generics, deadline=FAST_PATH_DDI_DEADLINE) if generics else None
+
+    analysis_text = build_analysis_text(assessment, ddi_result, patient_details)
+    local_report, processed_generics = local_lookup(generics)
+    p_name = patient_details.get('name', 'Patient') if patient_details else 'Patient'
+    graph = GraphData.from_dict(ddi_result.to_graph_data(p_name)) if ddi_result and ddi_result.found_drugs else None
+
+    note = (f"(Skipped - local fast path, no LLM review: {len(assessment.resolved)}/{len(assessment.candidates)} "
+            f"drug candidates resolved in the local database)")
+    return {
+        'text': format_analysis_output(text, note, analysis_text, local_report),
+        'drugs': [d for d in processed_generics if d.lower() not in BLACKLIST and len(d) > 2],
+        'analysis': PrescriptionAnalysis(analysis_text, generics, graph, model='local'),
+        'graph_data': graph,
+        'ddi_result': ddi_result,
+        'enhanced_text': text,
+        'mode': 'local',
+    }
@@ -1,8 +1,25 @@
 import os
+import json
+import time
+import threading
 import google.generativeai as genai
 from dotenv import load_dotenv
 import PIL.Image
 from core.puter_client import perform_ocr_puter
+from core.llm_cache import llm_cache, cache_key
+from core.pipeline import Stage, StageError, run_stages
+from core.analysis_results import PrescriptionAnalysis, GraphData
+from core.model_router import router, is_quota_error
+from core.image_preprocess import preprocessor
+from core import tracing
+from core import fast_path
+from core import drug_client
+from core.ddi_session import DDISession
+from core.rxnav_client import deadline as rxnav_deadline
+from core.ocr_quality import enhance_gate
+from core.ocr_correct import corrector
+from core.prompt_compact import compact_text, estimate_tokens
+from core.rate_limiter import limiter, RateLimited
 
 load_dotenv()
 
@@ -13,6 +30,117 @@ if api_key:
 else:
     print("Warning: GEMINI_API_KEY not found in environment.")
 
+# Expected response size, reserved in the tokens/min bucket until the real usage is known
+RATE_OUTPUT_TOKENS = int(os.getenv("RATE_OUTPUT_TOKENS", "1000"))
+
+# Token usage of the last generate_with_fallback call in this thread (for benchmarks)
+_usage = threading.local()
+
+def last_usage():
+    """{'model', 'cached', 'prompt_tokens', 'output_tokens'} of this thread's last LLM call."""
+    return dict(getattr(_usage, 'value', None) or {})
+
+def _token_count(meta, field):
+    value = getattr(meta, field, 0)
+    return value if isinstance(value, int) else 0
+
+def _record_usage(model_name, response=None, prompt=None, text=None):
+    meta = getattr(response, 'usage_metadata', None) if response is not None else None
+    _usage.value = {
+        'model': model_name,
+        'cached': response is None,
+        'prompt_tokens': _token_count(meta, 'prompt_token_count'),
+        'output_tokens': _token_count(meta, 'candidates_token_count'),
+    }
+    tracing.record_llm_call(model_name, prompt, text, _usage.value, cached=response is None)
+
+def _stream_text(response, on_chunk):
+    """Consumes a streaming response, calling on_chunk(text_so_far) as chunks arrive."""
+    parts = []
+    for chunk in response:
+        try:
+            piece = chunk.text
+        except ValueError:
+            # Chunk without text parts (e.g. only safety metadata)
+            continue
+        if piece:
+            parts.append(piece)
+            on_chunk("".join(parts))
+    return "".join(parts)
+
+def generate_with_fallback(models_to_try, prompt, parse=None, label="Model", generation_config=None, on_chunk=None):
+    """
+    Runs `prompt` on the first model in `models_to_try` that succeeds and returns
+    parse(text) (or the raw text). Responses are served from / stored in the on-disk
+    LLM cache; a response is only cached once it parsed successfully.
+    The shared model router decides the order (models that keep failing are tried last
+    while cooling down) and records success/latency per model.
+    With on_chunk, the response is streamed and on_chunk(text_so_far) is called as
+    chunks arrive (once with the full text on a cache hit); a model failing mid-stream
+    restarts the text from the next model.
+    Each call first takes a slot from the per-model rate limiter; a model whose queue
+    is too long is skipped like a failing one (without counting against its health).
+    Raises the last error if every model fails.
+    """
+    keys = {m: cache_key(m, prompt, generation_config) for m in models_to_try}
+
+    # Any model in the chain that already answered this exact prompt wins
+    for model_name in models_to_try:
+        cached = llm_cache.get(keys[model_name])
+        if cached is not None:
+            try:
+                result = parse(cached) if parse else cached
+            except Exception:
+                continue
+            if on_chunk:
+                on_chunk(cached)
+            _record_usage(model_name, prompt=prompt, text=cached)
+            return result
+
+    last_error = None
+    estimated_tokens = estimate_tokens(prompt if isinstance(prompt, str) else "") + RATE_OUTPUT_TOKENS
+    for model_name in router.order(models_to_try):
+        try:
+            limiter.acquire(model_name, tokens=estimated_tokens)
+        except RateLimited as e:
+            print(f"{label} {model_name} skipped: {e}")
+            last_error = e
+            continue
+        try:
+            start = time.time()
+            model = router.model(model_name)
+            if on_chunk:
+                response = model.generate_content(prompt, generation_config=generation_config, stream=True)
+                text = _stream_text(response, on_chunk)
+            else:
+                response = model.generate_content(prompt, generation_config=generation_config)
+                text = response.text
+            result = parse(text) if parse else text
+            router.record_success(model_name, time.time() - start)
+            llm_cache.set(keys[model_name], text, model_name)
+            _record_usage(model_name, response, prompt=prompt, text=text)
+            usage = last_usage()
+            limiter.settle(model_name, estimated_tokens, (usage['prompt_tokens'] + usage['output_tokens']) or None)
+            print(f"{label} success with model: {model_name}")
+            return result
+        except Exception as e:
+            print(f"{label} {model_name} failed: {e}")
+            router.record_failure(model_name, e)
+            # Nothing was consumed: give the reserved tokens back
+            limiter.settle(model_name, estimated_tokens, 0)
+            if is_quota_error(e):
+                limiter.penalize(model_name)
+            last_error = e
+            continue
+    raise last_error or RuntimeError("No models to try")
+
+def _strip_code_fence(text):
+    cleaned = text.strip()
+    if cleaned.startswith("```json"): cleaned = cleaned[7:-3]
+    elif cleaned.startswith("```python"): cleaned = cleaned[9:-3]
+    elif cleaned.startswith("```"): cleaned = cleaned[3:-3]
+    return cleaned
+
 def perform_ocr_gemini(image_path):
     """
     Sends an image to Gemini 1.5 Flash for accurate OCR.
@@ -24,8 +152,9 @@ def perform_ocr_gemini(image_path):
         return f"Error: Image not found at {image_path}"
 
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        img = PIL.Image.open(image_path)
+        model = router.model('gemini-1.5-flash')
+        # Upload the shrunk grayscale copy instead of the full photo
+        img = PIL.Image.open(preprocessor.process(image_path).path)
         
         prompt = "Extract all text from this prescription image verbatim. Output only the extracted text."
         
@@ -35,17 +164,10 @@ def perform_ocr_gemini(image_path):
     except Exception as e:
         return f"Error using AI OCR: {str(e)}"
 
-def analyze_text(text, patient_details=None):
-    """
-    Performs DDI analysis on the given text (whether OCR or Manual).
-    """
-    if not api_key:
-        return "Analysis Failed: System configuration error (API Key)."
-
-    # Construct Prompt with Patient Details
-    patient_info_str = ""
-    if patient_details:
-        patient_info_str = f"""
+def format_patient_info(patient_details):
+    if not patient_details:
+        return ""
+    return f"""
 Patient Details:
 - Name: {patient_details.get('name', 'N/A')}
 - Age: {patient_details.get('age', 'N/A')}
@@ -54,6 +176,19 @@ Patient Details:
 - Body Type: {patient_details.get('body_type', 'N/A')}
 """
 
+def analyze_text(text, patient_details=None, on_chunk=None, drugs=None):
+    """
+    Performs DDI analysis on the given text (whether OCR or Manual).
+    If on_chunk is given, the answer is streamed: on_chunk(text_so_far) is called as it arrives.
+    drugs: generic names already resolved locally, passed along to the compacted prompt.
+    """
+    if not api_key:
+        return "Analysis Failed: System configuration error (API Key)."
+    text = compact_text(text, drugs, label="Analysis")
+
+    # Construct Prompt with Patient Details
+    patient_info_str = format_patient_info(patient_details)
+
     # Safe name extraction
     p_name = patient_details.get('name', 'Patient') if patient_details else 'Patient'
 
@@ -88,17 +223,10 @@ Disclaimer: Emphasize that this is an AI analysis and requires professional veri
     # Model Priority: 2.5-Flash -> 2.5-Flash-Lite -> 3-Flash
     models_to_try = ['gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-3-flash']
     
-    for model_name in models_to_try:
-        try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(analysis_prompt)
-            print(f"Success with model: {model_name}")
-            return response.text
-        except Exception as e:
-            print(f"Model {model_name} failed: {e}")
-            continue
-            
-    return "Analysis failed reset the parameters"
+    try:
+        return generate_with_fallback(models_to_try, analysis_prompt, label="Analysis", on_chunk=on_chunk)
+    except Exception:
+        return "Analysis failed reset the parameters"
 
 def enhance_ocr_text(raw_text):
     """
@@ -119,22 +247,17 @@ def enhance_ocr_text(raw_text):
     # Model Priority: 2.5-Flash -> 2.5-Flash-Lite -> 3-Flash
     models_to_try = ['gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-3-flash']
     
-    for model_name in models_to_try:
-        try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            print(f"Enhancement model {model_name} failed: {e}")
-            continue
-            
-    return raw_text # Fallback to raw
+    try:
+        return generate_with_fallback(models_to_try, prompt, label="Enhancement")
+    except Exception:
+        return raw_text # Fallback to raw
 
 def extract_generics_gemini(text):
     """
     Ask Gemini to identify all drugs and return their Generic Names as a python list.
     """
     if not api_key: return []
+    text = compact_text(text, label="Generics")
     
     prompt = f"""
     Analyze the following medical text and identify all pharmaceutical drugs prescribed.
@@ -151,27 +274,21 @@ def extract_generics_gemini(text):
     # Model Priority: 2.5-Flash -> 2.5-Flash-Lite -> 3-Flash
     models_to_try = ['gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-3-flash']
     
-    for model_name in models_to_try:
-        try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
-            # Clean response to get list
-            cleaned = response.text.strip()
-            if cleaned.startswith("```json"): cleaned = cleaned[7:-3]
-            elif cleaned.startswith("```python"): cleaned = cleaned[9:-3]
-            elif cleaned.startswith("```"): cleaned = cleaned[3:-3]
-            
-            import ast
-            try:
-                return ast.literal_eval(cleaned)
-            except:
-                # Fallback parsing
-                return [line.strip('- ').strip() for line in cleaned.split('\n') if line.strip()]
-        except Exception as e:
-            print(f"Generic extraction model {model_name} failed: {e}")
-            continue
-            
-    return []
+    try:
+        return generate_with_fallback(models_to_try, prompt, parse=parse_generics_list, label="Generic extraction")
+    except Exception:
+        return []
+
+def parse_generics_list(text):
+    # Clean response to get list
+    cleaned = _strip_code_fence(text)
+    
+    import ast
+    try:
+        return ast.literal_eval(cleaned)
+    except:
+        # Fallback parsing
+        return [line.strip('- ').strip() for line in cleaned.split('\n') if line.strip()]
 
 def get_interactions_gemini(drug_list):
     """
@@ -202,34 +319,22 @@ def get_interactions_gemini(drug_list):
     
     models_to_try = ['gemini-1.5-flash', 'gemini-pro'] # Stable models preferred
     
-    for model_name in models_to_try:
-        try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
-            
-            cleaned = response.text.strip()
-            if cleaned.startswith("```json"): cleaned = cleaned[7:-3]
-            elif cleaned.startswith("```"): cleaned = cleaned[3:-3]
-            
-            import json
-            data = json.loads(cleaned)
-            return data
-            
-        except Exception as e:
-            print(f"Gemini DDI Graph extraction failed ({model_name}): {e}")
-            continue
-            
-    return []
+    try:
+        return generate_with_fallback(models_to_try, prompt, parse=parse_json_response, label="Gemini DDI Graph extraction")
+    except Exception:
+        return []
 
-def extract_extended_graph_data_gemini(text, patient_details=None):
+def extract_extended_graph_data_gemini(text, patient_details=None, drugs=None):
     """
     Extracts structured data for the Advanced Knowledge Graph:
     - Patient Info, Date
     - Diagnosis/Conditions
     - Drugs
     - Specific DDI Relationships (Protective vs Risk)
+    text may be a whole formatted report; it is compacted first (see core/prompt_compact.py).
     """
     if not api_key: return None
+    text = compact_text(text, drugs, label="Graph Data")
     
     # Safe handling if patient_details is None
     if patient_details:
@@ -268,22 +373,86 @@ def extract_extended_graph_data_gemini(text, patient_details=None):
     # Model Priority: 2.5-Flash -> 2.5-Flash-Lite -> 3-Flash
     models_to_try = ['gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-3-flash']
     
-    for model_name in models_to_try:
-        try:
-            model = genai.GenerativeModel(model_name)
-            response = model.generate_content(prompt)
-            
-            cleaned = response.text.strip()
-            if cleaned.startswith("```json"): cleaned = cleaned[7:-3]
-            elif cleaned.startswith("```"): cleaned = cleaned[3:-3]
-            
-            import json
-            return json.loads(cleaned)
-        except Exception as e:
-            print(f"Graph Data Extraction Error ({model_name}): {e}")
-            continue
-            
-    return None
+    try:
+        return generate_with_fallback(models_to_try, prompt, parse=parse_json_response, label="Graph Data Extraction")
+    except Exception:
+        return None
+
+def parse_json_response(text):
+    import json
+    return json.loads(_strip_code_fence(text))
+
+# JSON schema for the single-call mode (Gemini structured output)
+STRUCTURED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis_text": {"type": "string"},
+        "generics": {"type": "array", "items": {"type": "string"}},
+        "graph": {
+            "type": "object",
+            "properties": {
+                "patient_name": {"type": "string"},
+                "date": {"type": "string"},
+                "diagnosis": {"type": "array", "items": {"type": "string"}},
+                "drugs": {"type": "array", "items": {"type": "string"}},
+                "relationships": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "source": {"type": "string"},
+                            "target": {"type": "string"},
+                            "type": {"type": "string", "enum": ["Protective", "Risk", "Treats"]},
+                            "description": {"type": "string"}
+                        },
+                        "required": ["source", "target", "type", "description"]
+                    }
+                }
+            },
+            "required": ["patient_name", "date", "diagnosis", "drugs", "relationships"]
+        }
+    },
+    "required": ["analysis_text", "generics", "graph"]
+}
+
+def parse_structured_analysis(text):
+    return PrescriptionAnalysis.from_dict(parse_json_response(text))
+
+def analyze_structured(text, patient_details=None, drugs=None):
+    """
+    Single-call mode: one Gemini request with a JSON schema returns the readable
+    analysis, the generic names and the Knowledge Graph data together
+    (replacing analyze_text + extract_generics_gemini + extract_extended_graph_data_gemini).
+    Returns a PrescriptionAnalysis, or None if every model failed.
+    """
+    if not api_key: return None
+    text = compact_text(text, drugs, label="Structured analysis")
+
+    p_name = patient_details.get('name', 'Patient') if patient_details else 'Patient'
+    prompt = f"""
+You are a medical assistant. Analyze the prescription text below and fill every field of the JSON schema.
+{format_patient_info(patient_details)}
+Prescription Text:
+"{text}"
+
+- analysis_text: a clean, readable report with sections "Identified Medications" (drug names and dosages),
+  "Analysis & Warnings" (drug-drug interactions and warnings based on the patient details) and
+  "Recommendations". End with a disclaimer that this is an AI analysis and requires professional verification.
+- generics: the GENERIC NAME (active ingredient) of every prescribed drug, without dosages.
+- graph: patient_name (extracted or '{p_name}'), date (extracted or 'Unknown'), diagnosis, drugs and
+  relationships between drugs (type "Protective" or "Risk", e.g. a PPI protecting against NSAID side effects)
+  or from drugs to conditions (type "Treats"), each with a short description label.
+"""
+    generation_config = {"response_mime_type": "application/json", "response_schema": STRUCTURED_SCHEMA}
+    models_to_try = ['gemini-2.5-flash', 'gemini-2.5-flash-lite', 'gemini-3-flash']
+
+    try:
+        result = generate_with_fallback(models_to_try, prompt, parse=parse_structured_analysis,
+                                        label="Structured analysis", generation_config=generation_config)
+    except Exception:
+        return None
+    result.model = last_usage().get('model')
+    return result
 
 def clean_markdown_to_text(text):
     import re
@@ -297,86 +466,105 @@ def clean_markdown_to_text(text):
     text = text.replace('```', '')
     return text.strip()
 
-def analyze_prescription(image_path, patient_details=None):
+def _resolve_generic(raw_gen):
+    """Resolves one generic name against the local datasets: (canonical_name, confidence, details or None)."""
+    from core.local_data import db
+    # Handles fuzzy matching (e.g. "Paracetamol 500" -> "Paracetamol")
+    canonical_name, conf = db.resolve_drug_name(str(raw_gen))
+    details = db.get_drug_details_by_generic(canonical_name) if conf > 60 else None
+    return canonical_name, conf, details
+
+def local_lookup(extracted_generics, resolved=None):
     """
-    Orchestrates the analysis:
-    1. Puter OCR -> Raw Text
-    2. Gemini -> Enhanced Text (Correction)
-    3. Gemini -> Analysis (DDI)
-    4. Gemini -> Extract Generics -> Local Data Lookup
+    Step 4: resolves Gemini's generic names against the local datasets.
+    `resolved` (lower-case name -> _resolve_generic result, see speculative_lookup)
+    holds resolutions already made; only the other names are resolved here.
+    Returns (local_report, processed_generics).
     """
+    local_report = ""
+    processed_generics = set()
     try:
-        # Step 1: Puter OCR
-        print(f"Starting OCR with Puter for {image_path}...")
-        extracted_text = perform_ocr_puter(image_path)
-        source = "AI Analysis Enhanced"
-        
-        if "Error" in extracted_text or not extracted_text:
-             return f"OCR Failed: {extracted_text}"
-
-        # Step 2: Enhancement
-        if api_key:
-            enhanced_text = enhance_ocr_text(extracted_text)
-        else:
-            enhanced_text = extracted_text
-
-        # Step 3: DDI Analysis
-        raw_analysis = analyze_text(enhanced_text, patient_details)
-        # Convert to pure text
-        analysis_result = clean_markdown_to_text(raw_analysis)
-
-        # Step 4: Local Dataset Lookup (Integrated per request)
-        local_report = ""
-        processed_generics = set()
-        try:
-            from core.local_data import db
+        # Fetch details
+        if extracted_generics:
+            local_report = "\nFrom the Drug dataset / database\n"
             
-            # Use Gemini to get Generics explicitly
-            extracted_generics = extract_generics_gemini(enhanced_text)
-            
-            # Fetch details
-            if extracted_generics:
-                local_report = "\nFrom the Drug dataset / database\n"
-                
-                found_any = False
+            found_any = False
 
-                for raw_gen in extracted_generics:
-                    # Resolve API Generic Name -> Local DB Generic Key
-                    # This handles fuzzy matching (e.g. "Paracetamol 500" -> "Paracetamol")
-                    canonical_name, conf = db.resolve_drug_name(str(raw_gen))
-                    
-                    if conf > 60: # Threshold for match
-                        if canonical_name in processed_generics: continue
-                        processed_generics.add(canonical_name)
-                        
-                        details = db.get_drug_details_by_generic(canonical_name)
-                        if details:
-                            found_any = True
-                            local_report += f"\n[Generic: {canonical_name}]\n"
-                            if details['uses']: local_report += f"  - Uses: {details['uses']}\n"
-                            if details['side_effects']: local_report += f"  - Side Effects: {details['side_effects']}\n"
-                            if details['brands_sample']: local_report += f"  - Common Brands: {details['brands_sample']}\n"
+            for raw_gen in extracted_generics:
+                # Resolve API Generic Name -> Local DB Generic Key
+                entry = (resolved or {}).get(str(raw_gen).strip().lower())
+                canonical_name, conf, details = entry or _resolve_generic(raw_gen)
                 
-                if not found_any:
-                    local_report = "" # Hide section if nothing found in local DB
+                if conf > 60: # Threshold for match
+                    if canonical_name in processed_generics: continue
+                    processed_generics.add(canonical_name)
+                    
+                    if details:
+                        found_any = True
+                        local_report += f"\n[Generic: {canonical_name}]\n"
+                        if details['uses']: local_report += f"  - Uses: {details['uses']}\n"
+                        if details['side_effects']: local_report += f"  - Side Effects: {details['side_effects']}\n"
+                        if details['brands_sample']: local_report += f"  - Common Brands: {details['brands_sample']}\n"
+            
+            if not found_any:
+                local_report = "" # Hide section if nothing found in local DB
 
-        except Exception as local_e:
-            local_report = f"\n(Local Data Lookup Error: {local_e})"
+    except Exception as local_e:
+        local_report = f"\n(Local Data Lookup Error: {local_e})"
 
-        # 5. Strict Blacklist Filtering (User Request)
-        BLACKLIST = {
-            'phone', 'patient', 'date', 'physician', 'hospital', 'reg', 'dr', 'tab', 'cap',
-            'tablet', 'capsule', 'injection', 'inj', 'syrup', 'syp', 'clarify', 'age', 'sex',
-            'mr', 'mrs', 'name', 'address', 'signature', 'sign', 'department', 'unit', 'mobile'
-        }
-        
-        final_drug_list = []
-        for d in processed_generics:
-            if d.lower() not in BLACKLIST and len(d) > 2:
-                final_drug_list.append(d)
-                
-        # Format the final output matching output_preview.txt structure
-        formatted_output = f"""--- Step 1: Raw OCR Results (Puter) ---
+    return local_report, processed_generics
+
+# Local lookup + DDI prefetch on the raw OCR text while the enhancement call runs
+SPECULATIVE_LOOKUP = os.getenv("SPECULATIVE_LOOKUP", "1") != "0"
+SPECULATIVE_DDI_DEADLINE = float(os.getenv("SPECULATIVE_DDI_DEADLINE", "5"))
+# Budget for drugs/pairs the speculative check missed; this one runs after the LLM stages
+SPECULATIVE_RECHECK_DEADLINE = float(os.getenv("SPECULATIVE_RECHECK_DEADLINE", "1.5"))
+
+def speculative_lookup(generics):
+    """
+    Resolves the drugs already recognized in the raw OCR text (fast_path.assess)
+    against the local datasets and checks their interactions, so the RxNav and
+    local lookups overlap the LLM round-trip instead of following it.
+    Returns {'generics', 'resolved' (for local_lookup), 'ddi_result'}.
+    """
+    resolved = {}
+    for name in generics:
+        entry = _resolve_generic(name)
+        resolved[str(name).strip().lower()] = entry
+        # Gemini usually returns the canonical name itself
+        resolved.setdefault(entry[0].strip().lower(), entry)
+    ddi_result = drug_client.check_interactions(generics, deadline=SPECULATIVE_DDI_DEADLINE)
+    return {'generics': list(generics), 'resolved': resolved, 'ddi_result': ddi_result}
+
+def reconcile_interactions(speculative, drug_names):
+    """
+    The DDIResult for the final drug list: the speculative one when the enhanced
+    analysis found the same drugs. Otherwise only the new drugs are resolved and only
+    the pairs the speculative check did not cover are checked, within
+    SPECULATIVE_RECHECK_DEADLINE.
+    """
+    if not drug_names:
+        return None
+    if {d.lower() for d in speculative['generics']} == {d.lower() for d in drug_names}:
+        return speculative['ddi_result']
+    print("Speculative drug list differs from the analysis, checking the missing pairs")
+    session = DDISession()
+    if speculative['ddi_result'] is not None:
+        session.seed(speculative['ddi_result'])
+    with rxnav_deadline(SPECULATIVE_RECHECK_DEADLINE):
+        session.set_drugs(drug_names)
+        return session.result()
+
+# 5. Strict Blacklist Filtering (User Request)
+BLACKLIST = {
+    'phone', 'patient', 'date', 'physician', 'hospital', 'reg', 'dr', 'tab', 'cap',
+    'tablet', 'capsule', 'injection', 'inj', 'syrup', 'syp', 'clarify', 'age', 'sex',
+    'mr', 'mrs', 'name', 'address', 'signature', 'sign', 'department', 'unit', 'mobile'
+}
+
+def format_analysis_output(extracted_text, enhanced_text, analysis_result, local_report):
+    # Format the final output matching output_preview.txt structure
+    return f"""--- Step 1: Raw OCR Results (Puter) ---
 {extracted_text}
 ===============================================================================================
 
@@ -392,9 +580,227 @@ def analyze_prescription(image_path, patient_details=None):
 --- Step 4: Local Database Verification ---
 {local_report if local_report else "No local data found matching the identified drugs."}
 ================================================================================================"""
-        
-        # Return Tuple: (Output Text, List of Drugs Found)
-        return formatted_output, final_drug_list
 
+# OCR correction engine: "gemini" (enhance_ocr_text) or "local" (core/ocr_correct.py)
+ENHANCE_ENGINE = os.getenv("ENHANCE_ENGINE", "gemini")
+
+def run_analysis_pipeline(image_path, patient_details=None, use_cache=True, max_workers=4, structured=None,
+                          on_progress=None, mode=None, enhance_engine=None, ocr_text=None, trace=None,
+                          priority=None, reuse=None):
+    """
+    Runs the prescription analysis as a stage DAG; independent stages overlap:
+
+        preprocess -> ocr -> [reuse] -> [fast path] -> enhance -> analysis / generics / graph_data
+                                                    -> speculative --------> local_lookup
+
+    - structured: one analyze_structured call replaces the three LLM stages.
+    - on_progress(stage, text): OCR/enhanced text and the streaming analysis.
+    - mode: fast path selection (fast_path.use_fast_path).
+    - enhance_engine: "gemini" or "local" (ocr_correct.corrector).
+    - ocr_text / trace: skip preprocess + OCR / record into the caller's Trace.
+    - priority: rate limiter priority of the run's LLM calls.
+    - reuse(ocr_text): may return a finished result instead (stored analyses).
+    Returns a dict with text, drugs, analysis, graph_data, ddi_result, ocr_text,
+    enhanced_text, enhance_gate, timings and spans.
+    """
+    if structured is None:
+        structured = os.getenv("GEMINI_STRUCTURED", "0") == "1"
+
+    trace = trace or tracing.Trace()
+    if priority is None:
+        priority = limiter.current_priority()
+
+    def staged(name, fn):
+        # Spans, the cache bypass and the rate-limit priority are per thread; set them up inside the pool worker
+        def run(**kwargs):
+            with trace.span(name), limiter.priority(priority):
+                if use_cache:
+                    return fn(**kwargs)
+                with llm_cache.bypass():
+                    return fn(**kwargs)
+        return run
+
+    def preprocess():
+        # Usually already running since the image was picked (DashboardScreen.analyze_image)
+        return preprocessor.process(image_path)
+
+    def ocr(preprocess):
+        print(f"Starting OCR with Puter for {image_path} "
+              f"({preprocess.processed_bytes // 1024} KB upload, was {preprocess.original_bytes // 1024} KB)...")
+        start = time.time()
+        extracted_text = perform_ocr_puter(preprocess.path)
+        preprocessor.record_ocr(time.time() - start, preprocess.path != preprocess.source_path)
+        span = tracing.current_span()
+        if span:
+            span.model = "puter/gpt-4o-mini"
+            span.prompt_chars = preprocess.processed_bytes  # upload size
+            span.response_chars = len(extracted_text or "")
+        if "Error" in extracted_text or not extracted_text:
+            raise ValueError(extracted_text)
+        if on_progress: on_progress('ocr', extracted_text)
+        return extracted_text
+
+    gate = {}
+
+    def enhance(ocr):
+        enhanced_text = ocr
+        if (enhance_engine or ENHANCE_ENGINE) == 'local':
+            enhanced_text = corrector.correct_text(ocr)
+        elif api_key:
+            # Confidence gate: clean OCR text goes straight to the analysis stages
+            quality = enhance_gate.decide(ocr, assessment)
+            gate.update(quality.to_dict())
+            if quality.skip:
+                saved = enhance_gate.average_enhancement()
+                print(f"Skipping OCR enhancement ({quality.reason}; saves ~{saved or 0:.1f}s)")
+            else:
+                start = time.time()
+                enhanced_text = enhance_ocr_text(ocr)
+                enhance_gate.record_enhancement(time.time() - start)
+        if on_progress: on_progress('enhance', enhanced_text)
+        return enhanced_text
+
+    def analysis(enhance):
+        # Stream partial analysis to the caller as it arrives
+        on_chunk = (lambda partial: on_progress('analysis', clean_markdown_to_text(partial))) if on_progress else None
+        # Convert to pure text
+        return clean_markdown_to_text(analyze_text(enhance, patient_details, on_chunk=on_chunk,
+                                                   drugs=assessment.generics))
+
+    def generics(enhance):
+        # Use Gemini to get Generics explicitly
+        return extract_generics_gemini(enhance)
+
+    def speculative(ocr):
+        # The gate already scanned and resolved the raw OCR text
+        return speculative_lookup(assessment.generics)
+
+    def lookup(generics, speculative):
+        local_report, processed_generics = local_lookup(generics, speculative and speculative['resolved'])
+        ddi_result = None
+        if speculative is not None:
+            ddi_result = reconcile_interactions(
+                speculative, [d for d in processed_generics if d.lower() not in BLACKLIST and len(d) > 2])
+        return local_report, processed_generics, ddi_result
+
+    def graph_data(enhance):
+        return GraphData.from_dict(extract_extended_graph_data_gemini(enhance, patient_details,
+                                                                      drugs=assessment.generics))
+
+    def multi_call(enhance):
+        # The three independent LLM stages, run concurrently
+        results, _ = run_stages([
+            Stage('analysis', staged('analysis', analysis)),
+            Stage('generics', staged('generics', generics), optional=True),
+            Stage('graph_data', staged('graph_data', graph_data), optional=True),
+        ], inputs={'enhance': enhance}, max_workers=max_workers)
+        return PrescriptionAnalysis(results['analysis'], list(results['generics'] or []), results['graph_data'])
+
+    def single_call(enhance):
+        result = analyze_structured(enhance, patient_details, drugs=assessment.generics)
+        if result is None:
+            print("Structured analysis failed, falling back to separate calls")
+            return multi_call(enhance)
+        result.analysis_text = clean_markdown_to_text(result.analysis_text)
+        return result
+
+    def failure(stage, error):
+        failed = {'drugs': [], 'analysis': None, 'graph_data': None, 'timings': {}, 'spans': trace.to_list()}
+        if stage == 'ocr':
+            return dict(failed, text=f"OCR Failed: {error}")
+        return dict(failed, text=f"Error during analysis: {str(error)}")
+
+    if ocr_text is not None:
+        results, timings = {'ocr': ocr_text}, {}
+    else:
+        try:
+            results, timings = run_stages([
+                Stage('preprocess', staged('preprocess', preprocess)),
+                Stage('ocr', staged('ocr', ocr), deps=['preprocess']),
+            ], max_workers=max_workers)
+        except StageError as e:
+            return failure(e.stage, e.error)
+
+    try:
+        if reuse is not None:
+            with trace.span('reuse_check'):
+                reused = reuse(results['ocr'])
+            if reused is not None:
+                return dict(reused, ocr_text=results['ocr'], timings=timings, spans=trace.to_list())
+
+        # Fast-path gate: finish locally when the OCR text resolves confidently offline
+        with trace.span('fast_path_gate'):
+            assessment = fast_path.assess(results['ocr'])
+        if fast_path.use_fast_path(assessment, mode):
+            print(f"Local fast path: {len(assessment.resolved)}/{len(assessment.candidates)} drug candidates resolved")
+            with trace.span('local_analysis'):
+                result = fast_path.analyze_locally(results['ocr'], patient_details, assessment)
+            print(f"Analysis stage timings:\n{trace.summary()}")
+            return dict(result, ocr_text=results['ocr'], timings=timings, spans=trace.to_list())
     except Exception as e:
-        return f"Error during analysis: {str(e)}", []
+        print(f"Analysis failed before the LLM stages: {e}")
+        return failure('analysis', e)
+
+    offset = trace.total()
+    stages = [Stage('enhance', staged('enhance', enhance), deps=['ocr'])]
+    inputs = {'ocr': results['ocr']}
+    if SPECULATIVE_LOOKUP and assessment.generics:
+        # Runs next to enhance; a failure only costs the speedup
+        stages.append(Stage('speculative', staged('speculative', speculative), deps=['ocr'], optional=True))
+    else:
+        inputs['speculative'] = None
+    if structured:
+        stages += [
+            Stage('structured', staged('structured', single_call), deps=['enhance']),
+            Stage('analysis', lambda structured: structured.analysis_text, deps=['structured']),
+            Stage('generics', lambda structured: structured.generics, deps=['structured']),
+            Stage('graph_data', lambda structured: structured.graph, deps=['structured']),
+        ]
+    else:
+        stages += [
+            Stage('analysis', staged('analysis', analysis), deps=['enhance']),
+            Stage('generics', staged('generics', generics), deps=['enhance'], optional=True),
+            Stage('graph_data', staged('graph_data', graph_data), deps=['enhance'], optional=True),
+        ]
+    stages.append(Stage('local_lookup', staged('local_lookup', lookup), deps=['generics', 'speculative']))
+
+    try:
+        results, llm_timings = run_stages(stages, max_workers=max_workers, inputs=inputs)
+    except StageError as e:
+        return failure(e.stage, e.error)
+    timings.update({name: (start + offset, end + offset) for name, (start, end) in llm_timings.items()})
+
+    local_report, processed_generics, ddi_result = results['local_lookup']
+    final_drug_list = []
+    for d in processed_generics:
+        if d.lower() not in BLACKLIST and len(d) > 2:
+            final_drug_list.append(d)
+
+    print(f"Analysis stage timings:\n{trace.summary()}")
+    return {
+        'text': format_analysis_output(results['ocr'], results['enhance'], results['analysis'], local_report),
+        'drugs': final_drug_list,
+        'analysis': results.get('structured') or PrescriptionAnalysis(
+            results['analysis'], list(results['generics'] or []), results['graph_data']),
+        'graph_data': results['graph_data'],
+        'enhanced_text': results['enhance'],
+        'ocr_text': results['ocr'],
+        'enhance_gate': gate or None,
+        'ddi_result': ddi_result,
+        'timings': timings,
+        'spans': trace.to_list(),
+    }
+
+def analyze_prescription(image_path, patient_details=None, use_cache=True):
+    """
+    Orchestrates the analysis:
+    1. Puter OCR -> Raw Text
+    2. Gemini -> Enhanced Text (Correction)
+    3. Gemini -> Analysis (DDI)
+    4. Gemini -> Extract Generics -> Local Data Lookup
+    Steps 3 and 4 run concurrently (see run_analysis_pipeline).
+    use_cache=False forces fresh LLM responses (the LLM response cache is bypassed).
+    """
+    result = run_analysis_pipeline(image_path, patient_details, use_cache=use_cache)
+    # Return Tuple: (Output Text, List of Drugs Found)
+    return result['text'], result['drugs']
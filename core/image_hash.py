@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import difflib
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+HASH_BANDS = 4
+# Near-duplicate threshold in differing bits of the 64-bit hash. The database lookup
+# splits hashes into 4 bands of 16 bits, so only hashes within 3 bits are sure to share a band.
+IMAGE_DEDUPE_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUPE_MAX_DISTANCE", "3"))
+if not 0 <= IMAGE_DEDUPE_MAX_DISTANCE < HASH_BANDS:
+    logger.warning(f"IMAGE_DEDUPE_MAX_DISTANCE={IMAGE_DEDUPE_MAX_DISTANCE} outside 0-{HASH_BANDS - 1}, clamping")
+    IMAGE_DEDUPE_MAX_DISTANCE = min(max(IMAGE_DEDUPE_MAX_DISTANCE, 0), HASH_BANDS - 1)
+IMAGE_DEDUPE = os.getenv("IMAGE_DEDUPE", "1") != "0"
+# The image hash only captures the page layout; the OCR text must match this closely too
+IMAGE_DEDUPE_MIN_TEXT_SIMILARITY = float(os.getenv("IMAGE_DEDUPE_MIN_TEXT_SIMILARITY", "0.9"))
+
+def dhash(image_path, hash_size=8):
+    """
+    Difference hash: the image is shrunk to (hash_size + 1) x hash_size grayscale
+    pixels and each bit says whether a pixel is brighter than its right neighbour.
+    Survives re-compression, resizing and small crops/brightness changes.
+    Returns a 64-bit int (for hash_size=8).
+    """
+    with Image.open(image_path) as img:
+        img.draft('L', (hash_size * 8, hash_size * 8))  # fast JPEG decode at reduced size
+        img = ImageOps.exif_transpose(img).convert('L')
+        img = img.resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = img.tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | int(left > right)
+    return value
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+def bands(image_hash):
+    """The 16-bit bands of a 64-bit hash (used as indexed lookup keys)."""
+    return [(image_hash >> (16 * i)) & 0xFFFF for i in range(HASH_BANDS)]
+
+def patient_key(patient_details):
+    """Stable key of the patient details; a stored analysis is only reused for the same patient."""
+    fields = ('name', 'age', 'gender', 'weight', 'body_type')
+    normalized = {f: str((patient_details or {}).get(f, '')).strip().lower() for f in fields}
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+def _normalize_text(text):
+    return " ".join(re.findall(r'\w+', (text or "").lower()))
+
+def content_signature(ocr_text):
+    """The drug candidates and every token containing a digit (strengths, frequencies, durations, dates)."""
+    from core.drug_client import extract_potential_drugs
+    drugs = sorted({d.lower() for d in extract_potential_drugs(ocr_text or "")})
+    numbers = sorted(re.findall(r'\w*\d[\w./-]*', (ocr_text or "").lower()))
+    return drugs, numbers
+
+def same_content(stored_ocr_text, ocr_text):
+    """
+    Whether two OCR texts are the same prescription: the same drugs and numbers and
+    nearly the same wording. A matching image hash alone only means the same letterhead.
+    """
+    if not stored_ocr_text or not ocr_text:
+        return False
+    if content_signature(stored_ocr_text) != content_signature(ocr_text):
+        return False
+    similarity = difflib.SequenceMatcher(None, _normalize_text(stored_ocr_text), _normalize_text(ocr_text)).ratio()
+    return similarity >= IMAGE_DEDUPE_MIN_TEXT_SIMILARITY
+
+class ImageHasher:
+    """
+    Computes image hashes on a small worker pool so hashing can start as soon as an
+    image is picked (DashboardScreen.analyze_image) and be collected later.
+    """
+    def __init__(self, max_workers=1, enabled=None):
+        self.enabled = enabled if enabled is not None else IMAGE_DEDUPE
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="img-hash")
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def _safe_hash(self, image_path):
+        try:
+            return dhash(image_path)
+        except Exception as e:
+            logger.warning(f"Image hashing failed for {image_path}: {e}")
+            return None
+
+    def submit(self, image_path):
+        if not self.enabled:
+            return None
+        key = os.path.abspath(image_path)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pool.submit(self._safe_hash, image_path)
+                self._pending[key] = future
+        return future
+
+    def get(self, image_path):
+        """The hash of image_path (waits for a running submit()), or None if disabled/unreadable."""
+        future = self.submit(image_path)
+        if future is None:
+            return None
+        result = future.result()
+        with self._lock:
+            self._pending.pop(os.path.abspath(image_path), None)
+        return result
+
+# Global instance
+hasher = ImageHasher()
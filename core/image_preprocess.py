@@ -0,0 +1,159 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest side after downscaling: enough for OCR of prescription text, far below phone-camera sizes
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1600"))
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", os.path.join(os.getcwd(), ".image_cache"))
+IMAGE_CACHE_MAX_FILES = int(os.getenv("IMAGE_CACHE_MAX_FILES", "200"))
+
+@dataclass
+class ProcessedImage:
+    """An OCR-ready copy of an input image (or the original, if processing was skipped/failed)."""
+    path: str
+    source_path: str
+    original_bytes: int
+    processed_bytes: int
+    size: tuple = (0, 0)
+    seconds: float = 0.0
+    cached: bool = False
+
+    @property
+    def bytes_saved(self):
+        return max(self.original_bytes - self.processed_bytes, 0)
+
+class ImagePreprocessor:
+    """
+    Shrinks prescription photos before OCR: EXIF orientation, grayscale, contrast
+    normalization, downscale to IMAGE_MAX_SIDE and JPEG re-encode. Work runs on a small
+    worker pool (submit() can start while the user is still filling in the form) and
+    results are cached on disk by content hash.
+    """
+    def __init__(self, cache_dir=IMAGE_CACHE_DIR, max_side=IMAGE_MAX_SIDE, quality=IMAGE_QUALITY,
+                 max_workers=2, enabled=None):
+        self.cache_dir = cache_dir
+        self.max_side = max_side
+        self.quality = quality
+        self.enabled = enabled if enabled is not None else os.getenv("IMAGE_PREPROCESS", "1") != "0"
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="img-preprocess")
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._stats = {'images': 0, 'cache_hits': 0, 'bytes_in': 0, 'bytes_out': 0, 'seconds': 0.0}
+        self._ocr = {'preprocessed': [], 'original': []}
+
+    def _cache_path(self, image_path):
+        h = hashlib.sha256()
+        with open(image_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+        h.update(f"{self.max_side}:{self.quality}".encode())
+        return os.path.join(self.cache_dir, f"{h.hexdigest()[:32]}.jpg")
+
+    def _process(self, image_path):
+        start = time.time()
+        original_bytes = os.path.getsize(image_path)
+        out_path = self._cache_path(image_path)
+
+        if os.path.exists(out_path):
+            os.utime(out_path)  # keeps recently used files out of eviction
+            result = ProcessedImage(out_path, image_path, original_bytes, os.path.getsize(out_path),
+                                    seconds=time.time() - start, cached=True)
+        else:
+            with Image.open(image_path) as img:
+                img = ImageOps.exif_transpose(img)
+                img = img.convert('L')
+                img = ImageOps.autocontrast(img, cutoff=1)
+                if max(img.size) > self.max_side:
+                    img.thumbnail((self.max_side, self.max_side), Image.LANCZOS)
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = out_path + ".tmp"
+                img.save(tmp_path, format='JPEG', quality=self.quality, optimize=True)
+                size = img.size
+            os.replace(tmp_path, out_path)
+            self._evict()
+            result = ProcessedImage(out_path, image_path, original_bytes, os.path.getsize(out_path),
+                                    size=size, seconds=time.time() - start)
+
+        # Never upload something bigger than the original (e.g. an already tiny PNG scan)
+        if result.processed_bytes >= original_bytes:
+            result = ProcessedImage(image_path, image_path, original_bytes, original_bytes,
+                                    seconds=result.seconds, cached=result.cached)
+
+        with self._lock:
+            self._stats['images'] += 1
+            self._stats['cache_hits'] += int(result.cached)
+            self._stats['bytes_in'] += result.original_bytes
+            self._stats['bytes_out'] += result.processed_bytes
+            self._stats['seconds'] += result.seconds
+        return result
+
+    def _evict(self):
+        try:
+            files = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.jpg')]
+        except OSError:
+            return
+        if len(files) <= IMAGE_CACHE_MAX_FILES:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - IMAGE_CACHE_MAX_FILES]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _safe_process(self, image_path):
+        try:
+            return self._process(image_path)
+        except Exception as e:
+            # OCR still works on the original; pre-processing is only an optimization
+            logger.warning(f"Image pre-processing failed for {image_path}: {e}")
+            size = os.path.getsize(image_path) if os.path.exists(image_path) else 0
+            return ProcessedImage(image_path, image_path, size, size)
+
+    def submit(self, image_path):
+        """Starts (or joins) pre-processing of image_path on the worker pool; returns a Future."""
+        key = os.path.abspath(image_path)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None or (future.done() and future.exception()):
+                future = self._pool.submit(self._safe_process, image_path)
+                self._pending[key] = future
+        return future
+
+    def process(self, image_path):
+        """Returns a ProcessedImage, waiting for a running submit() of the same file if any."""
+        if not self.enabled or not os.path.exists(image_path):
+            size = os.path.getsize(image_path) if os.path.exists(image_path) else 0
+            return ProcessedImage(image_path, image_path, size, size)
+        result = self.submit(image_path).result()
+        with self._lock:
+            self._pending.pop(os.path.abspath(image_path), None)
+        return result
+
+    def record_ocr(self, seconds, preprocessed):
+        """Records OCR latency so runs with and without pre-processing can be compared."""
+        with self._lock:
+            samples = self._ocr['preprocessed' if preprocessed else 'original']
+            samples.append(seconds)
+            del samples[:-100]
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+            avg = lambda xs: sum(xs) / len(xs) if xs else None
+            s['bytes_saved'] = s['bytes_in'] - s['bytes_out']
+            s['ocr_avg_preprocessed'] = avg(self._ocr['preprocessed'])
+            s['ocr_avg_original'] = avg(self._ocr['original'])
+        return s
+
+# Global instance
+preprocessor = ImagePreprocessor()
@@ -7,22 +7,33 @@ class KnowledgeGraphManager:
     def __init__(self):
         self.output_path = "knowledge_graph.png"
         
-    def generate_graph(self, drug_names=None, full_text=None):
+    def generate_graph(self, drug_names=None, full_text=None, ddi_result=None, graph_data=None):
         """
         Generates the 'Integrated Patient & DDI Analysis' Graph.
         Visuals: Patient (Center) -> Diagnosis (Top) -> Drugs (Surrounding)
         Edges: Green (Protective), Red (Risk), Blue (Standard Flow)
+        If graph_data (dict or GraphData) is given, it is used directly and no Gemini
+        call is made. The interactions of a structured ddi_result (DDIResult) are
+        added to the graph data as Risk edges.
         """
-        # 1. Get Data from Gemini
-        from core.gemini_client import extract_extended_graph_data_gemini
-        
-        # Prefer full text context if available
-        if full_text:
-            context_text = full_text
-        else:
-            context_text = f"Prescribed Drugs: {', '.join(drug_names) if drug_names else 'None'}"
-        
-        data = extract_extended_graph_data_gemini(context_text)
+        # 1. Get Data (structured input first, Gemini otherwise)
+        data = graph_data.to_dict() if hasattr(graph_data, 'to_dict') else graph_data
+
+        if not data:
+            from core.gemini_client import extract_extended_graph_data_gemini
+            
+            # Prefer full text context if available
+            if full_text:
+                context_text = full_text
+            else:
+                context_text = f"Prescribed Drugs: {', '.join(drug_names) if drug_names else 'None'}"
+            
+            # The prompt is compacted; the known drug names replace what was stripped
+            data = extract_extended_graph_data_gemini(context_text, drugs=drug_names if full_text else None)
+
+        # Confirmed interactions complement (never replace) the diagnosis and Treats/Protective edges
+        if ddi_result is not None and ddi_result.found_drugs:
+            data = ddi_result.merge_graph_data(data)
         
         if not data:
             # Fallback Dummy Data if API Fails
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "llm_cache.db")
+# Size bound: least recently used responses are evicted beyond this many bytes of text
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+def cache_key(model_name, prompt, generation_config=None):
+    """Content address of one request: model + prompt + generation config."""
+    payload = json.dumps({
+        'model': model_name,
+        'prompt': prompt,
+        'config': generation_config or {}
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class LLMCache:
+    """
+    On-disk cache of full LLM text responses keyed on (model, prompt hash, generation config).
+    Deterministic prompts (re-exports, re-opened history, repeated manual entries) are
+    answered from here instead of the API.
+    """
+    def __init__(self, path=LLM_CACHE_DB, max_bytes=LLM_CACHE_MAX_BYTES, enabled=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled if enabled is not None else os.getenv("LLM_CACHE", "1") != "0"
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            self._local.conn = conn
+            with self._init_lock:
+                if not self._initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute('''
+                        CREATE TABLE IF NOT EXISTS responses (
+                            key TEXT PRIMARY KEY,
+                            model TEXT,
+                            response TEXT NOT NULL,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_used REAL NOT NULL
+                        )
+                    ''')
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+                    conn.commit()
+                    self._initialized = True
+        return conn
+
+    @property
+    def active(self):
+        """False when disabled globally (LLM_CACHE=0) or bypassed in this thread."""
+        return self.enabled and not getattr(self._local, 'bypass', False)
+
+    @contextmanager
+    def bypass(self):
+        """Skips the cache (reads and writes) for calls made inside the block, in this thread."""
+        previous = getattr(self._local, 'bypass', False)
+        self._local.bypass = True
+        try:
+            yield
+        finally:
+            self._local.bypass = previous
+
+    def get(self, key):
+        if not self.active:
+            return None
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache error: {e}")
+            return None
+
+    def set(self, key, response, model_name=None):
+        if not self.active or not response:
+            return
+        try:
+            conn = self._conn()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model_name, response, len(response.encode('utf-8')), now, now)
+            )
+            conn.commit()
+            self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache error: {e}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we are back under the bound
+        rows = conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall()
+        doomed = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+        conn.commit()
+
+    def stats(self):
+        info = {'enabled': self.enabled, 'hits': self.hits, 'misses': self.misses, 'entries': 0, 'bytes': 0}
+        if not self.enabled:
+            return info
+        try:
+            count, size = self._conn().execute("SELECT count(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            info.update(entries=count, bytes=size)
+        except sqlite3.Error:
+            pass
+        return info
+
+    def clear(self):
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache error: {e}")
+
+# Global instance
+llm_cache = LLMCache()
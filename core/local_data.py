@@ -4,6 +4,7 @@ import difflib
 import logging
 import json
 import ast
+import threading
 
 # Try to import fuzzy matching library
 HAS_FUZZY = False
@@ -27,19 +28,24 @@ class LocalDrugDB:
         self.prefix_map = {}
         self.common_names = set()
         self.loaded = False
+        self._load_lock = threading.Lock()
         
     def load_data(self):
         if self.loaded:
             return
 
-        logger.info("Loading local drug databases...")
-        # 1. Load DrugBank
-        self._load_drugbank()
-        
-        # 2. Load Indian Datasets
-        self._load_indian_datasets()
-        
-        self.loaded = True
+        # Concurrent first lookups (e.g. batch resolution) load the datasets once
+        with self._load_lock:
+            if self.loaded:
+                return
+            logger.info("Loading local drug databases...")
+            # 1. Load DrugBank
+            self._load_drugbank()
+
+            # 2. Load Indian Datasets
+            self._load_indian_datasets()
+
+            self.loaded = True
         logger.info(f"Local DB loaded. {len(self.drug_map)} identifiable drugs.")
 
     def _add_to_map(self, key, entry):
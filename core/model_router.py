@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+from collections import deque
+
+import google.generativeai as genai
+
+MODEL_FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", "2"))
+MODEL_COOLDOWN = float(os.getenv("MODEL_COOLDOWN", "60"))
+
+def is_quota_error(error):
+    text = str(error).lower()
+    return '429' in text or 'quota' in text or 'resource exhausted' in text or 'resource_exhausted' in text
+
+class _ModelHealth:
+    def __init__(self, window):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.last_error = None
+        self.latencies = deque(maxlen=window)
+
+class ModelRouter:
+    """
+    Shared routing for the Gemini fallback chains. Remembers per-model failures and
+    latency, moves models that keep failing to the back of the chain for a cool-down
+    period (quota errors cool down immediately), and reuses GenerativeModel objects.
+    """
+    def __init__(self, failure_threshold=MODEL_FAILURE_THRESHOLD, cooldown=MODEL_COOLDOWN, window=200):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.window = window
+        self._lock = threading.Lock()
+        self._health = {}
+        self._models = {}
+
+    def _get(self, model_name):
+        health = self._health.get(model_name)
+        if health is None:
+            health = self._health[model_name] = _ModelHealth(self.window)
+        return health
+
+    def model(self, model_name):
+        """Returns the (cached) GenerativeModel for model_name."""
+        with self._lock:
+            model = self._models.get(model_name)
+            if model is None:
+                model = self._models[model_name] = genai.GenerativeModel(model_name)
+            return model
+
+    def is_healthy(self, model_name):
+        with self._lock:
+            return self._get(model_name).cooldown_until <= time.time()
+
+    def order(self, models_to_try):
+        """
+        The chain to try: healthy models in their configured order, then models still
+        cooling down (soonest available first) as a last resort.
+        """
+        now = time.time()
+        with self._lock:
+            healthy = [m for m in models_to_try if self._get(m).cooldown_until <= now]
+            cooling = sorted((m for m in models_to_try if m not in healthy), key=lambda m: self._get(m).cooldown_until)
+        return healthy + cooling
+
+    def record_success(self, model_name, latency):
+        with self._lock:
+            health = self._get(model_name)
+            health.calls += 1
+            health.successes += 1
+            health.consecutive_failures = 0
+            health.cooldown_until = 0.0
+            health.latencies.append(latency)
+
+    def record_failure(self, model_name, error=None):
+        with self._lock:
+            health = self._get(model_name)
+            health.calls += 1
+            health.failures += 1
+            health.consecutive_failures += 1
+            health.last_error = str(error) if error else None
+            if is_quota_error(error) or health.consecutive_failures >= self.failure_threshold:
+                health.cooldown_until = time.time() + self.cooldown
+
+    def stats(self):
+        """Per model: calls, success rate, p50/p95 latency (seconds), cooling down, last error."""
+        now = time.time()
+        out = {}
+        with self._lock:
+            for name, h in self._health.items():
+                lat = sorted(h.latencies)
+                pick = lambda q: lat[min(len(lat) - 1, int(q * len(lat)))] if lat else None
+                out[name] = {
+                    'calls': h.calls,
+                    'success_rate': h.successes / h.calls if h.calls else None,
+                    'p50': pick(0.50),
+                    'p95': pick(0.95),
+                    'cooling_down': max(h.cooldown_until - now, 0),
+                    'last_error': h.last_error,
+                }
+        return out
+
+    def format_stats(self):
+        lines = []
+        for name, s in self.stats().items():
+            rate = f"{s['success_rate'] * 100:.0f}%" if s['success_rate'] is not None else "n/a"
+            p95 = f"{s['p95']:.2f}s" if s['p95'] is not None else "n/a"
+            line = f"{name}: {s['calls']} calls, {rate} success, p95 {p95}"
+            if s['cooling_down']:
+                line += f" (cooling down {s['cooling_down']:.0f}s)"
+            lines.append(line)
+        return "\n".join(lines) if lines else "No Gemini calls yet."
+
+    def reset(self):
+        with self._lock:
+            self._health.clear()
+            self._models.clear()
+
+# Global instance
+router = ModelRouter()
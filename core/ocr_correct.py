@@ -0,0 +1,171 @@
+import os
+import re
+import time
+import threading
+
+from core.ocr_quality import DOSAGE_FORMS, RX_LEXICON, drug_vocabulary
+
+OCR_CORRECT_MAX_DISTANCE = int(os.getenv("OCR_CORRECT_MAX_DISTANCE", "2"))
+# Only the first characters of a word go into the delete index (keeps it small)
+OCR_CORRECT_PREFIX = int(os.getenv("OCR_CORRECT_PREFIX", "7"))
+
+# Characters OCR commonly reads instead of letters
+_CONFUSIONS = str.maketrans({'0': 'o', '1': 'l', '4': 'a', '5': 's', '8': 'b', '@': 'a', '|': 'l', '$': 's'})
+_TOKEN = re.compile(r"[A-Za-z0-9@|$]+")
+_DOSAGE = re.compile(r'^\d+([.,/:-]\d+)*(mg|mcg|g|gm|ml|iu|units?|x)?$', re.IGNORECASE)
+# A strength such as "75mg", "0.5 ml" or "2%" marks a drug line
+_STRENGTH = re.compile(r'\d\s*(mg|mcg|gm?|ml|iu|units?|%)(?![A-Za-z])', re.IGNORECASE)
+# Lexicon words win ties against drug-name words at the same edit distance
+_LEXICON_WEIGHT = 1000
+
+def edit_distance(a, b, max_distance):
+    """Optimal string alignment distance (adjacent swaps count as one edit); max_distance + 1 if larger."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+class OCRCorrector:
+    """
+    Local replacement for the Gemini OCR correction: each word of the OCR text is
+    corrected against the LocalDrugDB vocabulary plus the prescription lexicon
+    (dosage forms, frequencies, units). Drug names are only proposed on drug lines
+    (a dosage form or a strength on the line), so patient and doctor names or
+    diagnoses are never turned into brands; other lines get lexicon corrections only.
+    Lookups use a symmetric-delete index, so a word is matched by generating its
+    deletions instead of scanning the vocabulary. The index is built on first use.
+    """
+    def __init__(self, max_distance=OCR_CORRECT_MAX_DISTANCE, prefix_length=OCR_CORRECT_PREFIX, words=None):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self._words = words  # word -> frequency; None = LocalDrugDB + lexicon
+        self._lexicon = None
+        self._index = None
+        self._lock = threading.Lock()
+        self._stats = {'texts': 0, 'tokens': 0, 'corrected': 0, 'seconds': 0.0, 'build_seconds': 0.0}
+
+    def _deletes(self, word, distance):
+        results = {word}
+        frontier = {word}
+        for _ in range(distance):
+            frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))} - results
+            results |= frontier
+        return results
+
+    def _build(self):
+        with self._lock:
+            if self._index is not None:
+                return
+            start = time.time()
+            words = self._words
+            if words is None:
+                words = {w: len(keys) for w, keys in drug_vocabulary().items() if w.isalpha()}
+                for w in RX_LEXICON:
+                    words[w] = words.get(w, 0) + _LEXICON_WEIGHT
+            index = {}
+            for word in words:
+                for d in self._deletes(word[:self.prefix_length], self.max_distance):
+                    index.setdefault(d, []).append(word)
+            self._words = words
+            self._lexicon = {w for w in words if w in RX_LEXICON}
+            self._index = index
+            self._stats['build_seconds'] = time.time() - start
+
+    def allowed_distance(self, word):
+        # Short words have too many close neighbours to correct safely
+        if len(word) <= 3:
+            return 0
+        return min(1 if len(word) <= 6 else 2, self.max_distance)
+
+    def lookup(self, word, lexicon_only=False):
+        """Returns the best vocabulary word for `word` (lower case), or None."""
+        self._build()
+        word = word.lower()
+        allowed = self._lexicon if lexicon_only else self._words
+        if word in allowed:
+            return word
+        if word in self._words:
+            return None  # a known drug word outside a drug line is left alone
+        max_distance = self.allowed_distance(word)
+        if not max_distance:
+            return None
+        best = None
+        seen = set()
+        for d in self._deletes(word[:self.prefix_length], max_distance):
+            for candidate in self._index.get(d, ()):
+                if candidate in seen or candidate not in allowed:
+                    continue
+                seen.add(candidate)
+                distance = edit_distance(word, candidate, max_distance)
+                if distance > max_distance:
+                    continue
+                rank = (distance, -self._words[candidate], candidate)
+                if best is None or rank < best:
+                    best = rank
+        return best[2] if best else None
+
+    def correct_token(self, token, lexicon_only=False):
+        if _DOSAGE.match(token) or len(token) < 2 or not any(c.isalpha() for c in token):
+            return token
+        word = token.translate(_CONFUSIONS) if not token.isalpha() else token
+        if not word.isalpha():
+            return token
+        match = self.lookup(word, lexicon_only)
+        if match is None:
+            return token
+        if token.isupper():
+            return match.upper()
+        if token[0].isupper():
+            return match.capitalize()
+        return match
+
+    def is_drug_line(self, line):
+        """True if the line has a strength or a (possibly misread) dosage form."""
+        if _STRENGTH.search(line):
+            return True
+        return any(self.correct_token(t, lexicon_only=True).lower() in DOSAGE_FORMS
+                   for t in _TOKEN.findall(line))
+
+    def correct_text(self, text):
+        """Returns `text` with OCR typos corrected; layout and punctuation are kept."""
+        self._build()
+        start = time.time()
+        counts = {'tokens': 0, 'corrected': 0}
+
+        def fixer(lexicon_only):
+            def fix(m):
+                token = m.group(0)
+                fixed = self.correct_token(token, lexicon_only)
+                counts['tokens'] += 1
+                counts['corrected'] += int(fixed.lower() != token.lower())
+                return fixed
+            return fix
+
+        corrected = "".join(_TOKEN.sub(fixer(not self.is_drug_line(line)), line)
+                            for line in (text or "").splitlines(keepends=True))
+        with self._lock:
+            self._stats['texts'] += 1
+            self._stats['tokens'] += counts['tokens']
+            self._stats['corrected'] += counts['corrected']
+            self._stats['seconds'] += time.time() - start
+        return corrected
+
+    def stats(self):
+        with self._lock:
+            s = dict(self._stats)
+        s['vocabulary'] = len(self._words) if self._index is not None else 0
+        return s
+
+# Global instance
+corrector = OCRCorrector()
@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+from collections import deque
+from dataclasses import dataclass, asdict
+
+from core.local_data import db
+
+# Skip Gemini enhancement when the raw OCR text already scores at least this well
+ENHANCE_GATE = os.getenv("ENHANCE_GATE", "1") != "0"
+GATE_MIN_DRUG_RATIO = float(os.getenv("GATE_MIN_DRUG_RATIO", "0.6"))
+GATE_MIN_COVERAGE = float(os.getenv("GATE_MIN_COVERAGE", "0.7"))
+GATE_MAX_GARBAGE = float(os.getenv("GATE_MAX_GARBAGE", "0.1"))
+
+DOSAGE_FORMS = {
+    'tab', 'tabs', 'tablet', 'tablets', 'cap', 'caps', 'capsule', 'capsules', 'syp', 'syrup', 'susp',
+    'suspension', 'inj', 'injection', 'drop', 'drops', 'cream', 'ointment', 'oint', 'gel', 'lotion',
+    'sachet', 'inhaler', 'spray', 'solution', 'sol', 'powder', 'patch',
+}
+
+# Words that are expected in a prescription besides drug names
+RX_LEXICON = DOSAGE_FORMS | {
+    # frequencies and timing
+    'od', 'bd', 'bid', 'tds', 'tid', 'qid', 'qds', 'hs', 'sos', 'prn', 'stat', 'ac', 'pc', 'daily',
+    'once', 'twice', 'thrice', 'weekly', 'morning', 'noon', 'afternoon', 'evening', 'night', 'bedtime',
+    'before', 'after', 'with', 'food', 'meal', 'meals', 'breakfast', 'lunch', 'dinner', 'empty', 'stomach',
+    'every', 'hours', 'hrs', 'day', 'days', 'week', 'weeks', 'month', 'months', 'times',
+    # units
+    'mg', 'mcg', 'g', 'gm', 'ml', 'iu', 'unit', 'units',
+    # routes and instructions
+    'oral', 'orally', 'apply', 'take', 'continue', 'stop', 'if', 'needed', 'for', 'pain', 'fever',
+    'one', 'two', 'three', 'half', 'and', 'or', 'the', 'of', 'to', 'in', 'x', 'a', 'at',
+    # header words
+    'rx', 'dr', 'patient', 'name', 'age', 'sex', 'male', 'female', 'm', 'f', 'yrs', 'years', 'kg',
+    'date', 'dx', 'diagnosis', 'clinic', 'hospital', 'mbbs', 'md', 'ms', 'signature', 'address',
+    'review', 'follow', 'up', 'advice', 'adv',
+}
+
+_DOSAGE = re.compile(r'^\d+([.,/:-]\d+)*(mg|mcg|g|gm|ml|iu|units?|%|x)?$', re.IGNORECASE)
+_WORD = re.compile(r'^[A-Za-z]+$')
+
+def drug_vocabulary():
+    """First words of every LocalDrugDB brand/generic name (empty if the datasets are missing)."""
+    if not db.loaded:
+        db.load_data()
+    return db.prefix_map
+
+@dataclass
+class OCRQuality:
+    """Local quality score of raw OCR text; `skip` means Gemini enhancement is not needed."""
+    tokens: int = 0
+    drug_ratio: float = 0.0   # drug candidates resolving in LocalDrugDB
+    coverage: float = 0.0     # words found in the drug vocabulary or prescription lexicon
+    garbage: float = 0.0      # tokens that are neither words nor numbers/dosages
+    skip: bool = False
+    reason: str = ''
+
+    def to_dict(self):
+        return asdict(self)
+
+def score_text(text, assessment=None):
+    """
+    Scores raw OCR text without any network call. `assessment` is a fast_path
+    LocalAssessment of the same text, if one was already computed.
+    """
+    from core import fast_path
+
+    assessment = assessment or fast_path.assess(text or "")
+    vocabulary = drug_vocabulary()
+    words = garbage = 0
+    known = 0
+    tokens = (text or "").split()
+    for token in tokens:
+        t = token.strip('.,;:()[]"\'*-')
+        if not t:
+            continue
+        if _WORD.match(t):
+            words += 1
+            lower = t.lower()
+            if lower in RX_LEXICON or lower in vocabulary:
+                known += 1
+        elif not _DOSAGE.match(t):
+            garbage += 1
+
+    quality = OCRQuality(
+        tokens=len(tokens),
+        drug_ratio=assessment.ratio,
+        coverage=known / words if words else 0.0,
+        garbage=garbage / len(tokens) if tokens else 1.0,
+    )
+    if not assessment.resolved:
+        quality.reason = "no drug resolved locally"
+    elif quality.drug_ratio < GATE_MIN_DRUG_RATIO:
+        quality.reason = f"only {quality.drug_ratio:.0%} of drug candidates resolved"
+    elif quality.coverage < GATE_MIN_COVERAGE:
+        quality.reason = f"dictionary coverage {quality.coverage:.0%}"
+    elif quality.garbage > GATE_MAX_GARBAGE:
+        quality.reason = f"garbage ratio {quality.garbage:.0%}"
+    else:
+        quality.skip = True
+        quality.reason = "clean OCR text"
+    return quality
+
+class EnhancementGate:
+    """
+    Decides whether the Gemini enhancement round-trip can be skipped for a given OCR
+    text, and keeps counts plus the enhancement latency it saved (estimated from the
+    average of the enhancement calls that did run).
+    """
+    def __init__(self, enabled=None, window=100):
+        self.enabled = enabled if enabled is not None else ENHANCE_GATE
+        self._lock = threading.Lock()
+        self._enhance_seconds = deque(maxlen=window)
+        self._stats = {'checked': 0, 'skipped': 0}
+
+    def decide(self, text, assessment=None):
+        quality = score_text(text, assessment)
+        if not self.enabled:
+            quality.skip, quality.reason = False, "gate disabled"
+        with self._lock:
+            self._stats['checked'] += 1
+            self._stats['skipped'] += int(quality.skip)
+        return quality
+
+    def record_enhancement(self, seconds):
+        with self._lock:
+            self._enhance_seconds.append(seconds)
+
+    def average_enhancement(self):
+        with self._lock:
+            return sum(self._enhance_seconds) / len(self._enhance_seconds) if self._enhance_seconds else None
+
+    def stats(self):
+        avg = self.average_enhancement()
+        with self._lock:
+            s = dict(self._stats)
+        s['avg_enhance_seconds'] = avg
+        s['saved_seconds'] = s['skipped'] * avg if avg is not None else None
+        return s
+
+# Global instance
+enhance_gate = EnhancementGate()
@@ -0,0 +1,76 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """
+    One step of a pipeline: `fn` is called with the results of the stages named in
+    `deps` (as keyword arguments, in that order) once they have all finished.
+    """
+    def __init__(self, name, fn, deps=(), optional=False):
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        # An optional stage that fails yields None instead of failing the run
+        self.optional = optional
+
+class StageError(Exception):
+    def __init__(self, stage, error):
+        super().__init__(f"Stage '{stage}' failed: {error}")
+        self.stage = stage
+        self.error = error
+
+def run_stages(stages, max_workers=4, inputs=None):
+    """
+    Runs a DAG of Stage objects on a thread pool: every stage starts as soon as its
+    dependencies are done, so independent stages overlap.
+    `inputs` pre-fills results (e.g. values known up front).
+    Returns (results, timings) where timings maps stage name -> (start, end) offsets in seconds.
+    Raises StageError for the first non-optional stage that fails.
+    """
+    results = dict(inputs or {})
+    timings = {}
+    pending = {s.name: s for s in stages}
+    for s in stages:
+        for dep in s.deps:
+            if dep not in pending and dep not in results:
+                raise ValueError(f"Stage '{s.name}' depends on unknown stage '{dep}'")
+
+    t0 = time.time()
+
+    def _run(stage, kwargs):
+        start = time.time() - t0
+        try:
+            return stage.fn(**kwargs)
+        finally:
+            timings[stage.name] = (start, time.time() - t0)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        running = {}
+        while pending or running:
+            # Submit every stage whose dependencies are satisfied
+            for name, stage in list(pending.items()):
+                if all(dep in results for dep in stage.deps):
+                    kwargs = {dep: results[dep] for dep in stage.deps}
+                    running[pool.submit(_run, stage, kwargs)] = stage
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Unsatisfiable stages: {', '.join(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    results[stage.name] = future.result()
+                except Exception as e:
+                    if not stage.optional:
+                        for f in running:
+                            f.cancel()
+                        raise StageError(stage.name, e) from e
+                    logger.warning(f"Optional stage {stage.name} failed: {e}")
+                    results[stage.name] = None
+
+    return results, timings
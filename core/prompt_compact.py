@@ -0,0 +1,92 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROMPT_COMPACTION = os.getenv("PROMPT_COMPACTION", "1") != "0"
+
+# Lines carrying no medical information: separators, report headers and boilerplate
+_SEPARATOR = re.compile(r'^[\s=\-_*#~.]{3,}$')
+_STEP_HEADER = re.compile(r'^-{2,}\s*Step\s+(\d+)\s*:.*-{2,}$', re.IGNORECASE)
+_BOILERPLATE = re.compile(
+    r'^(\(Powered by .*\)|\(Accuracy Score.*\)|\(Local fast path.*\)|Prescription_OCR_Results\s*:?|'
+    r'Analysis of the prescription image:?|Prescription Preview from searching the datasets.*|'
+    r'Disclaimer\b.*|From the Drug dataset / database|No local data found.*)$', re.IGNORECASE)
+# Whole-line boilerplate only: a dosing line mentioning "sign." or many digits is kept
+_NON_MEDICAL = re.compile(
+    r"^(clinic (hours|timings?)\b.*|(doctor'?s?\s+)?signature\s*[:.]?[\s_.]*|not valid for medico.*)$",
+    re.IGNORECASE)
+# Contact and registration details; a line made up of nothing else is dropped
+_CONTACT_ITEM = re.compile(
+    r'(https?://\S+|www\.\S+|\S+@\S+\.\w+|\b(ph|phone|mob|mobile|tel|fax)\b\.?\s*(no\.?)?\s*[:.]?\s*\+?\d[\d\s()/-]{5,}|'
+    r'\breg(istration)?\.?\s*no\.?\s*[:.]?\s*[\w/-]+)',
+    re.IGNORECASE)
+# Sections of a finished report that a follow-up prompt does not need
+_DROP_SECTIONS = {'1', '4'}  # raw OCR (the enhanced text follows) and local dataset details
+_KG_SECTION = re.compile(r'^(#+\s*)?\**Knowledge Graph Representation', re.IGNORECASE)
+
+def _non_medical(line):
+    if _NON_MEDICAL.match(line):
+        return True
+    return bool(_CONTACT_ITEM.search(line)) and not re.sub(r'[\W_]+', '', _CONTACT_ITEM.sub('', line))
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token for Gemini on English text)."""
+    return (len(text or "") + 3) // 4
+
+def compact_text(text, drugs=None, label="Prompt"):
+    """
+    Shrinks prescription text or a formatted analysis report before it goes into an
+    LLM prompt: drops separators, report headers, boilerplate, lines holding only
+    contact/registration details, the raw-OCR and local-dataset sections of a report, the text-arrow
+    Knowledge Graph section and report sections repeating an earlier one. Prescription
+    lines are never deduplicated (two drugs often share the same dosing line).
+    `drugs` (generic names matched locally) are appended as one line, labelled as
+    unverified candidates for the model to check against the text. Before/after
+    token estimates are logged.
+    """
+    if not PROMPT_COMPACTION or not text:
+        return text
+
+    sections = [[]]
+    skipping = in_graph = False
+    for line in text.splitlines():
+        stripped = line.strip()
+        header = _STEP_HEADER.match(stripped)
+        if header:
+            skipping = header.group(1) in _DROP_SECTIONS
+            sections.append([])
+            continue
+        if _KG_SECTION.match(stripped):
+            in_graph = True
+            continue
+        if skipping or not stripped:
+            continue
+        if in_graph:
+            # The arrow lines restate the medications; the next other line ends the section
+            if '->' in stripped:
+                continue
+            in_graph = False
+        if _SEPARATOR.match(stripped) or _BOILERPLATE.match(stripped) or _non_medical(stripped):
+            continue
+        sections[-1].append(re.sub(r'\s+', ' ', stripped))
+
+    lines = []
+    seen = set()
+    for section in sections:
+        key = re.sub(r'\W+', ' ', "\n".join(section)).strip().lower()
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        lines.extend(section)
+
+    if drugs:
+        # Fuzzy local matches: a hint for the model, not a fact
+        lines.append(f"Possible drugs (unverified local matches, confirm against the text): "
+                     f"{', '.join(str(d) for d in drugs)}")
+    compacted = "\n".join(lines)
+
+    before, after = estimate_tokens(text), estimate_tokens(compacted)
+    logger.info(f"{label} prompt compaction: ~{before} -> ~{after} tokens")
+    return compacted
@@ -1,17 +1,229 @@
 import os
+import time
+import atexit
+import logging
 import asyncio
+import threading
+import concurrent.futures
 import putergenai
 import base64
 import mimetypes
 import json
 from dotenv import load_dotenv
+from core.rate_limiter import limiter, RateLimited
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+# Rate limiter key of the Puter vision model
+OCR_MODEL = "puter/gpt-4o-mini"
+# Keep one logged-in client and connection pool for all perform_ocr_puter calls
+PUTER_SESSION_REUSE = os.getenv("PUTER_SESSION_REUSE", "1") != "0"
+# Upper bound on one OCR call through the shared session (seconds)
+PUTER_OCR_TIMEOUT = float(os.getenv("PUTER_OCR_TIMEOUT", "90"))
+OCR_PROMPT = "Extract all text from this image. Output ONLY the extracted text. Do not add markdown blocks like ``` or any conversational text."
+
+def build_ocr_payload(image_path):
+    """Raw Puter driver payload for gpt-4o-mini vision OCR of image_path."""
+    # Prepare Image as Base64 Data URI
+    mime_type, _ = mimetypes.guess_type(image_path)
+    if not mime_type: mime_type = "image/png"
+
+    with open(image_path, "rb") as f:
+        base64_img = base64.b64encode(f.read()).decode('utf-8')
+
+    data_url = f"data:{mime_type};base64,{base64_img}"
+
+    return {
+        "interface": "puter-chat-completion",
+        "driver": "openai-completion",
+        "method": "complete",
+        "args": {
+            "model": "gpt-4o-mini",
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": OCR_PROMPT},
+                        {"type": "image_url", "image_url": {"url": data_url}}
+                    ]
+                }
+            ],
+            "stream": False,
+            "temperature": 0.0
+        }
+    }
+
+def parse_ocr_response(resp_json):
+    if "result" in resp_json:
+        result = resp_json["result"]
+        # Check for list of choices (standard OpenAI)
+        if "choices" in result and isinstance(result["choices"], list):
+            choices = result.get("choices", [])
+            if choices:
+                return choices[0]["message"]["content"]
+        # Check for direct message (Puter adaptation for single choice)
+        elif "message" in result:
+            return result["message"]["content"]
+        else:
+            return f"Error: Unexpected response structure: {json.dumps(resp_json)}"
+    return f"Error: Unexpected response format: {json.dumps(resp_json)}"
+
+async def ocr_with_client(client, image_path):
+    """
+    OCR through an already logged-in PuterClient, on its (shared) aiohttp session.
+    Returns the text, or an "Error ..." string like perform_ocr_puter.
+    """
+    if not os.path.exists(image_path):
+        return f"Error: Image file not found at {image_path}"
+    try:
+        payload = build_ocr_payload(image_path)
+
+        # Send Raw Request
+        session = await client._get_session()
+        headers = client._get_auth_headers()
+
+        async with session.post(
+            f"{client.api_base}/drivers/call",
+            json=payload,
+            headers=headers
+        ) as response:
+            if response.status != 200:
+                if response.status == 429:
+                    limiter.penalize(OCR_MODEL)
+                error_text = await response.text()
+                return f"Error using AI API: Status {response.status} - {error_text}"
+
+            return parse_ocr_response(await response.json())
+    except Exception as e:
+        return f"Error using AI OCR: {str(e)}"
+
+class PuterSession:
+    """
+    Long-lived Puter client for synchronous callers (ocr) and for code on other event
+    loops (ocr_async, used by AsyncAnalysisSession). The client lives on an event loop
+    running in its own daemon thread, so its login token and its aiohttp connection
+    pool (with the TLS connections already open) are reused by every OCR call instead
+    of logging in and connecting again per image. Calls are handed to that loop with
+    asyncio.run_coroutine_threadsafe. An expired token (401) is refreshed by logging
+    in again, once, for all calls that hit it. PUTER_TOKEN, if set, is used as the
+    initial token.
+    """
+    def __init__(self, username=None, password=None, token=None):
+        self.username = username or os.getenv("PUTER_USERNAME")
+        self.password = password or os.getenv("PUTER_PASSWORD")
+        self._initial_token = token or os.getenv("PUTER_TOKEN")
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._client = None
+        self._login_lock = None
+        self._stats = {'calls': 0, 'logins': 0, 'refreshes': 0, 'login_seconds': 0.0}
+
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="puter-session", daemon=True)
+                thread.start()
+                self._loop, self._thread = loop, thread
+                atexit.register(self.close)
+            return self._loop
+
+    async def _get_client(self, expired_token=None):
+        # Created on first use so it belongs to the session's loop
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+        async with self._login_lock:
+            if self._client is None:
+                self._client = putergenai.PuterClient(token=self._initial_token)
+            if expired_token is not None and self._client.token == expired_token:
+                # Not refreshed yet by a concurrent call
+                self._client.token = None
+                self._stats['refreshes'] += 1
+            if not self._client.token:
+                start = time.time()
+                await self._client.login(self.username, self.password)
+                self._stats['logins'] += 1
+                self._stats['login_seconds'] += time.time() - start
+            return self._client
+
+    async def _ocr(self, image_path):
+        try:
+            client = await self._get_client()
+            token = client.token
+            text = await ocr_with_client(client, image_path)
+            if text.startswith("Error using AI API: Status 401"):
+                text = await ocr_with_client(await self._get_client(expired_token=token), image_path)
+            return text
+        except Exception as e:
+            return f"Error using AI OCR: {str(e)}"
+
+    def ocr(self, image_path, timeout=PUTER_OCR_TIMEOUT):
+        """OCRs image_path through the shared client; returns the text or an "Error ..." string."""
+        with self._lock:
+            self._stats['calls'] += 1
+        future = asyncio.run_coroutine_threadsafe(self._ocr(image_path), self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            return f"Error using AI OCR: no response within {timeout:.0f}s"
+
+    async def ocr_async(self, image_path, timeout=PUTER_OCR_TIMEOUT):
+        """Awaitable ocr() for callers running their own event loop."""
+        with self._lock:
+            self._stats['calls'] += 1
+        future = asyncio.run_coroutine_threadsafe(self._ocr(image_path), self._ensure_loop())
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            return f"Error using AI OCR: no response within {timeout:.0f}s"
+
+    def warm(self):
+        """Starts the login in the background (e.g. while the patient form is filled in)."""
+        if self.username and self.password:
+            future = asyncio.run_coroutine_threadsafe(self._get_client(), self._ensure_loop())
+            future.add_done_callback(self._log_warm_failure)
+
+    @staticmethod
+    def _log_warm_failure(future):
+        # Nobody waits on the warm-up; a failed login would otherwise go unreported
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Puter warm-up login failed: {future.exception()}")
+
+    def stats(self):
+        return dict(self._stats)
+
+    async def _close_client(self):
+        if self._client:
+            await self._client.close()
+            self._client = None
+
+    def close(self):
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+            self._login_lock = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_client(), loop).result(5)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+# Global instance
+puter_session = PuterSession()
+
 def perform_ocr_puter(image_path):
     """
     Sends an image to Puter.js OCR API (via Chat Vision) for text extraction.
     Requires PUTER_USERNAME and PUTER_PASSWORD in environment variables.
+    Goes through the shared puter_session unless PUTER_SESSION_REUSE=0.
     """
     username = os.getenv("PUTER_USERNAME")
     password = os.getenv("PUTER_PASSWORD")
@@ -28,74 +240,21 @@ def perform_ocr_puter(image_path):
             async with putergenai.PuterClient(username, password) as client:
                 # Login first to get token
                 await client.login(username, password)
-                
-                # Prepare Image as Base64 Data URI
-                mime_type, _ = mimetypes.guess_type(image_path)
-                if not mime_type: mime_type = "image/png"
-                
-                with open(image_path, "rb") as f:
-                    base64_img = base64.b64encode(f.read()).decode('utf-8')
-                
-                data_url = f"data:{mime_type};base64,{base64_img}"
-                
-                # Construct raw payload for gpt-4o-mini
-                payload = {
-                    "interface": "puter-chat-completion",
-                    "driver": "openai-completion",
-                    "method": "complete",
-                    "args": {
-                        "model": "gpt-4o-mini",
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": "Extract all text from this image. Output ONLY the extracted text. Do not add markdown blocks like ``` or any conversational text."},
-                                    {"type": "image_url", "image_url": {"url": data_url}}
-                                ]
-                            }
-                        ],
-                        "stream": False,
-                        "temperature": 0.0
-                    }
-                }
-                
-                # Send Raw Request
-                session = await client._get_session()
-                headers = client._get_auth_headers()
-                
-                async with session.post(
-                    f"{client.api_base}/drivers/call",
-                    json=payload,
-                    headers=headers
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        return f"Error using AI API: Status {response.status} - {error_text}"
-                    
-                    resp_json = await response.json()
-                    
-                    if "result" in resp_json:
-                        result = resp_json["result"]
-                        # Check for list of choices (standard OpenAI)
-                        if "choices" in result and isinstance(result["choices"], list):
-                             choices = result.get("choices", [])
-                             if choices:
-                                 content = choices[0]["message"]["content"]
-                                 return content
-                        # Check for direct message (Puter adaptation for single choice)
-                        elif "message" in result:
-                             content = result["message"]["content"]
-                             return content
-                        else:
-                             return f"Error: Unexpected response structure: {json.dumps(resp_json)}"
-                    else:
-                         return f"Error: Unexpected response format: {json.dumps(resp_json)}"
+                return await ocr_with_client(client, image_path)
 
         except Exception as e:
             # import traceback
             # traceback.print_exc() 
             return f"Error using AI OCR: {str(e)}"
 
+    try:
+        limiter.acquire(OCR_MODEL)
+    except RateLimited as e:
+        return f"Error using AI OCR: {e}"
+
+    if PUTER_SESSION_REUSE:
+        return puter_session.ocr(image_path)
+
     try:
         # Run async function synchronously
         return asyncio.run(_async_ocr())
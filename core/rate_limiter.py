@@ -0,0 +1,253 @@
+import os
+import time
+import logging
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+
+INTERACTIVE = 0
+BATCH = 1
+
+RATE_LIMITER = os.getenv("RATE_LIMITER", "1") != "0"
+# "model=requests_per_min/tokens_per_min;..."; the item "free" adds FREE_TIER_LIMITS.
+# Models without a limit (and without RATE_LIMIT_DEFAULT) are not throttled, so the
+# limiter is inactive by default: nothing is queued until one of the two is set.
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+# "requests_per_min/tokens_per_min" for models not listed in RATE_LIMITS
+RATE_LIMIT_DEFAULT = os.getenv("RATE_LIMIT_DEFAULT", "")
+# How long a call may queue before the caller moves on (next model / error)
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "10"))
+RATE_LIMIT_BATCH_MAX_WAIT = float(os.getenv("RATE_LIMIT_BATCH_MAX_WAIT", "120"))
+
+# Gemini free-tier quotas (opt in with RATE_LIMITS=free)
+FREE_TIER_LIMITS = {
+    'gemini-2.5-flash': (10, 250000),
+    'gemini-2.5-flash-lite': (15, 250000),
+    'gemini-3-flash': (10, 250000),
+    'gemini-1.5-flash': (15, 250000),
+    'puter/gpt-4o-mini': (30, 1000000),
+}
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+class RateLimited(Exception):
+    """The call would have to queue longer than allowed; carries the estimated wait."""
+    def __init__(self, key, wait):
+        super().__init__(f"Rate limit for {key}: ~{wait:.1f}s wait")
+        self.key = key
+        self.wait = wait
+
+def _parse_limits(spec):
+    limits = {}
+    for item in spec.split(';'):
+        if item.strip().lower() == 'free':
+            limits.update(FREE_TIER_LIMITS)
+            continue
+        if '=' not in item:
+            continue
+        key, value = item.split('=', 1)
+        rpm, _, tpm = value.partition('/')
+        limits[key.strip()] = (float(rpm), float(tpm or 1e12))
+    return limits
+
+class _Bucket:
+    """Token bucket refilled continuously to `capacity` per minute."""
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.time()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        amount = min(amount, self.capacity)
+        return max(amount - self.level, 0) / self.rate if self.rate else float('inf')
+
+class _Limit:
+    def __init__(self, rpm, tpm):
+        self.requests = _Bucket(rpm)
+        self.tokens = _Bucket(tpm)
+        self.waiters = []  # heap of (priority, seq): interactive calls are served before batch ones
+        self.granted = 0
+        self.throttled = 0
+        self.rejected = 0
+        self.waited = 0.0
+
+    def wait_time(self, tokens, now):
+        self.requests.refill(now)
+        self.tokens.refill(now)
+        return max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+class RateLimiter:
+    """
+    Client-side quota scheduler for LLM providers: one requests/min and one tokens/min
+    bucket per model. acquire() queues the caller until both buckets allow the call,
+    serving interactive callers before batch ones (priority() sets the priority of
+    the current thread), and raises RateLimited instead of queueing longer than
+    max_wait, so callers can fall back to another model instead of collecting 429s.
+    backpressure() tells batch producers how far behind the buckets are.
+    Only models with a configured limit are throttled; with no limits configured
+    (the default) the limiter is inactive and every call passes straight through.
+    """
+    def __init__(self, limits=None, default=RATE_LIMIT_DEFAULT, enabled=None):
+        self.enabled = enabled if enabled is not None else RATE_LIMITER
+        self._config = dict(limits if limits is not None else _parse_limits(RATE_LIMITS))
+        self._default = _parse_limits(f"default={default}")['default'] if default else None
+        self._limits = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        if limits is None:
+            logger.info(f"Rate limits: {self.describe()}")
+
+    @property
+    def active(self):
+        """True if any call can be throttled (enabled and at least one limit configured)."""
+        return self.enabled and bool(self._config or self._default)
+
+    def describe(self):
+        """The configured limits as text (logged at startup)."""
+        if not self.enabled:
+            return "inactive (RATE_LIMITER=0)"
+        items = [f"{key} {rpm:g} RPM / {tpm:g} TPM" for key, (rpm, tpm) in sorted(self._config.items())]
+        if self._default:
+            items.append(f"other models {self._default[0]:g} RPM / {self._default[1]:g} TPM")
+        return "; ".join(items) if items else "inactive, no limits configured (set RATE_LIMITS, e.g. RATE_LIMITS=free)"
+
+    def _get(self, key):
+        """The key's _Limit, or None if the key is not rate limited."""
+        limit = self._limits.get(key)
+        if limit is None:
+            config = self._config.get(key, self._default)
+            if config is None:
+                return None
+            limit = self._limits[key] = _Limit(*config)
+        return limit
+
+    @contextmanager
+    def priority(self, priority):
+        previous = getattr(_local, 'priority', INTERACTIVE)
+        _local.priority = priority
+        try:
+            yield
+        finally:
+            _local.priority = previous
+
+    def current_priority(self):
+        return getattr(_local, 'priority', INTERACTIVE)
+
+    def acquire(self, key, tokens=1, priority=None, max_wait=None):
+        """Blocks until `key` has capacity for one request of `tokens` tokens; returns the seconds waited."""
+        if not self.enabled:
+            return 0.0
+        priority = self.current_priority() if priority is None else priority
+        if max_wait is None:
+            max_wait = RATE_LIMIT_BATCH_MAX_WAIT if priority >= BATCH else RATE_LIMIT_MAX_WAIT
+        start = time.time()
+        entry = (priority, next(self._seq))
+        with self._cond:
+            limit = self._get(key)
+            if limit is None:
+                return 0.0
+            heapq.heappush(limit.waiters, entry)
+            try:
+                while True:
+                    now = time.time()
+                    wait = limit.wait_time(tokens, now)
+                    if limit.waiters[0] == entry and wait <= 0:
+                        limit.requests.level -= 1
+                        limit.tokens.level -= min(tokens, limit.tokens.capacity)
+                        heapq.heappop(limit.waiters)
+                        waited = now - start
+                        limit.granted += 1
+                        limit.throttled += int(waited > 0.01)
+                        limit.waited += waited
+                        self._cond.notify_all()
+                        return waited
+                    # Not our turn yet: assume we also wait for everyone ahead of us
+                    ahead = sum(1 for w in limit.waiters if w < entry)
+                    estimate = wait + ahead / limit.requests.rate if limit.requests.rate else float('inf')
+                    if now - start + estimate > max_wait:
+                        limit.rejected += 1
+                        raise RateLimited(key, estimate)
+                    self._cond.wait(min(max(wait, 0.01), 1.0))
+            except BaseException:
+                if entry in limit.waiters:
+                    limit.waiters.remove(entry)
+                    heapq.heapify(limit.waiters)
+                self._cond.notify_all()
+                raise
+
+    def settle(self, key, estimated_tokens, actual_tokens):
+        """
+        Corrects the token bucket once the real usage of a call is known (0 for a
+        failed call refunds the reservation; None keeps the estimate).
+        """
+        if not self.enabled or actual_tokens is None:
+            return
+        with self._cond:
+            limit = self._get(key)
+            if limit is None:
+                return
+            limit.tokens.level -= actual_tokens - estimated_tokens
+            self._cond.notify_all()
+
+    def penalize(self, key):
+        """The provider answered 429 anyway: empty the request bucket so callers back off."""
+        if not self.enabled:
+            return
+        with self._cond:
+            limit = self._get(key)
+            if limit is None:
+                return
+            limit.requests.refill(time.time())
+            limit.requests.level = min(limit.requests.level, 0)
+
+    def backpressure(self, keys=None):
+        """Seconds until the most backed-up of `keys` (all known keys by default) could serve its queue."""
+        now = time.time()
+        worst = 0.0
+        with self._cond:
+            for key in keys or list(self._limits):
+                limit = self._get(key)
+                if limit is None:
+                    continue
+                rate = limit.requests.rate
+                queued = len(limit.waiters) / rate if rate else 0.0
+                worst = max(worst, limit.wait_time(1, now) + queued)
+        return worst
+
+    def stats(self):
+        now = time.time()
+        out = {}
+        with self._cond:
+            for key, limit in self._limits.items():
+                out[key] = {
+                    'rpm': limit.requests.capacity,
+                    'tpm': limit.tokens.capacity,
+                    'granted': limit.granted,
+                    'throttled': limit.throttled,
+                    'rejected': limit.rejected,
+                    'waited': limit.waited,
+                    'queued_interactive': sum(1 for p, _ in limit.waiters if p < BATCH),
+                    'queued_batch': sum(1 for p, _ in limit.waiters if p >= BATCH),
+                    'wait': limit.wait_time(1, now),
+                }
+        return out
+
+    def format_stats(self):
+        if not self.active:
+            return f"Rate limiter {self.describe()}: no calls were throttled."
+        lines = []
+        for key, s in self.stats().items():
+            lines.append(f"{key}: {s['granted']} calls ({s['throttled']} queued, {s['rejected']} over max wait), "
+                         f"waited {s['waited']:.1f}s, limit {s['rpm']:.0f} RPM / {s['tpm']:.0f} TPM")
+        return "\n".join(lines) if lines else "No rate-limited calls yet."
+
+# Global instance
+limiter = RateLimiter()
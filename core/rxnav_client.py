@@ -0,0 +1,242 @@
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Point at a local stand-in (tools/rxnav_stub_server.py) with RXNAV_BASE_URL=http://127.0.0.1:8765/REST
+RXNAV_BASE_URL = os.getenv("RXNAV_BASE_URL", "https://rxnav.nlm.nih.gov/REST")
+
+class RxNavError(Exception):
+    """RxNav could not be reached or returned an error."""
+
+class CircuitOpenError(RxNavError):
+    """Raised without a network call while the circuit breaker is open."""
+
+class DeadlineExceeded(RxNavError):
+    """The per-analysis deadline ran out before the call could be made."""
+
+# --- Per-analysis deadlines (thread-local) ---
+_local = threading.local()
+
+@contextmanager
+def deadline(seconds):
+    """
+    Limits the total time RxNav calls may take inside this block (per thread).
+    Nested deadlines can only shorten the outer one.
+    """
+    previous = getattr(_local, 'deadline', None)
+    new = time.monotonic() + seconds if seconds is not None else None
+    if previous is not None and (new is None or previous < new):
+        new = previous
+    _local.deadline = new
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+def remaining_time():
+    """Seconds left before the current deadline, or None if there is none."""
+    d = getattr(_local, 'deadline', None)
+    if d is None:
+        return None
+    return d - time.monotonic()
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker.
+    Opens after `failure_threshold` consecutive failures and lets one trial
+    call through after `reset_timeout` seconds.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._state = self.CLOSED
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+            return self._state
+
+    def allow(self):
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            # Let a single trial call through; re-open until it reports back
+            with self._lock:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._state = self.CLOSED
+
+    def reset(self):
+        """Closes the breaker and forgets past failures (e.g. for a new endpoint)."""
+        self.record_success()
+        with self._lock:
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold and self._state != self.OPEN:
+                logger.warning("RxNav circuit breaker opened after %d failures", self.failures)
+            if self.failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self.opened_at = time.monotonic()
+
+class RxNavClient:
+    """
+    HTTP client for RxNav with per-call timeouts, per-analysis deadlines,
+    jittered exponential retries, a circuit breaker and a stale-response cache
+    used while the service is failing.
+    """
+    RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=None, timeout=None, retries=None, backoff=0.25,
+                 breaker=None, stale_cache_size=2000):
+        self.base_url = (base_url or RXNAV_BASE_URL).rstrip('/')
+        self.timeout = timeout if timeout is not None else float(os.getenv("RXNAV_TIMEOUT", "3"))
+        self.retries = retries if retries is not None else int(os.getenv("RXNAV_RETRIES", "2"))
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+
+        self._stale = OrderedDict()
+        self._stale_size = stale_cache_size
+        self._latencies = deque(maxlen=1000)
+        self._counts = {'calls': 0, 'failures': 0, 'retries': 0, 'short_circuits': 0, 'stale_hits': 0}
+        self._lock = threading.Lock()
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._counts[key] += n
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._stale[key] = data
+            self._stale.move_to_end(key)
+            while len(self._stale) > self._stale_size:
+                self._stale.popitem(last=False)
+
+    def _stale_or_raise(self, key, error):
+        with self._lock:
+            data = self._stale.get(key)
+        if data is not None:
+            self._count('stale_hits')
+            logger.info("RxNav unavailable (%s); serving cached response", error)
+            return data
+        raise error
+
+    def get_json(self, path, params=None):
+        """
+        GET {base_url}/{path} and return the decoded JSON.
+        Raises RxNavError (or a subclass) if no fresh or cached response is available.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        key = (url, tuple(sorted((params or {}).items())))
+
+        if not self.breaker.allow():
+            self._count('short_circuits')
+            return self._stale_or_raise(key, CircuitOpenError("RxNav circuit breaker is open"))
+
+        last_error = None
+        for attempt in range(self.retries + 1):
+            left = remaining_time()
+            if left is not None and left <= 0:
+                return self._stale_or_raise(key, DeadlineExceeded("RxNav analysis deadline exceeded"))
+            timeout = self.timeout if left is None else min(self.timeout, left)
+
+            if attempt:
+                self._count('retries')
+            self._count('calls')
+            t0 = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, timeout=timeout)
+                with self._lock:
+                    self._latencies.append(time.monotonic() - t0)
+
+                if response.status_code == 200:
+                    data = response.json()
+                    self.breaker.record_success()
+                    self._remember(key, data)
+                    return data
+
+                last_error = RxNavError(f"API Status {response.status_code}")
+                if response.status_code not in self.RETRYABLE_STATUS:
+                    # Client errors are our fault, not the service's: it answered, so it
+                    # is up (this also closes a breaker whose half-open trial got a 4xx)
+                    self.breaker.record_success()
+                    raise last_error
+            except (requests.RequestException, ValueError) as e:
+                last_error = RxNavError(str(e))
+
+            self._count('failures')
+            self.breaker.record_failure()
+            if not self.breaker.allow():
+                break
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                left = remaining_time()
+                if left is not None:
+                    delay = min(delay, max(left, 0))
+                time.sleep(delay)
+
+        return self._stale_or_raise(key, last_error)
+
+    def set_base_url(self, base_url):
+        """
+        Switches the client to another RxNav endpoint (e.g. the local stand-in). Stale
+        responses, the breaker state and the metrics belong to the old endpoint and are reset.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.breaker.reset()
+        with self._lock:
+            self._stale.clear()
+            self._latencies.clear()
+            self._counts = dict.fromkeys(self._counts, 0)
+
+    def metrics(self):
+        """
+        Returns call counters, latency percentiles (seconds) and breaker state.
+        """
+        with self._lock:
+            samples = sorted(self._latencies)
+            stats = dict(self._counts)
+
+        def pct(p):
+            if not samples:
+                return None
+            return samples[min(len(samples) - 1, int(round(p / 100 * (len(samples) - 1))))]
+
+        stats.update({
+            'p50': pct(50),
+            'p95': pct(95),
+            'p99': pct(99),
+            'breaker_state': self.breaker.state,
+            'breaker_failures': self.breaker.failures
+        })
+        return stats
+
+# Global instance
+client = RxNavClient()
@@ -0,0 +1,188 @@
+import os
+import re
+import sqlite3
+import difflib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Built by tools/import_rxnorm.py from an RxNorm RXNCONSO.RRF file
+RXNORM_DB = os.getenv("RXNORM_DB", "rxnorm_index.db")
+
+# Lower rank wins when a name maps to several concepts (ingredient before brand before clinical drug)
+TTY_RANK = {'IN': 0, 'PIN': 1, 'MIN': 2, 'BN': 3, 'SCD': 4, 'SBD': 5, 'PSN': 6, 'SY': 7, 'TMSY': 8}
+DEFAULT_TTYS = ('IN', 'PIN', 'MIN', 'BN', 'SCD', 'SBD', 'PSN')
+# Only short concept names take part in approximate matching (keeps candidate sets small)
+APPROX_MAX_RANK = 3
+APPROX_CUTOFF = 0.88
+
+# RXNCONSO.RRF column positions
+COL_RXCUI, COL_LAT, COL_SAB, COL_TTY, COL_STR, COL_SUPPRESS = 0, 1, 11, 12, 14, 16
+
+def normalize_name(name):
+    return re.sub(r'\s+', ' ', name.strip().lower())
+
+class RxNormIndex:
+    """
+    Local, indexed name -> RxCUI table so get_rxcui() can resolve most names without RxNav.
+    """
+    def __init__(self, path=RXNORM_DB):
+        self.path = path
+        self._local = threading.local()
+        self._available = None
+        self.hits = 0
+        self.misses = 0
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            self._local.conn = conn
+        return conn
+
+    @property
+    def available(self):
+        """True once an import has populated the index (checked once, cheap afterwards)."""
+        if self._available is None:
+            if not os.path.exists(self.path):
+                self._available = False
+            else:
+                try:
+                    row = self._conn().execute("SELECT count(*) FROM concepts").fetchone()
+                    self._available = bool(row and row[0])
+                except sqlite3.Error:
+                    self._available = False
+        return self._available
+
+    def init_schema(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS concepts (
+                name_norm TEXT NOT NULL,
+                prefix TEXT NOT NULL,
+                rxcui TEXT NOT NULL,
+                tty TEXT,
+                rank INTEGER NOT NULL,
+                name TEXT
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS import_info (
+                source TEXT,
+                rows INTEGER,
+                imported_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+    def import_rrf(self, rrf_path, ttys=DEFAULT_TTYS, sources=('RXNORM',), batch_size=20000):
+        """
+        Imports an RXNCONSO-style pipe-delimited file, replacing the current index.
+        Only English, non-suppressed rows with the given term types (and sources, if given) are kept.
+        Returns the number of rows imported.
+        """
+        ttys = set(ttys) if ttys else None
+        sources = set(sources) if sources else None
+
+        conn = sqlite3.connect(self.path)
+        try:
+            self.init_schema(conn)
+            conn.execute("DROP INDEX IF EXISTS idx_concepts_name")
+            conn.execute("DROP INDEX IF EXISTS idx_concepts_prefix")
+            conn.execute("DELETE FROM concepts")
+
+            count = 0
+            batch = []
+            seen = set()
+            with open(rrf_path, mode='r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    cols = line.rstrip('\n').split('|')
+                    if len(cols) <= COL_SUPPRESS:
+                        continue
+                    if cols[COL_LAT] != 'ENG' or cols[COL_SUPPRESS] not in ('', 'N'):
+                        continue
+                    tty = cols[COL_TTY]
+                    if ttys and tty not in ttys:
+                        continue
+                    if sources and cols[COL_SAB] not in sources:
+                        continue
+
+                    name_norm = normalize_name(cols[COL_STR])
+                    key = (name_norm, cols[COL_RXCUI])
+                    if not name_norm or key in seen:
+                        continue
+                    seen.add(key)
+
+                    batch.append((name_norm, name_norm[:3], cols[COL_RXCUI], tty, TTY_RANK.get(tty, 9), cols[COL_STR]))
+                    if len(batch) >= batch_size:
+                        conn.executemany("INSERT INTO concepts VALUES (?, ?, ?, ?, ?, ?)", batch)
+                        count += len(batch)
+                        batch = []
+            if batch:
+                conn.executemany("INSERT INTO concepts VALUES (?, ?, ?, ?, ?, ?)", batch)
+                count += len(batch)
+
+            # Build indexes after the bulk insert (much faster than maintaining them row by row)
+            conn.execute("CREATE INDEX idx_concepts_name ON concepts(name_norm, rank)")
+            conn.execute("CREATE INDEX idx_concepts_prefix ON concepts(prefix, rank)")
+            conn.execute("INSERT INTO import_info (source, rows) VALUES (?, ?)", (os.path.basename(rrf_path), count))
+            conn.commit()
+        finally:
+            conn.close()
+
+        # Drop this thread's cached connection / availability so the new data is seen
+        self._local = threading.local()
+        self._available = None
+        logger.info(f"Imported {count} RxNorm concepts from {rrf_path}")
+        return count
+
+    def lookup(self, name, approximate=True):
+        """
+        Returns the RxCUI for a drug name from the local index, or None if it is not present.
+        Exact (normalized) match first, then approximate matching among short concept names
+        sharing the same first three letters.
+        """
+        if not self.available:
+            return None
+        q = normalize_name(name)
+        if not q:
+            return None
+
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT rxcui FROM concepts WHERE name_norm = ? ORDER BY rank LIMIT 1", (q,)
+        ).fetchone()
+        if row:
+            self.hits += 1
+            return row[0]
+
+        if approximate and len(q) >= 4:
+            rows = conn.execute(
+                "SELECT name_norm, rxcui FROM concepts WHERE prefix = ? AND rank <= ? ORDER BY rank",
+                (q[:3], APPROX_MAX_RANK)
+            ).fetchall()
+            candidates = {}
+            for n, cui in rows:
+                candidates.setdefault(n, cui)
+            match = difflib.get_close_matches(q, list(candidates), n=1, cutoff=APPROX_CUTOFF)
+            if match:
+                self.hits += 1
+                return candidates[match[0]]
+
+        self.misses += 1
+        return None
+
+    def close(self):
+        """Closes this thread's connection."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def stats(self):
+        if not self.available:
+            return {'available': False, 'concepts': 0, 'hits': self.hits, 'misses': self.misses}
+        concepts = self._conn().execute("SELECT count(*) FROM concepts").fetchone()[0]
+        return {'available': True, 'concepts': concepts, 'hits': self.hits, 'misses': self.misses}
+
+# Global instance
+rxnorm = RxNormIndex()
@@ -0,0 +1,58 @@
+import threading
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the function,
+    everyone arriving while it is in flight waits and shares its result (or exception).
+    Nothing is cached once the call completes - pair it with a cache for that.
+    `wait_timeout` (a callable returning seconds or None) bounds how long a waiting
+    caller blocks, e.g. its own deadline; when it runs out `timeout_error()` is raised.
+    """
+    def __init__(self, wait_timeout=None, timeout_error=TimeoutError):
+        self.wait_timeout = wait_timeout
+        self.timeout_error = timeout_error
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+                leader = True
+
+        if not leader:
+            timeout = self.wait_timeout() if self.wait_timeout else None
+            if not call.event.wait(max(timeout, 0) if timeout is not None else None):
+                raise self.timeout_error()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def stats(self):
+        with self._lock:
+            return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': len(self._calls)}
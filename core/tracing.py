@@ -0,0 +1,97 @@
+import time
+import threading
+from contextlib import contextmanager
+
+_local = threading.local()
+
+class Span:
+    """
+    One timed stage of an analysis. LLM calls made while the span is active (in the
+    same thread) add their model, sizes, token counts and cache hits to it.
+    """
+    def __init__(self, name, offset):
+        self.name = name
+        self.offset = offset
+        self.duration = None
+        self.model = None
+        self.prompt_chars = 0
+        self.response_chars = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.llm_calls = 0
+        self.cache_hits = 0
+        self.error = None
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+class Trace:
+    """Collects the spans of one analysis run (spans may be recorded from several threads)."""
+    def __init__(self):
+        self.t0 = time.time()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        span = Span(name, time.time() - self.t0)
+        with self._lock:
+            self.spans.append(span)
+        previous = getattr(_local, 'span', None)
+        _local.span = span
+        start = time.time()
+        try:
+            yield span
+        except Exception as e:
+            span.error = str(e)[:200]
+            raise
+        finally:
+            span.duration = time.time() - start
+            _local.span = previous
+
+    def record(self, name, start, end, **fields):
+        """Adds an already finished span (start/end are time.time() values), e.g. from async code."""
+        span = Span(name, start - self.t0)
+        span.duration = end - start
+        for key, value in fields.items():
+            setattr(span, key, value)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def total(self):
+        return time.time() - self.t0
+
+    def to_list(self):
+        with self._lock:
+            return [s.to_dict() for s in self.spans]
+
+    def summary(self):
+        """One line per span, for logs."""
+        lines = []
+        for s in self.to_list():
+            line = f"{s['name']}: {s['duration'] or 0:.2f}s"
+            if s['model']: line += f" [{s['model']}]"
+            if s['prompt_tokens'] or s['output_tokens']:
+                line += f" tokens {s['prompt_tokens']}/{s['output_tokens']}"
+            if s['cache_hits']: line += f" (cache hits: {s['cache_hits']})"
+            if s['error']: line += f" ERROR: {s['error']}"
+            lines.append(line)
+        return "\n".join(lines)
+
+def current_span():
+    return getattr(_local, 'span', None)
+
+def record_llm_call(model, prompt, response_text, usage=None, cached=False):
+    """Adds one LLM call to the active span of this thread (no-op outside a span)."""
+    span = current_span()
+    if span is None:
+        return
+    usage = usage or {}
+    span.llm_calls += 1
+    span.model = model
+    span.prompt_chars += len(prompt) if isinstance(prompt, str) else 0
+    span.response_chars += len(response_text or "")
+    span.prompt_tokens += usage.get('prompt_tokens', 0)
+    span.output_tokens += usage.get('output_tokens', 0)
+    span.cache_hits += int(cached)
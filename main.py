@@ -15,7 +15,7 @@ def resource_path(relative_path):
 
     return os.path.join(base_path, relative_path)
 
-from kivy.properties import ListProperty, StringProperty
+from kivy.properties import ListProperty, StringProperty, ObjectProperty
 from kivy.core.window import Window
 Window.icon = 'icon.ico'
 
@@ -38,6 +38,10 @@ class RxShieldApp(App):
     
     recent_text = StringProperty("")
     recent_drugs = ListProperty([]) # Track identified drugs
+    recent_ddi = ObjectProperty(None, allownone=True) # Structured DDIResult of the last analysis
+    recent_analysis = ObjectProperty(None, allownone=True) # PrescriptionAnalysis of the last image analysis
+    # "auto" (local fast path when drugs resolve confidently), "local" (never call the LLM) or "llm"
+    analysis_mode = StringProperty(os.getenv("ANALYSIS_MODE", "llm"))
     
     def on_start(self):
         # Initialize KG Manager
@@ -51,9 +55,15 @@ class RxShieldApp(App):
         self.notification_manager = NotificationManager()
         self.notification_manager.start_service()
 
+        # Fresh install: pre-warm the DDI cache in the background (RXSHIELD_WARMUP=0 disables)
+        from core.ddi_cache import ddi_cache
+        if os.getenv("RXSHIELD_WARMUP", "1") != "0" and ddi_cache.is_empty():
+            import threading
+            from core.cache_warmup import warm_up
+            threading.Thread(target=warm_up, daemon=True).start()
+
         # [PRESENTATION MODE] Open Landing Page
         import webbrowser
-        import os
         try:
             # Construct absolute path to the landing page
             landing_page = resource_path(os.path.join('presentation', 'landing.html'))
@@ -62,14 +72,17 @@ class RxShieldApp(App):
         except Exception as e:
             print(f"Failed to open presentation page: {e}")
 
-    def generate_knowledge_graph(self, context_text=None, **kwargs):
+    def generate_knowledge_graph(self, context_text=None, ddi_result=None, graph_data=None, **kwargs):
         """
         Generates the graph based on recent analysis or defaults to universal.
+        A structured ddi_result (DDIResult) or graph_data already extracted by the
+        analysis pipeline is used directly, without re-querying Gemini.
         Returns the path to the generated image.
         """
         # Falls back to universal if empty
         print(f"Generating Knowledge Graph. Context len: {len(context_text) if context_text else 0}")
-        path = self.kg_manager.generate_graph(self.recent_drugs, full_text=context_text)
+        path = self.kg_manager.generate_graph(self.recent_drugs, full_text=context_text, ddi_result=ddi_result,
+                                              graph_data=graph_data)
         
         if path:
             try:
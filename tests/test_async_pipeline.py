@@ -0,0 +1,68 @@
+import unittest
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import async_pipeline, gemini_client, puter_client
+from core.async_pipeline import AsyncAnalysisSession
+
+class FakePuterClient:
+    logins = 0
+
+    def __init__(self, token=None):
+        self.token = token
+
+    async def login(self, username, password):
+        FakePuterClient.logins += 1
+        self.token = "token"
+
+    async def close(self):
+        pass
+
+async def fake_ocr(client, image_path):
+    await asyncio.sleep(0.1)
+    return "Error: unreadable" if "bad" in image_path else f"Tab Ecosprin 75 ({os.path.basename(image_path)})"
+
+def fake_pipeline(image_path, patient_details=None, ocr_text=None, trace=None, **kwargs):
+    time.sleep(0.1)
+    return {'text': ocr_text, 'drugs': ['Aspirin'], 'spans': trace.to_list()}
+
+class TestAsyncPipeline(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.images = []
+        for name in ["rx0.png", "rx1.png", "rx2.png", "rx3.png", "rx4.png", "rx5.png", "rx6.png", "rx7.png", "bad.png"]:
+            path = os.path.join(self.tmp.name, name)
+            with open(path, 'wb') as f:
+                f.write(b"img")
+            self.images.append(path)
+        FakePuterClient.logins = 0
+
+    def test_many_in_flight_share_one_login(self):
+        async def run():
+            async with AsyncAnalysisSession(username="u", password="p") as session:
+                return await session.analyze_many([(p, {'name': 'Ravi'}) for p in self.images])
+
+        with mock.patch.object(puter_client.putergenai, 'PuterClient', FakePuterClient), \
+             mock.patch.object(puter_client, 'ocr_with_client', fake_ocr), \
+             mock.patch.object(async_pipeline.preprocessor, 'enabled', False), \
+             mock.patch.object(gemini_client, 'run_analysis_pipeline', side_effect=fake_pipeline):
+            start = time.time()
+            results = asyncio.run(run())
+            elapsed = time.time() - start
+
+        self.assertLess(elapsed, 0.6)  # 9 x (OCR + pipeline) sequentially would take ~1.8s
+        self.assertEqual(FakePuterClient.logins, 1)
+        self.assertEqual(results[3]['text'], "Tab Ecosprin 75 (rx3.png)")
+        self.assertEqual([s['name'] for s in results[0]['spans']], ['preprocess', 'ocr'])
+        self.assertEqual(results[-1]['text'], "OCR Failed: Error: unreadable")
+
+if __name__ == '__main__':
+    unittest.main()
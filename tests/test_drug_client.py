@@ -0,0 +1,299 @@
+import unittest
+import os
+import sys
+import time
+import threading
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import drug_client
+from core.ddi_cache import ddi_cache, DDICache
+from core.ddi_session import DDISession
+from core.ddi_triage import triage, pair_prior, drug_classes
+from core.ddi_results import InteractionPair, DrugMapping, DDIResult
+from core.rxnav_client import remaining_time, RxNavError, DeadlineExceeded, deadline as rxnav_deadline
+
+RXCUIS = {'warfarin': '11289', 'aspirin': '1191', 'ibuprofen': '5640', 'metformin': '6809'}
+
+def fake_interactions(cuis):
+    if set(cuis) == {'11289', '1191'}:
+        return [InteractionPair('warfarin', 'aspirin', 'high', 'Bleeding risk.', 'Test', '11289', '1191')]
+    return []
+
+def setUpModule():
+    # Keep the persistent DDI cache out of the tests
+    ddi_cache.enabled = False
+
+def tearDownModule():
+    ddi_cache.enabled = True
+
+class TestBatchInteractions(unittest.TestCase):
+    def setUp(self):
+        drug_client._get_pair_interactions.cache_clear()
+
+    def test_dedupes_names_and_pairs(self):
+        prescriptions = [
+            ["Warfarin", "Aspirin"],
+            ["warfarin", "Aspirin", "Metformin"],
+            ["Aspirin", "Warfarin"],
+            ["Ibuprofen"],
+        ]
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=lambda n: RXCUIS.get(n.lower())) as rxcui, \
+             mock.patch.object(drug_client, 'fetch_interactions', side_effect=fake_interactions) as fetch:
+            results = drug_client.check_interactions_for_many(prescriptions)
+
+        # 4 unique names, 3 unique pairs (warfarin+aspirin, warfarin+metformin, aspirin+metformin)
+        self.assertEqual(rxcui.call_count, 4)
+        self.assertEqual(fetch.call_count, 3)
+
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(results[0].interactions), 1)
+        self.assertEqual(results[0].interactions[0].severity, 'high')
+        self.assertEqual(len(results[1].interactions), 1)
+        self.assertEqual(len(results[2].interactions), 1)
+        self.assertEqual(results[3].interactions, [])
+        self.assertEqual([d.display_name for d in results[3].found_drugs], ['Ibuprofen'])
+
+    def test_rxnav_errors_are_reported_and_bugs_propagate(self):
+        prescriptions = [["Warfarin", "Aspirin"]]
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=lambda n: RXCUIS.get(n.lower())), \
+             mock.patch.object(drug_client, 'get_pair_interactions', side_effect=RxNavError("RxNav unreachable")):
+            self.assertEqual(drug_client.check_interactions_for_many(prescriptions)[0].error, "RxNav unreachable")
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=lambda n: RXCUIS.get(n.lower())), \
+             mock.patch.object(drug_client, 'get_pair_interactions', side_effect=TypeError("bad call")):
+            with self.assertRaises(TypeError):
+                drug_client.check_interactions_for_many(prescriptions)
+
+class TestDDISession(unittest.TestCase):
+    def setUp(self):
+        drug_client.clear_caches()
+
+    def test_edit_only_checks_new_pairs(self):
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=lambda n: RXCUIS.get(n.lower())), \
+             mock.patch.object(drug_client, 'resolve_drug', wraps=drug_client.resolve_drug) as resolve, \
+             mock.patch.object(drug_client, 'get_pair_interactions', side_effect=lambda a, b: fake_interactions([a, b])) as pairs:
+            session = DDISession(["Warfarin", "Metformin", "Ibuprofn"])
+            first = session.result()
+            self.assertEqual((resolve.call_count, pairs.call_count), (3, 1))
+            self.assertEqual(first.interactions, [])
+
+            # Fix the typo: one resolution, two new pairs
+            session.rename("Ibuprofn", "Aspirin")
+            second = session.result()
+            self.assertEqual((resolve.call_count, pairs.call_count), (4, 3))
+            self.assertEqual(session.drug_names, ["Warfarin", "Metformin", "Aspirin"])
+            self.assertEqual(len(second.interactions), 1)
+
+            # Removing a drug needs no lookups at all
+            session.remove("Metformin")
+            third = session.result()
+            self.assertEqual((resolve.call_count, pairs.call_count), (4, 3))
+            self.assertEqual(len(third.interactions), 1)
+
+    def test_resolution_is_bounded_by_the_deadline(self):
+        seen = []
+        def rxcui(name):
+            seen.append(remaining_time())
+            return RXCUIS.get(name.lower())
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=rxcui):
+            DDISession().set_drugs(["Warfarin", "Aspirin"], deadline=5)
+        self.assertTrue(seen and all(t is not None and t <= 5 for t in seen))
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        drug_client.clear_caches()
+
+    def test_concurrent_lookups_are_coalesced(self):
+        calls = []
+        def slow_lookup(name):
+            calls.append(name)
+            time.sleep(0.2)
+            return '1191'
+
+        before = drug_client.flight.stats()['coalesced']
+        results = []
+        with mock.patch.object(drug_client, '_lookup_rxcui', side_effect=slow_lookup):
+            threads = [threading.Thread(target=lambda: results.append(drug_client.get_rxcui('aspirin'))) for _ in range(5)]
+            for t in threads: t.start()
+            for t in threads: t.join()
+
+        self.assertEqual(calls, ['aspirin'])
+        self.assertEqual(results, ['1191'] * 5)
+        self.assertEqual(drug_client.flight.stats()['coalesced'] - before, 4)
+        self.assertEqual(drug_client.flight.stats()['in_flight'], 0)
+
+    def test_waiting_caller_keeps_its_own_deadline(self):
+        started = threading.Event()
+        def slow_lookup(name):
+            started.set()
+            time.sleep(0.5)
+            return '1191'
+
+        with mock.patch.object(drug_client, '_lookup_rxcui', side_effect=slow_lookup):
+            leader = threading.Thread(target=drug_client.get_rxcui, args=('aspirin',))
+            leader.start()
+            started.wait(1)
+            start = time.time()
+            with rxnav_deadline(0.1), self.assertRaises(DeadlineExceeded):
+                drug_client.flight.do(('rxcui', 'aspirin'), slow_lookup, 'aspirin')
+            self.assertLess(time.time() - start, 0.3)
+            leader.join()
+
+class TestDDIResult(unittest.TestCase):
+    def setUp(self):
+        self.result = DDIResult(
+            drugs=[
+                DrugMapping('Ecosprin', "Aspirin (from 'Ecosprin')", 'Aspirin (75mg)', 100, ['1191'],
+                            "• Correction: 'Ecosprin' mapped to 'Aspirin (75mg)'"),
+                DrugMapping('Warfarin', 'Warfarin', 'Warfarin', 100, ['11289']),
+            ],
+            interactions=[InteractionPair('aspirin', 'warfarin', 'high', 'Bleeding risk.', 'Test', '1191', '11289')]
+        )
+
+    def test_to_text(self):
+        text = self.result.to_text()
+        self.assertIn("--- Identified Drugs (Official) ---", text)
+        self.assertIn("• Correction: 'Ecosprin' mapped to 'Aspirin (75mg)'", text)
+        self.assertIn("• [SEVERITY: high] aspirin + warfarin", text)
+
+    def test_to_text_not_enough_drugs(self):
+        single = DDIResult(drugs=self.result.drugs[1:])
+        self.assertFalse(single.checked)
+        self.assertIn("Need at least two", single.to_text())
+
+    def test_to_graph_data(self):
+        data = self.result.to_graph_data('Jane')
+        self.assertEqual(data['patient_name'], 'Jane')
+        self.assertEqual(data['drugs'], ['Aspirin', 'Warfarin'])
+        self.assertEqual(data['relationships'][0]['source'], 'Aspirin')
+        self.assertEqual(data['relationships'][0]['target'], 'Warfarin')
+        self.assertEqual(data['relationships'][0]['type'], 'Risk')
+
+    def test_merge_graph_data_keeps_gemini_graph(self):
+        gemini = {'patient_name': 'Jane', 'date': '12/03/2024', 'diagnosis': ['CAD'], 'drugs': ['aspirin', 'Warfarin'],
+                  'relationships': [{'source': 'aspirin', 'target': 'CAD', 'type': 'Treats', 'description': 'Antiplatelet'}]}
+        data = self.result.merge_graph_data(gemini)
+        self.assertEqual((data['patient_name'], data['diagnosis']), ('Jane', ['CAD']))
+        self.assertEqual(data['drugs'], ['aspirin', 'Warfarin'])
+        self.assertEqual([(r['source'], r['target'], r['type']) for r in data['relationships']],
+                         [('aspirin', 'CAD', 'Treats'), ('aspirin', 'Warfarin', 'Risk')])
+        # Merging again does not duplicate the Risk edge
+        self.assertEqual(len(self.result.merge_graph_data(data)['relationships']), 2)
+
+class TestDDICache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = DDICache(os.path.join(self.tmp.name, "ddi_cache.db"), enabled=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        self.assertTrue(self.cache.is_empty())
+        self.cache.set_resolution("Ecosprin", "Aspirin", 90)
+        self.cache.set_rxcui("aspirin", "1191")
+        self.cache.set_rxcui("notadrug", None)
+        self.cache.set_pair("1191", "11289", fake_interactions(['11289', '1191']))
+        self.cache.set_pair("1191", "6809", [])
+
+        self.assertEqual(self.cache.get_resolution("ecosprin"), ("Aspirin", 90))
+        self.assertEqual(self.cache.get_rxcui("aspirin"), (True, "1191"))
+        self.assertEqual(self.cache.get_rxcui("notadrug"), (True, None))
+        self.assertEqual(self.cache.get_rxcui("unknown"), (False, None))
+        self.assertEqual(self.cache.get_pair("11289", "1191")[0].severity, 'high')
+        self.assertEqual(self.cache.get_pair("6809", "1191"), [])
+        self.assertIsNone(self.cache.get_pair("5640", "1191"))
+
+    def test_entries_expire_and_negative_entries_expire_sooner(self):
+        cache = DDICache(self.cache.path, enabled=True, ttl=30 * 86400, negative_ttl=3600)
+        cache.set_rxcui("aspirin", "1191")
+        cache.set_rxcui("asprin", None)
+        cache.set_pair("1191", "11289", [])
+        cache._conn().execute("UPDATE rxcui_cache SET updated_at = datetime('now', '-2 hours')")
+        self.assertEqual(cache.get_rxcui("aspirin"), (True, "1191"))
+        self.assertEqual(cache.get_rxcui("asprin"), (False, None))  # retried after an hour
+
+        cache._conn().execute("UPDATE pair_cache SET updated_at = datetime('now', '-31 days')")
+        self.assertIsNone(cache.get_pair("1191", "11289"))
+
+    def test_warm_pairs_stores_every_pair(self):
+        cuis = list(RXCUIS.values())
+        with mock.patch.object(drug_client, 'ddi_cache', self.cache), \
+             mock.patch.object(drug_client, 'fetch_interactions', side_effect=fake_interactions) as fetch:
+            stored = drug_client.warm_pairs(cuis, chunk_size=4)
+        # 2 groups of 2 -> 3 batched calls instead of 6 pair calls
+        self.assertEqual(fetch.call_count, 3)
+        self.assertEqual(stored, 6)
+        self.assertEqual(self.cache.stats()['pair_cache'], 6)
+
+    def test_warm_up_skips_disabled_cache_and_stops_when_offline(self):
+        from core import cache_warmup
+        names = ['warfarin', 'aspirin', 'ibuprofen', 'metformin']
+        offline = lambda name: DrugMapping(name, name, name, lookup_error="RxNav unreachable")
+        with mock.patch.object(cache_warmup, 'ddi_cache', self.cache), \
+             mock.patch.object(cache_warmup, '_rxnav_failing', return_value=False), \
+             mock.patch.object(drug_client, 'resolve_drug', side_effect=offline) as resolve, \
+             mock.patch.object(drug_client, 'warm_pairs') as warm_pairs:
+            self.cache.enabled = False
+            self.assertFalse(self.cache.is_empty())
+            self.assertEqual(cache_warmup.warm_up(names=names)['drugs'], 0)
+            resolve.assert_not_called()
+
+            self.cache.enabled = True
+            stats = cache_warmup.warm_up(names=names)
+        self.assertTrue(stats['stopped'])
+        self.assertEqual(resolve.call_count, 1)  # the probe failed, nothing else was tried
+        warm_pairs.assert_not_called()
+
+class TestTriage(unittest.TestCase):
+    def setUp(self):
+        drug_client.clear_caches()
+
+    def test_stops_at_first_major_and_reports_lazily(self):
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=lambda n: RXCUIS.get(n.lower())), \
+             mock.patch.object(drug_client, 'get_pair_interactions', side_effect=lambda a, b: fake_interactions([a, b])) as pairs:
+            result = triage(["Metformin", "Ibuprofen", "Aspirin", "Warfarin"])
+            # anticoagulant + antiplatelet has the highest prior, so it is checked first
+            self.assertTrue(result.has_major)
+            self.assertEqual(pairs.call_count, 1)
+            self.assertEqual((result.pairs_checked, result.pairs_total), (1, 6))
+            self.assertIn("MAJOR INTERACTION", result.summary())
+
+            # The full report only fetches the 5 remaining pairs
+            report = result.report()
+            self.assertEqual(pairs.call_count, 6)
+            self.assertEqual(len(report.interactions), 1)
+
+    def test_unrated_pairs_are_reported_without_stopping(self):
+        def drugbank(a, b):
+            # DrugBank lists the pair without a severity
+            return [InteractionPair(p.drug1, p.drug2, 'N/A', p.description, 'DrugBank', p.rxcui1, p.rxcui2)
+                    for p in fake_interactions([a, b])]
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=lambda n: RXCUIS.get(n.lower())), \
+             mock.patch.object(drug_client, 'get_pair_interactions', side_effect=drugbank) as pairs:
+            result = triage(["Metformin", "Aspirin", "Warfarin"])
+        self.assertFalse(result.has_major)
+        self.assertTrue(result.complete)
+        self.assertEqual(pairs.call_count, 3)
+        self.assertEqual(len(result.unclassified), 1)
+        self.assertIn("Unrated interactions (no severity from the source, review manually): ", result.summary())
+
+    def test_resolution_counts_against_the_deadline(self):
+        def slow_rxcui(name):
+            time.sleep(0.05)
+            return RXCUIS.get(name.lower())
+        seen = []
+        with mock.patch.object(drug_client, 'get_rxcui', side_effect=slow_rxcui), \
+             mock.patch.object(drug_client, 'get_pair_interactions', side_effect=lambda a, b: seen.append(remaining_time()) or []):
+            triage(["Metformin", "Ibuprofen"], deadline=10)
+        self.assertLess(seen[0], 9.95)
+
+    def test_priors(self):
+        self.assertEqual(drug_classes("Warfarin Sodium"), {'anticoagulant'})
+        self.assertGreater(pair_prior({'anticoagulant'}, {'nsaid'}), pair_prior({'statin'}, {'nsaid'}))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import fast_path, gemini_client
+from core.ddi_results import InteractionPair, DrugMapping, DDIResult
+
+LOCAL_DB = {'ecosprin': ('Aspirin', 90), 'warf': ('Warfarin', 100), 'aspirin': ('Aspirin', 100)}
+
+def fake_resolve(name):
+    return LOCAL_DB.get(name.lower(), (name, 0))
+
+def fake_check(names, deadline=None):
+    return DDIResult(
+        drugs=[DrugMapping(n, n, n, 100, [str(i)]) for i, n in enumerate(names)],
+        interactions=[InteractionPair('Aspirin', 'Warfarin', 'high', 'Bleeding risk.', 'Test', '0', '1')])
+
+class TestFastPath(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(fast_path.drug_client, 'resolve_local', side_effect=fake_resolve),
+                   mock.patch.object(fast_path.drug_client, 'check_interactions', side_effect=fake_check),
+                   mock.patch.object(gemini_client, 'local_lookup', return_value=("", {'Aspirin', 'Warfarin'}))]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_gate(self):
+        clean = fast_path.assess("Tab Ecosprin 75 mg OD\nTab Warf 5 mg")
+        self.assertEqual(clean.generics, ['Aspirin', 'Warfarin'])
+        self.assertTrue(fast_path.use_fast_path(clean, 'auto'))
+        self.assertFalse(fast_path.use_fast_path(clean, 'llm'))
+
+        messy = fast_path.assess("Tab Ecosprn 75\nCap Xyzzol 20\nSyp Qwerty 5")
+        self.assertFalse(messy.confident)
+        self.assertTrue(fast_path.use_fast_path(messy, 'local'))
+        # Skipping the LLM review is opt-in
+        with mock.patch.object(fast_path, 'ANALYSIS_MODE', 'llm'):
+            self.assertFalse(fast_path.use_fast_path(clean))
+
+    def test_pipeline_skips_llm_when_confident(self):
+        with mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75\nTab Warf 5"), \
+             mock.patch.object(gemini_client, 'enhance_ocr_text') as enhance, \
+             mock.patch.object(gemini_client, 'analyze_text') as analyze_text:
+            result = gemini_client.run_analysis_pipeline("rx.jpg", {'name': 'Ravi'}, mode='auto')
+
+        enhance.assert_not_called()
+        analyze_text.assert_not_called()
+        self.assertEqual(result['mode'], 'local')
+        self.assertEqual(sorted(result['drugs']), ['Aspirin', 'Warfarin'])
+        self.assertIn("[high] Aspirin + Warfarin: Bleeding risk.", result['text'])
+        self.assertIn("Consult the prescriber", result['analysis'].analysis_text)
+        self.assertIn(fast_path.NO_LLM_NOTICE, result['text'])
+        self.assertEqual(result['graph_data'].relationships[0].type, 'Risk')
+        self.assertEqual([s['name'] for s in result['spans']], ['preprocess', 'ocr', 'fast_path_gate', 'local_analysis'])
+
+if __name__ == '__main__':
+    unittest.main()
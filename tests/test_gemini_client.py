@@ -0,0 +1,278 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+import time
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import gemini_client
+from core.llm_cache import LLMCache, cache_key
+from core.pipeline import Stage, StageError, run_stages
+from core.model_router import ModelRouter, router
+from core.rate_limiter import limiter
+from core.ddi_cache import ddi_cache
+
+def setUpModule():
+    # Quota penalties from one test must not slow down the next
+    limiter.enabled = False
+    # Keep the persistent DDI cache out of the tests
+    ddi_cache.enabled = False
+
+def tearDownModule():
+    limiter.enabled = True
+    ddi_cache.enabled = True
+
+def fake_model_factory(replies, calls):
+    """GenerativeModel stand-in: `replies` maps model name -> text or Exception."""
+    def factory(model_name):
+        model = mock.Mock()
+        def generate_content(prompt, generation_config=None, stream=False):
+            calls.append(model_name)
+            reply = replies[model_name]
+            if isinstance(reply, Exception):
+                raise reply
+            if stream:
+                return [mock.Mock(text=reply[i:i + 5]) for i in range(0, len(reply), 5)]
+            return mock.Mock(text=reply)
+        model.generate_content.side_effect = generate_content
+        return model
+    return factory
+
+class TestLLMCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = LLMCache(os.path.join(self.tmp.name, "llm_cache.db"), max_bytes=100, enabled=True)
+        self.patch = mock.patch.object(gemini_client, 'llm_cache', self.cache)
+        self.patch.start()
+        router.reset()
+
+    def tearDown(self):
+        self.patch.stop()
+        self.tmp.cleanup()
+
+    def test_key_depends_on_model_prompt_and_config(self):
+        base = cache_key('m1', 'prompt')
+        self.assertEqual(base, cache_key('m1', 'prompt', {}))
+        self.assertNotEqual(base, cache_key('m2', 'prompt'))
+        self.assertNotEqual(base, cache_key('m1', 'prompt 2'))
+        self.assertNotEqual(base, cache_key('m1', 'prompt', {'temperature': 0.5}))
+
+    def test_repeated_prompt_is_served_from_cache(self):
+        calls = []
+        with mock.patch.object(gemini_client.genai, 'GenerativeModel',
+                               side_effect=fake_model_factory({'a': RuntimeError("quota"), 'b': '["Aspirin"]'}, calls)):
+            first = gemini_client.generate_with_fallback(['a', 'b'], "list drugs", parse=gemini_client.parse_generics_list)
+            second = gemini_client.generate_with_fallback(['a', 'b'], "list drugs", parse=gemini_client.parse_generics_list)
+            with self.cache.bypass():
+                gemini_client.generate_with_fallback(['a', 'b'], "list drugs")
+
+        self.assertEqual(first, ["Aspirin"])
+        self.assertEqual(second, ["Aspirin"])
+        # Second call hit the cached answer of model 'b' without touching the API; bypass went to
+        # the API again, straight to 'b' since 'a' is cooling down after its quota error
+        self.assertEqual(calls, ['a', 'b', 'b'])
+        self.assertEqual(self.cache.hits, 1)
+
+    def test_size_bounded_eviction(self):
+        for i in range(5):
+            self.cache.set(f"k{i}", "x" * 30)
+        self.cache.get("k2")  # recently used entries survive
+        self.cache.set("k5", "x" * 30)
+        stats = self.cache.stats()
+        self.assertLessEqual(stats['bytes'], 100)
+        self.assertIsNotNone(self.cache.get("k2"))
+        self.assertIsNone(self.cache.get("k0"))
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        router.reset()
+
+    def test_chunks_are_pushed_as_they_arrive(self):
+        chunks = []
+        with mock.patch.object(gemini_client, 'llm_cache', LLMCache(enabled=False)), \
+             mock.patch.object(gemini_client.genai, 'GenerativeModel',
+                               side_effect=fake_model_factory({'a': "Identified Medications: Aspirin"}, [])):
+            text = gemini_client.generate_with_fallback(['a'], "analyze", on_chunk=chunks.append)
+        self.assertEqual(text, "Identified Medications: Aspirin")
+        self.assertEqual(chunks[0], "Ident")
+        self.assertEqual(chunks[-1], text)
+        self.assertEqual(len(chunks), 7)
+
+class TestModelRouter(unittest.TestCase):
+    def test_failing_model_cools_down_and_model_objects_are_reused(self):
+        r = ModelRouter(failure_threshold=2, cooldown=60)
+        calls = []
+        replies = {'a': RuntimeError("500 internal"), 'b': 'ok'}
+        with mock.patch.object(gemini_client, 'router', r), \
+             mock.patch.object(gemini_client, 'llm_cache', LLMCache(enabled=False)), \
+             mock.patch.object(gemini_client.genai, 'GenerativeModel', side_effect=fake_model_factory(replies, calls)) as factory:
+            for i in range(4):
+                gemini_client.generate_with_fallback(['a', 'b'], f"prompt {i}")
+
+        # 'a' failed twice, then was skipped to the back of the chain
+        self.assertEqual(calls, ['a', 'b', 'a', 'b', 'b', 'b'])
+        self.assertEqual(r.order(['a', 'b']), ['b', 'a'])
+        self.assertEqual(factory.call_count, 2)
+        stats = r.stats()
+        self.assertEqual(stats['a']['success_rate'], 0)
+        self.assertEqual(stats['b']['success_rate'], 1)
+        self.assertIsNotNone(stats['b']['p95'])
+        self.assertIn("b: 4 calls, 100% success", r.format_stats())
+
+    def test_quota_error_cools_down_immediately(self):
+        r = ModelRouter(failure_threshold=5, cooldown=60)
+        r.record_failure('a', RuntimeError("429 Resource exhausted"))
+        self.assertFalse(r.is_healthy('a'))
+        r.record_success('a', 0.1)
+        self.assertTrue(r.is_healthy('a'))
+
+class TestStageDAG(unittest.TestCase):
+    def test_independent_stages_overlap(self):
+        def slow(value):
+            def fn(**deps):
+                time.sleep(0.2)
+                return value
+            return fn
+        stages = [
+            Stage('a', slow(1)),
+            Stage('b', slow(2), deps=['a']),
+            Stage('c', slow(3), deps=['a']),
+            Stage('d', lambda b, c: b + c, deps=['b', 'c']),
+        ]
+        start = time.time()
+        results, timings = run_stages(stages)
+        self.assertEqual(results['d'], 5)
+        self.assertLess(time.time() - start, 0.55)  # a + max(b, c), not a + b + c
+        self.assertGreaterEqual(timings['b'][0], timings['a'][1])
+
+    def test_failures(self):
+        def boom():
+            raise RuntimeError("down")
+        results, _ = run_stages([Stage('x', boom, optional=True), Stage('y', lambda x: x, deps=['x'])])
+        self.assertIsNone(results['y'])
+        with self.assertRaises(StageError) as ctx:
+            run_stages([Stage('x', boom)])
+        self.assertEqual(ctx.exception.stage, 'x')
+
+class TestAnalysisPipeline(unittest.TestCase):
+    def test_llm_stages_run_concurrently(self):
+        def slow(value):
+            def fn(*args, **kwargs):
+                time.sleep(0.2)
+                return value
+            return fn
+        graph = {'drugs': ['Aspirin'], 'relationships': []}
+        with mock.patch.object(gemini_client, 'api_key', 'test'), \
+             mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75"), \
+             mock.patch.object(gemini_client, 'enhance_ocr_text', side_effect=slow("Ecosprin 75mg")), \
+             mock.patch.object(gemini_client, 'analyze_text', side_effect=slow("**Analysis**")), \
+             mock.patch.object(gemini_client, 'extract_generics_gemini', side_effect=slow([])), \
+             mock.patch.object(gemini_client, 'extract_extended_graph_data_gemini', side_effect=slow(graph)):
+            start = time.time()
+            result = gemini_client.run_analysis_pipeline("rx.jpg", mode="llm")
+            elapsed = time.time() - start
+
+        self.assertLess(elapsed, 0.6)  # enhance + max(analysis, generics, graph)
+        self.assertEqual(result['graph_data'].drugs, ['Aspirin'])
+        spans = {s['name']: s for s in result['spans']}
+        self.assertEqual(set(spans), {'preprocess', 'ocr', 'fast_path_gate', 'enhance', 'analysis', 'generics', 'graph_data', 'local_lookup'})
+        self.assertGreaterEqual(spans['analysis']['duration'], 0.2)
+        self.assertEqual(result['analysis'].analysis_text, "Analysis")
+        self.assertIn("--- Step 3: Extracted Analysis ---\nAnalysis", result['text'])
+
+    def test_structured_mode_makes_one_llm_call(self):
+        reply = json.dumps({
+            'analysis_text': "## Identified Medications\n- Ecosprin 75mg",
+            'generics': ["Aspirin", "Aspirin"],
+            'graph': {'patient_name': 'Ravi', 'date': 'Unknown', 'diagnosis': ['CAD'], 'drugs': ['Aspirin'],
+                      'relationships': [{'source': 'Aspirin', 'target': 'CAD', 'type': 'Treats', 'description': 'Treats'}]}
+        })
+        with mock.patch.object(gemini_client, 'api_key', 'test'), \
+             mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75"), \
+             mock.patch.object(gemini_client, 'enhance_ocr_text', return_value="Ecosprin 75mg"), \
+             mock.patch.object(gemini_client, 'generate_with_fallback',
+                               side_effect=lambda models, prompt, parse, **kw: parse(reply)) as generate, \
+             mock.patch.object(gemini_client, 'analyze_text') as analyze_text:
+            result = gemini_client.run_analysis_pipeline("rx.jpg", structured=True, mode="llm")
+
+        self.assertEqual(generate.call_count, 1)
+        analyze_text.assert_not_called()
+        analysis = result['analysis']
+        self.assertEqual(analysis.generics, ["Aspirin"])
+        self.assertEqual(analysis.graph.relationships[0].type, 'Treats')
+        self.assertIs(result['graph_data'], analysis.graph)
+        self.assertIn("Identified Medications\n- Ecosprin 75mg", result['text'])
+
+    def test_speculative_lookup_overlaps_enhancement(self):
+        def slow(value):
+            def fn(*args, **kwargs):
+                time.sleep(0.2)
+                return value
+            return fn
+        ddi = mock.Mock(name='DDIResult')
+        resolve = lambda name: ("Aspirin", 100, {'uses': 'Pain', 'side_effects': '', 'brands_sample': ''})
+        with mock.patch.object(gemini_client, 'api_key', 'test'), \
+             mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75"), \
+             mock.patch.object(gemini_client.fast_path.drug_client, 'resolve_local', return_value=("Aspirin", 100)), \
+             mock.patch.object(gemini_client, '_resolve_generic', side_effect=resolve) as resolve_generic, \
+             mock.patch.object(gemini_client.drug_client, 'check_interactions', side_effect=slow(ddi)) as check, \
+             mock.patch.object(gemini_client, 'enhance_ocr_text', side_effect=slow("Ecosprin 75mg")), \
+             mock.patch.object(gemini_client, 'analyze_text', return_value="Analysis"), \
+             mock.patch.object(gemini_client, 'extract_generics_gemini', return_value=["aspirin"]), \
+             mock.patch.object(gemini_client, 'extract_extended_graph_data_gemini', return_value={}):
+            start = time.time()
+            result = gemini_client.run_analysis_pipeline("rx.jpg", mode="llm")
+            elapsed = time.time() - start
+
+        self.assertLess(elapsed, 0.35)  # the interaction check ran during enhancement
+        check.assert_called_once()
+        resolve_generic.assert_called_once_with("Aspirin")  # Gemini's generic reused the speculative resolution
+        self.assertIs(result['ddi_result'], ddi)
+        self.assertEqual(result['drugs'], ["Aspirin"])
+        self.assertIn("[Generic: Aspirin]", result['text'])
+
+    def test_reconcile_only_checks_pairs_the_speculation_missed(self):
+        from core.ddi_results import DDIResult, DrugMapping
+        mapping = lambda name, cui: DrugMapping(name, name, name, 100, [cui])
+        speculative = {'generics': ['Aspirin', 'Metformin'],
+                       'ddi_result': DDIResult(drugs=[mapping('Aspirin', '1191'), mapping('Metformin', '6809')])}
+        with mock.patch.object(gemini_client.drug_client, 'resolve_drug', return_value=mapping('Warfarin', '11289')) as resolve, \
+             mock.patch.object(gemini_client.drug_client, 'get_pair_interactions', return_value=[]) as pairs:
+            result = gemini_client.reconcile_interactions(speculative, ['Aspirin', 'Metformin', 'Warfarin'])
+
+        resolve.assert_called_once_with('Warfarin')
+        self.assertEqual(sorted(c.args for c in pairs.call_args_list), [('11289', '1191'), ('11289', '6809')])
+        self.assertEqual(result.rxcuis, ['1191', '6809', '11289'])
+
+    def test_reuse_is_decided_on_the_ocr_text(self):
+        stored = {'text': "stored report", 'drugs': ['Aspirin'], 'analysis': None, 'graph_data': None}
+        seen = []
+        def reuse(ocr_text):
+            seen.append(ocr_text)
+            return stored if "Ecosprin" in ocr_text else None
+        with mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75"), \
+             mock.patch.object(gemini_client, 'analyze_text') as analyze_text:
+            result = gemini_client.run_analysis_pipeline("rx.jpg", mode="llm", reuse=reuse)
+
+        self.assertEqual(seen, ["Tab Ecosprin 75"])
+        analyze_text.assert_not_called()
+        self.assertEqual((result['text'], result['ocr_text']), ("stored report", "Tab Ecosprin 75"))
+        self.assertIn('reuse_check', {s['name'] for s in result['spans']})
+
+    def test_fast_path_error_returns_failure(self):
+        with mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75"), \
+             mock.patch.object(gemini_client.fast_path, 'assess', side_effect=RuntimeError("drug db corrupt")):
+            result = gemini_client.run_analysis_pipeline("rx.jpg")
+        self.assertEqual((result['text'], result['drugs']), ("Error during analysis: drug db corrupt", []))
+
+    def test_ocr_failure(self):
+        with mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Error: timeout"):
+            text, drugs = gemini_client.analyze_prescription("rx.jpg")
+        self.assertEqual((text, drugs), ("OCR Failed: Error: timeout", []))
+
+if __name__ == '__main__':
+    unittest.main()
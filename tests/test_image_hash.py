@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+import random
+import tempfile
+from unittest import mock
+
+from PIL import Image, ImageDraw
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import database
+from core.image_hash import dhash, hamming, same_content
+
+def prescription_image(seed):
+    """A white page with random dark 'text' strokes."""
+    rng = random.Random(seed)
+    img = Image.new('L', (1200, 1600), 255)
+    draw = ImageDraw.Draw(img)
+    for _ in range(60):
+        x, y = rng.randrange(50, 1000), rng.randrange(50, 1500)
+        draw.rectangle([x, y, x + rng.randrange(80, 300), y + rng.randrange(15, 40)], fill=rng.randrange(0, 90))
+    return img
+
+GLYCOMET_RX = "City Clinic\nPatient: Ravi Kumar 58 M\nTab Glycomet 500mg 1-0-1 x 30 days\nTab Telma 40mg 0-0-1 x 30 days"
+WARFARIN_RX = ("City Clinic\nPatient: Ravi Kumar 58 M\nTab Warfarin 5mg 0-0-1 x 30 days\nTab Aspirin 75mg 1-0-0 x 30 days\n"
+               "Tab Clopidogrel 75mg 1-0-0 x 30 days")
+
+def letterhead_image(lines):
+    """A clinic letterhead with small handwritten-size drug lines below it."""
+    img = Image.new('L', (1200, 1600), 255)
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([0, 0, 1200, 300], fill=40)
+    draw.rectangle([0, 1450, 1200, 1600], fill=90)
+    for i, line in enumerate(lines.splitlines()):
+        draw.text((80, 400 + 30 * i), line, fill=0)
+    return img
+
+class TestImageDedupe(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.original = os.path.join(self.tmp.name, "rx.png")
+        prescription_image(1).save(self.original)
+
+        # Same photo re-uploaded: smaller, re-compressed JPEG with a slight crop
+        self.reupload = os.path.join(self.tmp.name, "rx_again.jpg")
+        with Image.open(self.original) as img:
+            img.crop((10, 10, 1190, 1590)).resize((600, 800)).save(self.reupload, quality=60)
+
+        self.other = os.path.join(self.tmp.name, "other.png")
+        prescription_image(2).save(self.other)
+
+    def test_near_duplicates_are_close(self):
+        self.assertLessEqual(hamming(dhash(self.original), dhash(self.reupload)), 3)
+        self.assertGreater(hamming(dhash(self.original), dhash(self.other)), 10)
+
+    def test_lookup_requires_same_patient(self):
+        patient = {'name': 'Ravi', 'age': '58', 'gender': 'Male', 'weight': '70', 'body_type': 'Average'}
+        with mock.patch.object(database, 'DB_NAME', os.path.join(self.tmp.name, "test.db")):
+            database.init_db()
+            analysis_id = database.save_analysis("ravi", self.original, "stored report")
+            database.save_image_hash(analysis_id, dhash(self.original), patient, {'drugs': ['Aspirin']})
+
+            match = database.find_similar_analysis(dhash(self.reupload), dict(patient, name=' ravi '))
+            self.assertEqual((match['analysis_id'], match['result_text']), (analysis_id, "stored report"))
+            self.assertEqual(match['result']['drugs'], ['Aspirin'])
+            self.assertIsNone(database.find_similar_analysis(dhash(self.reupload), dict(patient, age='59')))
+            self.assertIsNone(database.find_similar_analysis(dhash(self.other), patient))
+
+    def test_shared_letterhead_needs_matching_text(self):
+        first = os.path.join(self.tmp.name, "glycomet.png")
+        second = os.path.join(self.tmp.name, "warfarin.png")
+        letterhead_image(GLYCOMET_RX).save(first)
+        letterhead_image(WARFARIN_RX).save(second)
+        patient = {'name': 'Ravi', 'age': '58'}
+        with mock.patch.object(database, 'DB_NAME', os.path.join(self.tmp.name, "test.db")):
+            database.init_db()
+            analysis_id = database.save_analysis("ravi", first, "Glycomet + Telma report")
+            database.save_image_hash(analysis_id, dhash(first), patient, {'ocr_text': GLYCOMET_RX})
+            # The layout hash cannot tell the two prescriptions apart...
+            match = database.find_similar_analysis(dhash(second), patient)
+        self.assertIsNotNone(match)
+        # ...the OCR text can
+        self.assertFalse(same_content(match['result']['ocr_text'], WARFARIN_RX))
+        self.assertFalse(same_content(GLYCOMET_RX, GLYCOMET_RX.replace("500mg", "1000mg")))
+        self.assertFalse(same_content(None, GLYCOMET_RX))  # stored before OCR text was kept
+        self.assertTrue(same_content(GLYCOMET_RX, GLYCOMET_RX.replace("Clinic\n", "Clinic.\n\n")))
+
+if __name__ == '__main__':
+    unittest.main()
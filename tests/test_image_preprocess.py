@@ -0,0 +1,54 @@
+import unittest
+import os
+import sys
+import random
+import tempfile
+
+from PIL import Image
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.image_preprocess import ImagePreprocessor
+
+class TestImagePreprocessor(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pre = ImagePreprocessor(cache_dir=os.path.join(self.tmp.name, "cache"), max_side=800, enabled=True)
+
+        # A noisy 3000x2000 "phone photo" stored rotated (EXIF orientation 6 = rotate 90 degrees CW)
+        img = Image.frombytes('RGB', (3000, 2000), random.Random(1).randbytes(3000 * 2000 * 3))
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        self.photo = os.path.join(self.tmp.name, "photo.jpg")
+        img.save(self.photo, quality=95, exif=exif)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_shrinks_orients_and_caches(self):
+        first = self.pre.process(self.photo)
+        self.assertFalse(first.cached)
+        self.assertNotEqual(first.path, self.photo)
+        self.assertGreater(first.bytes_saved, 0)
+        with Image.open(first.path) as out:
+            self.assertEqual(out.mode, 'L')
+            self.assertEqual(out.size, (533, 800))  # portrait after EXIF rotation, longest side 800
+
+        second = self.pre.process(self.photo)
+        self.assertTrue(second.cached)
+        self.assertEqual(second.path, first.path)
+        self.assertEqual(self.pre.stats()['cache_hits'], 1)
+
+    def test_small_or_unreadable_images_pass_through(self):
+        small = os.path.join(self.tmp.name, "small.png")
+        Image.new('L', (50, 20), 255).save(small)
+        self.assertEqual(self.pre.process(small).path, small)
+
+        broken = os.path.join(self.tmp.name, "broken.jpg")
+        with open(broken, 'wb') as f:
+            f.write(b"not an image")
+        self.assertEqual(self.pre.process(broken).path, broken)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.ocr_correct import OCRCorrector, edit_distance
+
+WORDS = {'ecosprin': 5, 'telma': 4, 'telmisartan': 3, 'glycomet': 2,
+         'tab': 1000, 'capsule': 1000, 'after': 1000, 'food': 1000, 'bd': 1000, 'od': 1000}
+
+class TestOCRCorrector(unittest.TestCase):
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("ecospirn", "ecosprin", 2), 1)  # adjacent swap
+        self.assertEqual(edit_distance("glycomt", "glycomet", 2), 1)
+        self.assertEqual(edit_distance("aspirin", "telmisartan", 2), 3)
+
+    def test_corrects_drugs_and_lexicon_keeping_layout(self):
+        c = OCRCorrector(words=dict(WORDS))
+        text = "1. Tab Ecospirn 75mg 0D afetr fo0d\n2. T4b Te1ma 40mg 8D\n3. Capsuel Glycomt 500mg 1-0-1"
+        self.assertEqual(c.correct_text(text),
+                         "1. Tab Ecosprin 75mg OD after food\n2. Tab Telma 40mg BD\n3. Capsule Glycomet 500mg 1-0-1")
+
+    def test_leaves_unknown_and_short_words(self):
+        c = OCRCorrector(words=dict(WORDS))
+        self.assertEqual(c.correct_text("Ravi Kumar, Tb x 5 days"), "Ravi Kumar, Tb x 5 days")
+
+    def test_names_outside_drug_lines_are_not_turned_into_brands(self):
+        c = OCRCorrector(words=dict(WORDS))
+        text = "Patient: Telmo Das\nDr. Glycomat, MBBS\nTab Telmo 40mg afetr food"
+        self.assertEqual(c.correct_text(text),
+                         "Patient: Telmo Das\nDr. Glycomat, MBBS\nTab Telma 40mg after food")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+import os
+import sys
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import ocr_quality, fast_path, gemini_client
+from core.ocr_quality import EnhancementGate, score_text
+
+VOCABULARY = {'ecosprin': [], 'telma': [], 'glycomet': []}
+GENERICS = {'ecosprin': 'Aspirin', 'telma': 'Telmisartan', 'glycomet': 'Metformin'}
+
+def fake_resolve(name):
+    generic = GENERICS.get(name.lower())
+    return (generic, 100) if generic else (name, 0)
+
+class TestEnhancementGate(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(ocr_quality, 'drug_vocabulary', return_value=VOCABULARY),
+                   mock.patch.object(fast_path.drug_client, 'resolve_local', side_effect=fake_resolve)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_scores(self):
+        clean = score_text("Tab Ecosprin 75mg OD after food\nTab Telma 40mg 1-0-0\nTab Glycomet 500mg BD")
+        self.assertTrue(clean.skip, clean.reason)
+        self.assertEqual(clean.garbage, 0.0)
+
+        noisy = score_text("Tab Ecosprin 75mg O|D af#er fo0d\nT@b Te1ma 4Omg 1-0-0 ~~")
+        self.assertFalse(noisy.skip)
+        self.assertGreater(noisy.garbage, 0.1)
+
+    def test_pipeline_skips_enhancement_for_clean_text(self):
+        gate = EnhancementGate(enabled=True)
+        gate.record_enhancement(2.0)
+        with mock.patch.object(gemini_client, 'enhance_gate', gate), \
+             mock.patch.object(gemini_client, 'SPECULATIVE_LOOKUP', False), \
+             mock.patch.object(gemini_client, 'api_key', 'test'), \
+             mock.patch.object(gemini_client, 'perform_ocr_puter', return_value="Tab Ecosprin 75mg OD\nTab Telma 40mg OD"), \
+             mock.patch.object(gemini_client, 'enhance_ocr_text') as enhance, \
+             mock.patch.object(gemini_client, 'analyze_text', return_value="Analysis"), \
+             mock.patch.object(gemini_client, 'extract_generics_gemini', return_value=[]), \
+             mock.patch.object(gemini_client, 'extract_extended_graph_data_gemini', return_value={}):
+            result = gemini_client.run_analysis_pipeline("rx.jpg", mode="llm")
+
+        enhance.assert_not_called()
+        self.assertTrue(result['enhance_gate']['skip'])
+        self.assertEqual(gate.stats()['saved_seconds'], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.prompt_compact import compact_text, estimate_tokens
+from core.gemini_client import format_analysis_output
+
+OCR = """Dr. A. Rao, MBBS MD - City Clinic
+Ph: 080 2345 6789  www.cityclinic.in
+Patient: Ravi Kumar, 58 M
+1. Tab Glycomet 500mg 1-0-1
+2. Tab Telma 40mg 1-0-0
+Reg. No 12345"""
+
+ANALYSIS = """Identified Medications
+- Glycomet (Metformin)
+
+Knowledge Graph Representation
+- Patient (Ravi) -> presents with -> Diabetes
+- Doctor -> prescribes -> Glycomet
+
+Recommendations
+- Monitor blood glucose
+
+Disclaimer: This is an AI analysis and requires professional verification."""
+
+class TestPromptCompaction(unittest.TestCase):
+    def test_report_is_reduced_to_medical_content(self):
+        report = format_analysis_output(OCR, OCR, ANALYSIS, "\nFrom the Drug dataset / database\n\n[Generic: Metformin]\n  - Uses: Diabetes\n")
+        compacted = compact_text(report, drugs=['Metformin', 'Telmisartan'])
+
+        self.assertEqual(compacted.splitlines(), [
+            "Dr. A. Rao, MBBS MD - City Clinic",
+            "Patient: Ravi Kumar, 58 M",
+            "1. Tab Glycomet 500mg 1-0-1",
+            "2. Tab Telma 40mg 1-0-0",
+            "Identified Medications",
+            "- Glycomet (Metformin)",
+            "Recommendations",
+            "- Monitor blood glucose",
+            "Possible drugs (unverified local matches, confirm against the text): Metformin, Telmisartan",
+        ])
+        self.assertLess(estimate_tokens(compacted), estimate_tokens(report) / 3)
+
+    def test_prescription_lines_are_kept(self):
+        text = ("Tab Glycomet 500mg\n1-0-1 after food x 30 days\nTab Telma 40mg\n1-0-1 after food x 30 days\n"
+                "Timing: take Telma at bedtime\nClinic timings: 10am - 2pm")
+        self.assertEqual(compact_text(text).splitlines(), text.splitlines()[:5])
+
+    def test_only_whole_boilerplate_lines_are_dropped(self):
+        text = ("Tab Dolo 650mg sign. 1-1-1 x 5 days\nInj Insulin 10 units 08:00 12:00 20:00\n"
+                "Mob: 98450 12345, Reg. No KMC-4521\nSignature: ________")
+        self.assertEqual(compact_text(text).splitlines(), text.splitlines()[:2])
+
+    def test_repeated_report_sections_are_dropped(self):
+        # Enhancement skipped: the "enhanced" section repeats the OCR text verbatim
+        report = format_analysis_output(OCR, OCR, OCR, "")
+        compacted = compact_text(report)
+        self.assertEqual(compacted.count("Tab Telma 40mg"), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import puter_client
+from core.puter_client import PuterSession
+
+class FakePuterClient:
+    logins = 0
+
+    def __init__(self, token=None):
+        self.token = token
+
+    async def login(self, username, password):
+        FakePuterClient.logins += 1
+        self.token = f"token-{FakePuterClient.logins}"
+
+    async def close(self):
+        pass
+
+async def fake_ocr(client, image_path):
+    # The first token has expired
+    if client.token == "token-1":
+        return "Error using AI API: Status 401 - token expired"
+    return f"Tab Ecosprin 75 ({client.token})"
+
+class TestPuterSession(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.image = os.path.join(self.tmp.name, "rx.png")
+        with open(self.image, 'wb') as f:
+            f.write(b"img")
+        FakePuterClient.logins = 0
+        patches = [mock.patch.object(puter_client.putergenai, 'PuterClient', FakePuterClient),
+                   mock.patch.object(puter_client, 'ocr_with_client', fake_ocr)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_login_is_reused_and_refreshed_on_expiry(self):
+        session = PuterSession("user", "pass")
+        self.addCleanup(session.close)
+        texts = [session.ocr(self.image) for _ in range(3)]
+
+        self.assertEqual(texts, ["Tab Ecosprin 75 (token-2)"] * 3)
+        self.assertEqual(session.stats()['logins'], 2)  # first login + one refresh
+        self.assertEqual(session.stats()['refreshes'], 1)
+
+    def test_failed_warm_up_login_is_logged(self):
+        async def refuse(client, username, password):
+            raise RuntimeError("bad credentials")
+        session = PuterSession("user", "pass")
+        self.addCleanup(session.close)
+        with mock.patch.object(FakePuterClient, 'login', refuse), \
+             self.assertLogs('core.puter_client', level='WARNING') as logs:
+            session.warm()
+            for _ in range(50):
+                if logs.records: break
+                time.sleep(0.01)
+        self.assertIn("bad credentials", logs.output[0])
+
+    def test_perform_ocr_puter_uses_shared_session(self):
+        session = PuterSession("user", "pass", token="token-5")
+        self.addCleanup(session.close)
+        with mock.patch.object(puter_client, 'puter_session', session), \
+             mock.patch.object(puter_client.limiter, 'enabled', False), \
+             mock.patch.dict(os.environ, {'PUTER_USERNAME': 'user', 'PUTER_PASSWORD': 'pass'}):
+            texts = [puter_client.perform_ocr_puter(self.image) for _ in range(2)]
+
+        self.assertEqual(texts, ["Tab Ecosprin 75 (token-5)"] * 2)
+        self.assertEqual(FakePuterClient.logins, 0)  # cached token, no login
+
+if __name__ == '__main__':
+    unittest.main()
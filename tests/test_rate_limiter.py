@@ -0,0 +1,61 @@
+import unittest
+import os
+import sys
+import time
+import threading
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.rate_limiter import RateLimiter, RateLimited, INTERACTIVE, BATCH, _parse_limits
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_and_tokens_per_minute(self):
+        limiter = RateLimiter(limits={'m': (6000, 120)}, enabled=True)  # 100 requests/s, 2 tokens/s
+        for _ in range(2):
+            self.assertLess(limiter.acquire('m', tokens=60), 0.01)  # the burst fits the full buckets
+        start = time.time()
+        limiter.acquire('m', tokens=2)
+        self.assertGreaterEqual(time.time() - start, 0.9)  # token bucket refill (2 tokens at 2/s)
+
+        with self.assertRaises(RateLimited):
+            limiter.acquire('m', tokens=100, max_wait=0.5)
+        self.assertEqual(limiter.stats()['m']['rejected'], 1)
+
+    def test_interactive_calls_jump_ahead_of_batch(self):
+        limiter = RateLimiter(limits={'m': (120, 1e9)}, enabled=True)  # 2 requests/s
+        limiter.acquire('m')
+        limiter.penalize('m')
+        order = []
+
+        def worker(name, priority):
+            limiter.acquire('m', priority=priority, max_wait=10)
+            order.append(name)
+
+        threads = [threading.Thread(target=worker, args=(f"batch{i}", BATCH)) for i in range(2)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        self.assertGreater(limiter.backpressure(), 0.5)
+        interactive = threading.Thread(target=worker, args=("ui", INTERACTIVE))
+        interactive.start()
+        for t in threads + [interactive]:
+            t.join()
+        self.assertEqual(order[0], "ui")
+
+    def test_failed_calls_refund_tokens_and_unlisted_models_are_free(self):
+        limiter = RateLimiter(limits={'m': (6000, 120)}, default="", enabled=True)  # 2 tokens/s
+        limiter.acquire('m', tokens=120)
+        limiter.settle('m', 120, 0)  # the call failed
+        self.assertLess(limiter.acquire('m', tokens=120), 0.01)
+
+        for _ in range(100):
+            self.assertEqual(limiter.acquire('other', tokens=10 ** 9), 0.0)
+        self.assertNotIn('other', limiter.stats())
+        self.assertIn('gemini-2.5-flash', RateLimiter(limits=_parse_limits("free")).describe())
+        unconfigured = RateLimiter(limits={}, default="", enabled=True)
+        self.assertFalse(unconfigured.active)
+        self.assertIn("inactive", unconfigured.format_stats())
+
+if __name__ == '__main__':
+    unittest.main()
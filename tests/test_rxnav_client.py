@@ -0,0 +1,88 @@
+import unittest
+import os
+import sys
+import time
+from unittest import mock
+
+import requests
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.rxnav_client import RxNavClient, CircuitBreaker, CircuitOpenError, DeadlineExceeded, RxNavError, deadline
+
+def make_response(status, data=None):
+    response = mock.Mock()
+    response.status_code = status
+    response.json.return_value = data or {}
+    return response
+
+class TestRxNavClient(unittest.TestCase):
+    def make_client(self, **kwargs):
+        kwargs.setdefault('breaker', CircuitBreaker(failure_threshold=3, reset_timeout=60))
+        c = RxNavClient(base_url="http://rxnav.test/REST", timeout=1, retries=2, backoff=0, **kwargs)
+        c.session = mock.Mock()
+        return c
+
+    def test_retries_then_succeeds(self):
+        c = self.make_client()
+        c.session.get.side_effect = [make_response(503), make_response(200, {'ok': 1})]
+        self.assertEqual(c.get_json("rxcui.json", {'name': 'aspirin'}), {'ok': 1})
+        self.assertEqual(c.metrics()['retries'], 1)
+        self.assertEqual(c.metrics()['breaker_state'], CircuitBreaker.CLOSED)
+
+    def test_client_error_is_not_retried(self):
+        c = self.make_client()
+        c.session.get.return_value = make_response(400)
+        with self.assertRaises(RxNavError):
+            c.get_json("rxcui.json", {'name': 'aspirin'})
+        self.assertEqual(c.session.get.call_count, 1)
+
+    def test_client_error_on_half_open_trial_closes_breaker(self):
+        c = self.make_client(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+        c.session.get.side_effect = requests.ConnectionError("down")
+        with self.assertRaises(RxNavError):
+            c.get_json("rxcui.json", {'name': 'aspirin'})
+        self.assertEqual(c.metrics()['breaker_state'], CircuitBreaker.OPEN)
+
+        time.sleep(0.06)
+        c.session.get.side_effect = None
+        c.session.get.return_value = make_response(404)
+        with self.assertRaises(RxNavError):
+            c.get_json("rxcui.json", {'name': 'notadrug'})
+        # The service answered, so the trial call closes the breaker
+        self.assertEqual(c.metrics()['breaker_state'], CircuitBreaker.CLOSED)
+
+    def test_breaker_opens_and_serves_stale(self):
+        c = self.make_client()
+        c.session.get.return_value = make_response(200, {'cached': True})
+        c.get_json("rxcui.json", {'name': 'aspirin'})
+
+        c.session.get.side_effect = requests.ConnectionError("down")
+        # Retries exhausted -> stale response
+        self.assertEqual(c.get_json("rxcui.json", {'name': 'aspirin'}), {'cached': True})
+        self.assertEqual(c.metrics()['breaker_state'], CircuitBreaker.OPEN)
+
+        # Breaker open -> no network call at all
+        calls = c.session.get.call_count
+        self.assertEqual(c.get_json("rxcui.json", {'name': 'aspirin'}), {'cached': True})
+        with self.assertRaises(CircuitOpenError):
+            c.get_json("rxcui.json", {'name': 'warfarin'})
+        self.assertEqual(c.session.get.call_count, calls)
+        self.assertEqual(c.metrics()['short_circuits'], 2)
+
+        # A new endpoint starts with a closed breaker and fresh metrics
+        c.set_base_url("http://127.0.0.1:8765/REST")
+        self.assertEqual(c.metrics()['breaker_state'], CircuitBreaker.CLOSED)
+        self.assertEqual(c.metrics()['short_circuits'], 0)
+
+    def test_deadline_exceeded(self):
+        c = self.make_client()
+        with deadline(0.01):
+            time.sleep(0.02)
+            with self.assertRaises(DeadlineExceeded):
+                c.get_json("rxcui.json", {'name': 'aspirin'})
+        c.session.get.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import drug_client
+from core.ddi_cache import ddi_cache
+from core.rxnav_client import client as rxnav, RxNavClient, CircuitBreaker, RxNavError
+from tools.rxnav_stub_server import start_server
+
+def setUpModule():
+    # Keep the persistent DDI cache out of the tests
+    ddi_cache.enabled = False
+
+def tearDownModule():
+    ddi_cache.enabled = True
+
+class TestRxNavStandIn(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = start_server()
+        cls.original_base_url = rxnav.base_url
+        rxnav.set_base_url(cls.server.url)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        rxnav.set_base_url(cls.original_base_url)
+        drug_client.clear_caches()
+
+    def setUp(self):
+        drug_client.clear_caches()
+
+    def test_check_interactions_against_stub(self):
+        result = drug_client.check_interactions(["Warfarin", "Aspirin", "Metformin"])
+        self.assertEqual(result.rxcuis, ['11289', '1191', '6809'])
+        self.assertEqual(len(result.interactions), 1)
+        self.assertEqual(result.interactions[0].severity, 'high')
+        self.assertIn("[SEVERITY: high]", result.to_text())
+
+    def test_unknown_drug(self):
+        self.assertIsNone(drug_client.get_rxcui("notarealdrug"))
+
+    def test_error_injection(self):
+        server = start_server(error_rate=1.0)
+        try:
+            c = RxNavClient(base_url=server.url, retries=1, backoff=0, breaker=CircuitBreaker(failure_threshold=2))
+            with self.assertRaises(RxNavError):
+                c.get_json("rxcui.json", {'name': 'aspirin'})
+            self.assertEqual(c.metrics()['breaker_state'], CircuitBreaker.OPEN)
+            self.assertEqual(server.stats()['injected_errors'], 2)
+        finally:
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import os
+import sys
+import tempfile
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.rxnorm_index import RxNormIndex
+
+# RXCUI|LAT|TS|LUI|STT|SUI|ISPREF|RXAUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|STR|SRL|SUPPRESS|CVF|
+SAMPLE_RRF = """1191|ENG||||||1||||RXNORM|IN|1191|aspirin||N|4096|
+11289|ENG||||||2||||RXNORM|IN|11289|warfarin||N|4096|
+202433|ENG||||||3||||RXNORM|BN|202433|Tylenol||N|4096|
+161|ENG||||||4||||RXNORM|IN|161|acetaminophen||N|4096|
+308416|ENG||||||5||||RXNORM|SCD|308416|Aspirin 81 MG Oral Tablet||N|4096|
+999|ENG||||||6||||RXNORM|IN|999|obsoletedrug||O|4096|
+888|SPA||||||7||||RXNORM|IN|888|aspirina||N|4096|
+777|ENG||||||8||||MTHSPL|SU|777|aspirin||N|4096|
+"""
+
+class TestRxNormIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rrf = os.path.join(self.tmp.name, "RXNCONSO.RRF")
+        with open(rrf, 'w', encoding='utf-8') as f:
+            f.write(SAMPLE_RRF)
+        self.index = RxNormIndex(os.path.join(self.tmp.name, "rxnorm.db"))
+        self.count = self.index.import_rrf(rrf)
+
+    def tearDown(self):
+        self.index.close()
+        self.tmp.cleanup()
+
+    def test_import_filters_rows(self):
+        # obsolete, non-English and non-RXNORM rows are skipped
+        self.assertEqual(self.count, 5)
+
+    def test_exact_lookup(self):
+        self.assertEqual(self.index.lookup("Aspirin"), "1191")
+        self.assertEqual(self.index.lookup("  TYLENOL "), "202433")
+        self.assertEqual(self.index.lookup("aspirin 81 mg oral tablet"), "308416")
+
+    def test_approximate_lookup(self):
+        self.assertEqual(self.index.lookup("warfrin"), "11289")
+        self.assertEqual(self.index.lookup("acetaminophin"), "161")
+        self.assertIsNone(self.index.lookup("warfrin", approximate=False))
+
+    def test_missing(self):
+        self.assertIsNone(self.index.lookup("obsoletedrug"))
+        self.assertIsNone(self.index.lookup("metformin"))
+        self.assertFalse(RxNormIndex(os.path.join(self.tmp.name, "missing.db")).available)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest import mock
+
+# Add project root to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core import tracing
+from core import database
+
+class TestTracing(unittest.TestCase):
+    def test_llm_calls_attach_to_active_span(self):
+        trace = tracing.Trace()
+        tracing.record_llm_call('m', "ignored", "outside any span")
+        with trace.span('analysis'):
+            tracing.record_llm_call('gemini-2.5-flash', "p" * 40, "r" * 10, {'prompt_tokens': 12, 'output_tokens': 3})
+            tracing.record_llm_call('gemini-2.5-flash', "p" * 40, "r" * 10, cached=True)
+        with self.assertRaises(RuntimeError):
+            with trace.span('graph_data'):
+                raise RuntimeError("boom")
+
+        analysis, graph = trace.to_list()
+        self.assertEqual((analysis['llm_calls'], analysis['cache_hits']), (2, 1))
+        self.assertEqual((analysis['prompt_chars'], analysis['prompt_tokens']), (80, 12))
+        self.assertEqual(analysis['model'], 'gemini-2.5-flash')
+        self.assertEqual(graph['error'], "boom")
+        self.assertIsNone(tracing.current_span())
+
+    def test_spans_are_stored_and_summarized(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+             mock.patch.object(database, 'DB_NAME', os.path.join(tmp, "test.db")):
+            database.init_db()
+            for i, duration in enumerate([1.0, 3.0]):
+                analysis_id = database.save_analysis("tester", "rx.jpg", "report")
+                database.save_analysis_spans(analysis_id, [
+                    {'name': 'ocr', 'offset': 0, 'duration': duration},
+                    {'name': 'analysis', 'offset': duration, 'duration': 5.0, 'model': 'gemini-2.5-flash',
+                     'prompt_tokens': 100, 'output_tokens': 50, 'llm_calls': 1, 'cache_hits': i},
+                ])
+            self.assertEqual(len(database.get_analysis_spans(analysis_id)), 2)
+            summary = {s['stage']: s for s in database.get_stage_summary()}
+            text = database.format_stage_summary()
+
+        self.assertEqual(summary['ocr']['count'], 2)
+        self.assertAlmostEqual(summary['ocr']['avg'], 2.0)
+        self.assertEqual(summary['analysis']['prompt_tokens'], 200)
+        self.assertEqual(summary['analysis']['cache_hit_rate'], 0.5)
+        self.assertTrue(text.splitlines()[1].startswith("analysis"))
+
+if __name__ == '__main__':
+    unittest.main()
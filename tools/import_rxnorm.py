@@ -0,0 +1,37 @@
+"""
+Imports an RxNorm concept file (RXNCONSO.RRF from the RxNorm full/prescribe release)
+into the local name -> RxCUI index used by core.drug_client.get_rxcui.
+
+Usage:
+    python tools/import_rxnorm.py path/to/RXNCONSO.RRF
+    python tools/import_rxnorm.py RXNCONSO.RRF --db rxnorm_index.db --tty IN,PIN,MIN,BN --all-sources
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.rxnorm_index import RxNormIndex, RXNORM_DB, DEFAULT_TTYS
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import RXNCONSO.RRF into the local RxNorm index")
+    parser.add_argument('rrf_path')
+    parser.add_argument('--db', default=RXNORM_DB, help=f"Index database file (default: {RXNORM_DB})")
+    parser.add_argument('--tty', default=",".join(DEFAULT_TTYS), help="Comma-separated term types to keep")
+    parser.add_argument('--all-sources', action='store_true', help="Keep all SABs, not only RXNORM")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.rrf_path):
+        print(f"File not found: {args.rrf_path}")
+        sys.exit(1)
+
+    index = RxNormIndex(args.db)
+    t0 = time.time()
+    count = index.import_rrf(
+        args.rrf_path,
+        ttys=[t.strip() for t in args.tty.split(',') if t.strip()],
+        sources=None if args.all_sources else ('RXNORM',)
+    )
+    print(f"Imported {count} concepts into {args.db} in {time.time() - t0:.1f}s")
@@ -0,0 +1,236 @@
+"""
+Local stand-in for the NLM RxNav REST API, for offline benchmarking and load tests.
+
+Replays recorded rxcui.json / interaction/list.json data from
+tools/fixtures/rxnav_fixtures.json with configurable latency and error injection.
+
+Usage:
+    python tools/rxnav_stub_server.py --port 8765 --latency-ms 50 --error-rate 0.05
+    set RXNAV_BASE_URL=http://127.0.0.1:8765/REST   (then run the app / benchmark)
+
+    # Record: proxy to the real RxNav and add what was seen to the fixture file
+    python tools/rxnav_stub_server.py --record
+"""
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from itertools import combinations
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+FIXTURES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "rxnav_fixtures.json")
+REAL_RXNAV = "https://rxnav.nlm.nih.gov/REST"
+
+class RxNavFixtures:
+    """
+    Condensed recording of RxNav answers: name -> RxCUI, RxCUI -> name, and interaction pairs.
+    """
+    def __init__(self, path=FIXTURES_PATH):
+        self.path = path
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.comment = data.get('_comment', '')
+        self.rxcui = {k.lower(): v for k, v in data.get('rxcui', {}).items()}
+        self.names = dict(data.get('names', {}))
+        self.pairs = {}
+        for item in data.get('interactions', []):
+            self.pairs[frozenset(item['rxcuis'])] = item
+        self._lock = threading.Lock()
+
+    def rxcui_response(self, name):
+        group = {'name': name}
+        cui = self.rxcui.get(name.strip().lower())
+        if cui:
+            group['rxnormId'] = [cui]
+        return {'idGroup': group}
+
+    def interaction_response(self, cuis):
+        response = {'nlmDisclaimer': 'Local RxNav stand-in (recorded data).', 'userInput': {'rxcuis': cuis}}
+        pairs = []
+        for a, b in combinations(dict.fromkeys(cuis), 2):
+            item = self.pairs.get(frozenset((a, b)))
+            if not item:
+                continue
+            c1, c2 = item['rxcuis']
+            pairs.append({
+                'interactionConcept': [
+                    {'minConceptItem': {'rxcui': c1, 'name': self.names.get(c1, c1), 'tty': 'IN'}},
+                    {'minConceptItem': {'rxcui': c2, 'name': self.names.get(c2, c2), 'tty': 'IN'}},
+                ],
+                'severity': item.get('severity', 'N/A'),
+                'description': item.get('description', '')
+            })
+        if pairs:
+            response['fullInteractionTypeGroup'] = [{
+                'sourceName': 'DrugBank',
+                'fullInteractionType': [{'interactionPair': [p]} for p in pairs]
+            }]
+        return response
+
+    def record_rxcui(self, name, data):
+        ids = data.get('idGroup', {}).get('rxnormId')
+        if ids:
+            with self._lock:
+                self.rxcui[name.strip().lower()] = ids[0]
+                self.names.setdefault(ids[0], name.strip().lower())
+
+    def record_interactions(self, data):
+        with self._lock:
+            for group in data.get('fullInteractionTypeGroup', []):
+                for itype in group.get('fullInteractionType', []):
+                    for pair in itype.get('interactionPair', []):
+                        concepts = [c.get('minConceptItem', {}) for c in pair.get('interactionConcept', [])]
+                        if len(concepts) < 2:
+                            continue
+                        cuis = [concepts[0].get('rxcui'), concepts[1].get('rxcui')]
+                        for c in concepts:
+                            self.names.setdefault(c.get('rxcui'), c.get('name'))
+                        self.pairs[frozenset(cuis)] = {
+                            'rxcuis': cuis,
+                            'severity': pair.get('severity', 'N/A'),
+                            'description': pair.get('description', ''),
+                            'source': group.get('sourceName', 'DrugBank')
+                        }
+
+    def save(self, path=None):
+        with self._lock:
+            data = {
+                '_comment': self.comment,
+                'rxcui': dict(sorted(self.rxcui.items())),
+                'names': self.names,
+                'interactions': list(self.pairs.values())
+            }
+        with open(path or self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "RxNavStub/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        srv = self.server
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        path = parsed.path
+
+        if path == '/_stub/stats':
+            return self._send(200, srv.stats())
+
+        srv.count('requests')
+        # Latency injection
+        delay = srv.latency + random.uniform(0, srv.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        # Error injection
+        if srv.error_rate and random.random() < srv.error_rate:
+            srv.count('injected_errors')
+            return self._send(srv.error_status, {'error': 'injected failure'})
+
+        if path.endswith('/rxcui.json'):
+            srv.count('rxcui')
+            name = query.get('name', '')
+            if srv.record:
+                data = requests.get(f"{REAL_RXNAV}/rxcui.json", params=query, timeout=10).json()
+                srv.fixtures.record_rxcui(name, data)
+                return self._send(200, data)
+            return self._send(200, srv.fixtures.rxcui_response(name))
+
+        if path.endswith('/interaction/list.json'):
+            srv.count('interactions')
+            cuis = query.get('rxcuis', '').replace('+', ' ').split()
+            if srv.record:
+                data = requests.get(f"{REAL_RXNAV}/interaction/list.json", params=query, timeout=10).json()
+                srv.fixtures.record_interactions(data)
+                return self._send(200, data)
+            return self._send(200, srv.fixtures.interaction_response(cuis))
+
+        return self._send(404, {'error': f'unknown path {path}'})
+
+class RxNavStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, fixtures=None, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, error_status=503, record=False, verbose=False):
+        ThreadingHTTPServer.__init__(self, (host, port), _Handler)
+        self.fixtures = fixtures or RxNavFixtures()
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.record = record
+        self.verbose = verbose
+        self._counts = {'requests': 0, 'rxcui': 0, 'interactions': 0, 'injected_errors': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/REST"
+
+    def count(self, key):
+        with self._lock:
+            self._counts[key] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def start(self):
+        """Serves in a daemon thread and returns self (use .url to point the client at it)."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.record:
+            self.fixtures.save()
+
+def start_server(port=0, **kwargs):
+    """Starts a stand-in server in the background (port 0 = any free port)."""
+    return RxNavStubServer(port=port, **kwargs).start()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local RxNav stand-in server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=FIXTURES_PATH)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--record', action='store_true', help="Proxy to real RxNav and save responses to the fixtures")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = RxNavStubServer(args.host, args.port, RxNavFixtures(args.fixtures), args.latency_ms, args.jitter_ms,
+                             args.error_rate, args.error_status, args.record, args.verbose)
+    print(f"RxNav stand-in listening on {server.url}")
+    print(f"Point the app at it with: RXNAV_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.record:
+            server.fixtures.save()
+            print(f"Saved recorded responses to {args.fixtures}")
@@ -0,0 +1,32 @@
+"""
+Pre-warms the persistent DDI cache (ddi_cache.db) with resolutions, RxCUIs and all
+pairwise interactions for the most common generics, so first analyses are not cold.
+
+Usage:
+    python tools/warm_cache.py
+    python tools/warm_cache.py --top 500 --workers 8
+    python tools/warm_cache.py --drugs "warfarin,aspirin,metformin"
+"""
+import os
+import sys
+import argparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.ddi_cache import ddi_cache
+from core.cache_warmup import warm_up
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-warm the persistent DDI cache")
+    parser.add_argument('--top', type=int, default=200, help="Number of common generics to warm (default: 200)")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--drugs', default=None, help="Comma-separated names to warm instead of the top-N list")
+    parser.add_argument('--clear', action='store_true', help="Empty the cache before warming")
+    args = parser.parse_args()
+
+    if args.clear:
+        ddi_cache.clear()
+    names = [d.strip() for d in args.drugs.split(',') if d.strip()] if args.drugs else None
+    stats = warm_up(n=args.top, max_workers=args.workers, names=names)
+    print(f"Warm-up done: {stats}")
+    print(f"Cache contents: {ddi_cache.stats()}")
@@ -552,6 +552,15 @@ class DashboardScreen(Screen):
             return
         
         image_path = selection[0]
+        # Shrink the photo for OCR in the background while the patient form is filled in
+        from core.image_preprocess import preprocessor
+        preprocessor.submit(image_path)
+        # Perceptual hash for the near-duplicate lookup once the patient details are known
+        from core.image_hash import hasher
+        hasher.submit(image_path)
+        # Log in to Puter now so the OCR call does not wait for it
+        from core.puter_client import puter_session
+        puter_session.warm()
         self.show_patient_form(image_path)
         
     def show_patient_form(self, image_path):
@@ -767,6 +776,8 @@ class ResultsScreen(Screen):
         text = app.recent_text
         image_path = getattr(app, 'recent_image', None)
         graph_path = getattr(app, 'recent_graph_path', None)
+        ddi_result = getattr(app, 'recent_ddi', None)
+        analysis = getattr(app, 'recent_analysis', None)
         
         # Ensure reports directory exists
         reports_dir = os.path.join(os.getcwd(), 'reports')
@@ -789,7 +800,7 @@ class ResultsScreen(Screen):
                 filetypes=[("Markdown files", "*.md"), ("All files", "*.*")]
             )
             if file_path:
-                success = create_markdown(text, image_path, file_path, graph_path)
+                success = create_markdown(text, image_path, file_path, graph_path, ddi_result, analysis)
                 msg = f"Exported to {os.path.basename(file_path)}" if success else "Export failed"
             else:
                 return # User cancelled
@@ -802,7 +813,7 @@ class ResultsScreen(Screen):
                 filetypes=[("Word Documents", "*.docx"), ("All files", "*.*")]
             )
             if file_path:
-                success = create_word(text, image_path, file_path, graph_path)
+                success = create_word(text, image_path, file_path, graph_path, ddi_result, analysis)
                 msg = f"Exported to {os.path.basename(file_path)}" if success else "Export failed"
             else:
                 return # User cancelled
@@ -815,7 +826,7 @@ class ResultsScreen(Screen):
                 filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
             )
             if file_path:
-                success = create_pdf(text, image_path, file_path, graph_path)
+                success = create_pdf(text, image_path, file_path, graph_path, ddi_result, analysis)
                 msg = f"Exported to {os.path.basename(file_path)}" if success else "Export failed"
             else:
                 return # User cancelled
@@ -830,7 +841,7 @@ class ResultsScreen(Screen):
         popup.open()
 
     @mainthread
-    def update_ui(self, final_text, image_path, drugs_found):
+    def update_ui(self, final_text, image_path, drugs_found, ddi_result=None, graph_data=None):
         self.ids.results_label.text = final_text
         
         # Update App State
@@ -839,7 +850,7 @@ class ResultsScreen(Screen):
              app.recent_drugs = drugs_found
              # Trigger Graph Generation on Main Thread (safe for UI)
              # Pass the full analysis text for better context extraction
-             graph_path = app.generate_knowledge_graph(context_text=final_text)
+             graph_path = app.generate_knowledge_graph(context_text=final_text, ddi_result=ddi_result, graph_data=graph_data)
              if graph_path:
                  app.recent_graph_path = graph_path # Store for export
         
@@ -847,18 +858,69 @@ class ResultsScreen(Screen):
             self.ids.result_image.source = image_path
             self.ids.result_image.reload()
 
+    PROGRESS_HEADERS = {
+        'ocr': "Text extracted. Correcting OCR text...",
+        'enhance': "Text corrected. Analyzing prescription...",
+        'analysis': "Analyzing prescription (live)...",
+    }
+
+    @mainthread
+    def show_progress(self, stage, text):
+        """Shows intermediate pipeline output until update_ui() sets the final report."""
+        if getattr(self, '_analysis_done', False):
+            return
+        header = self.PROGRESS_HEADERS.get(stage, "Processing...")
+        self.ids.results_label.text = f"{header}\n\n{text}"
+
     def process_image(self, image_path, patient_details=None):
         self.ids.results_label.text = "Processing image... Please wait."
         self.ids.result_image.source = '' 
+        self._analysis_done = False
+        
+        # Cleared until the new analysis stores its structured DDI result
+        App.get_running_app().recent_ddi = None
+        App.get_running_app().recent_analysis = None
         
         def _process():
-            # Combined Analysis (OCR + DDI)
-            from core.gemini_client import analyze_prescription
-            # Unpack tuple: (Text, DrugList)
-            final_text, drugs_found = analyze_prescription(image_path, patient_details)
+            # Combined Analysis (OCR + DDI); graph data is extracted in the same run
+            from core.gemini_client import run_analysis_pipeline
+            from core.image_hash import hasher, same_content
+            from core.database import find_similar_analysis, save_image_hash
+
+            image_hash = match = None
+
+            def reuse_stored(ocr_text):
+                # Same letterhead is not the same prescription: the OCR text must match as well
+                if not same_content(match['result'].get('ocr_text'), ocr_text):
+                    print(f"Image resembles analysis #{match['analysis_id']} but the text differs, analyzing")
+                    return None
+                print(f"Image and text match analysis #{match['analysis_id']}, reusing it")
+                from core.analysis_results import PrescriptionAnalysis
+                stored = match['result'].get('analysis')
+                analysis = PrescriptionAnalysis.from_dict(stored, stored.get('model')) if stored else None
+                note = (f"(Reused stored analysis #{match['analysis_id']} from {match['timestamp']}: "
+                        f"same prescription image and text)\n\n")
+                return {'text': note + match['result_text'], 'drugs': match['result'].get('drugs', []),
+                        'analysis': analysis, 'graph_data': analysis.graph if analysis else None,
+                        'reused_from': match['analysis_id']}
+
+            try:
+                # Possible re-upload of an already analyzed photo for the same patient
+                image_hash = hasher.get(image_path)
+                match = find_similar_analysis(image_hash, patient_details) if image_hash is not None else None
+                result = run_analysis_pipeline(image_path, patient_details, on_progress=self.show_progress,
+                                               mode=App.get_running_app().analysis_mode,
+                                               reuse=reuse_stored if match else None)
+            except Exception as e:
+                print(f"Analysis failed: {e}")
+                result = {'text': f"Error during analysis: {str(e)}", 'drugs': [], 'analysis': None,
+                          'graph_data': None}
+            final_text, drugs_found = result['text'], result['drugs']
+            self._analysis_done = True
             
             # Update UI on main thread
-            self.update_ui(final_text, image_path if "Error" not in final_text else None, drugs_found)
+            self.update_ui(final_text, image_path if "Error" not in final_text else None, drugs_found,
+                           ddi_result=result.get('ddi_result'), graph_data=result['graph_data'])
             
             # Save to App state and DB
             if "Error" not in final_text:
@@ -866,11 +928,21 @@ class ResultsScreen(Screen):
                 app = App.get_running_app()
                 app.recent_image = image_path
                 app.recent_text = final_text
+                app.recent_analysis = result['analysis']
+                app.recent_ddi = result.get('ddi_result')  # None when no DDI check ran
                 # recent_drugs set in update_ui
                 
                 # Save to DB
                 if hasattr(app, 'username'):
                     self.current_analysis_id = save_analysis(app.username, image_path, final_text)
+                    if self.current_analysis_id:
+                        from core.database import save_analysis_spans
+                        save_analysis_spans(self.current_analysis_id, result.get('spans'))
+                        if image_hash is not None and not result.get('reused_from'):
+                            analysis = result['analysis']
+                            save_image_hash(self.current_analysis_id, image_hash, patient_details, {
+                                'drugs': drugs_found, 'analysis': analysis.to_dict() if analysis else None,
+                                'ocr_text': result.get('ocr_text')})
 
         threading.Thread(target=_process).start()
 
@@ -1051,6 +1123,15 @@ class PharmacyLocatorScreen(Screen):
             self.map_view.zoom -= 1
 
 class BenchmarkScreen(Screen):
+    def on_enter(self):
+        # Where recent analyses spent their time (stored per analysis by the pipeline)
+        from core.database import format_stage_summary
+        log = self.ids.benchmark_log.text
+        # Don't replace a finished benchmark report
+        if log.startswith('Press "Run Benchmark"') or log.startswith("--- Pipeline Stage Timings"):
+            self.ids.benchmark_log.text = (f"--- Pipeline Stage Timings (last 50 analyses) ---\n{format_stage_summary()}"
+                                           f"\n\nPress \"Run Benchmark\" to start...")
+
     def run_tests(self):
         self.ids.benchmark_log.text = "Running benchmark... Please wait."
         threading.Thread(target=self._run_task).start()
@@ -1250,25 +1331,42 @@ class ManualEntryScreen(Screen):
         
         def run_analysis():
             from core.gemini_client import analyze_text
-            from core.drug_client import check_interactions_for_list, extract_potential_drugs
+            from core.drug_client import extract_potential_drugs
+            from core.ddi_session import DDISession
             from core.local_data import db
             from core.database import save_analysis # Import save function
+            from core import fast_path
             
             try:
+                # Fast path: typed text whose drugs all resolve locally needs no Gemini call
+                assessment = fast_path.assess(text_content)
+                local_only = fast_path.use_fast_path(assessment, App.get_running_app().analysis_mode)
+
                 # 1. Gemini Analysis
                 # Pass raw text and patient_details dict directly to analyze_text
-                analysis_result = analyze_text(text_content, patient_details)
+                analysis_result = None if local_only else analyze_text(text_content, patient_details)
                 
                 # 2. Local DDI Check (Optional but good)
-                extracted_drugs = extract_potential_drugs(text_content)
-                resolved_drugs = []
-                for d in extracted_drugs:
-                    res, conf = db.resolve_drug_name(d)
-                    if conf > 80: resolved_drugs.append(res)
+                if local_only:
+                    resolved_drugs = assessment.generics
+                else:
+                    extracted_drugs = extract_potential_drugs(text_content)
+                    resolved_drugs = []
+                    for d in extracted_drugs:
+                        res, conf = db.resolve_drug_name(d)
+                        if conf > 80: resolved_drugs.append(res)
                 
                 ddi_report = ""
+                ddi_result = None
                 if resolved_drugs:
-                    ddi_report = check_interactions_for_list(resolved_drugs)
+                    # Incremental: re-running after fixing one drug only resolves that drug
+                    # and checks its new pairs. The structured result is reused by the
+                    # graph and exporters without re-parsing.
+                    if not hasattr(self, 'ddi_session'):
+                        self.ddi_session = DDISession()
+                    self.ddi_session.set_drugs(resolved_drugs)
+                    ddi_result = self.ddi_session.result()
+                    ddi_report = ddi_result.to_text()
                     
                     # Fetch Local Details for each resolved generic
                     for gen_drug in resolved_drugs:
@@ -1281,7 +1379,10 @@ class ManualEntryScreen(Screen):
 
                 # Need helper to clean markdown
                 from core.gemini_client import clean_markdown_to_text
-                analysis_result_clean = clean_markdown_to_text(analysis_result)
+                if local_only:
+                    analysis_result_clean = fast_path.build_analysis_text(assessment, ddi_result, patient_details)
+                else:
+                    analysis_result_clean = clean_markdown_to_text(analysis_result)
 
                 # Format the output to match image analysis structure
                 final_output = f"""Prescription_OCR_Results : 
@@ -1299,8 +1400,16 @@ Analysis of the prescription image:
 Prescription Preview from searching the datasets(datasets from this project directory) and matching the prescription image and say whether they're safe or not:
 {ddi_report if ddi_report else "No local data found matching the identified drugs."}
 ================================================================================================
-(Powered by AI Analysis)"""
+{"(Local fast path - no LLM review ran)" if local_only else "(Powered by AI Analysis)"}"""
                 
+                # The local fast path builds the graph from the interactions alone; otherwise
+                # Gemini extracts it from the text (diagnosis, Treats/Protective edges) and
+                # the interactions are merged in as Risk edges
+                graph = None
+                if local_only and ddi_result is not None and ddi_result.found_drugs:
+                    from core.analysis_results import GraphData
+                    graph = GraphData.from_dict(ddi_result.to_graph_data(patient_details.get('name') or 'Patient'))
+
                 @mainthread
                 def update_ui(result):
                     # For manual entry, maybe we should navigate to ResultsScreen to show full markdown?
@@ -1310,8 +1419,10 @@ Prescription Preview from searching the datasets(datasets from this project dire
                     app = App.get_running_app()
                     app.recent_text = result
                     app.recent_image = "Manual Entry"
-                    # Update recent_drugs for Graph
+                    # Update recent_drugs / structured DDI for Graph and Export
                     app.recent_drugs = resolved_drugs
+                    app.recent_ddi = ddi_result
+                    app.recent_analysis = None
                     
                     # Save to History
                     if hasattr(app, 'username'):
@@ -1320,7 +1431,7 @@ Prescription Preview from searching the datasets(datasets from this project dire
                     # Store data in ResultsScreen and switch
                     results_screen = self.manager.get_screen('results')
                     results_screen.ids.result_image.source = '' # No image
-                    results_screen.update_ui(result, None, resolved_drugs)
+                    results_screen.update_ui(result, None, resolved_drugs, ddi_result, graph_data=graph)
                     self.manager.current = 'results'
                     self.ids.results_label.text = "" # Reset
                     